@@ -7,7 +7,8 @@ from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
 from acctmarket.applications.blog.forms import (Banner, BannerForm,
                                                 BlogCategory, BlogCategoryForm,
                                                 Post, PostForm)
-from acctmarket.utils.mixins import ContentManagerRequiredMixin
+from acctmarket.utils.mixins import (ContentManagerRequiredMixin,
+                                     CursorPaginationMixin)
 
 # Create your views here.
 
@@ -103,14 +104,14 @@ class BlogDeleteView(ContentManagerRequiredMixin, SlugMixin, DeleteView):
     success_url = reverse_lazy("blog:blog_list")
 
 
-class BlogViews(ListView):
+class BlogViews(CursorPaginationMixin, ListView):
     model = Post
     template_name = "pages/blog/blog_views.html"
     context_object_name = "blog_posts"
     paginate_by = 5
 
     def get_queryset(self):
-        return Post.objects.all().order_by("-created_at")
+        return Post.objects.all()
 
 
 class BlogDetailView(DetailView):
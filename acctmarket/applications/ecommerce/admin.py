@@ -2,10 +2,13 @@ from django.contrib import admin
 
 from acctmarket.applications.ecommerce.models import (Address, CartOrder,
                                                       CartOrderItems, Category,
-                                                      Coupon, Payment, Product,
+                                                      Coupon,
+                                                      FulfilmentNotification,
+                                                      Payment, Product,
                                                       ProductImages,
                                                       ProductKey,
-                                                      ProductReview, WishList)
+                                                      ProductReview,
+                                                      WebhookEvent, WishList)
 
 
 class ProductImagesAdmin(admin.TabularInline):
@@ -107,3 +110,22 @@ class CouponAdmin(admin.ModelAdmin):
         "code", "discount_type",
 
     ]
+
+
+@admin.register(FulfilmentNotification)
+class FulfilmentNotificationAdmin(admin.ModelAdmin):
+    list_display = [
+        "order", "kind", "user_notified_at", "admin_notified_at",
+        "created_at",
+    ]
+    list_filter = ["kind"]
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = [
+        "provider", "event_id", "status", "attempts", "processed_at",
+        "created_at",
+    ]
+    list_filter = ["provider", "status"]
+    search_fields = ["event_id"]
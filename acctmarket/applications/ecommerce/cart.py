@@ -0,0 +1,219 @@
+from decimal import Decimal
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from acctmarket.applications.ecommerce.models import Product
+
+# The session only holds the id of the visitor's cart; the cart itself
+# lives in the cache, so changing it never rewrites the session.
+CART_SESSION_KEY = "cart_id"
+
+
+def _product_key(product_id):
+    return f"cart:product:{product_id}"
+
+
+def _product_snapshot(product):
+    return {
+        "title": product.title,
+        "price": product.price,
+        "image": product.image.url if product.image else "",
+    }
+
+
+def get_cart_products(product_ids):
+    """
+    Returns ``{product_id: {"title", "price", "image"}}`` for the given
+    products, reading the cache first and the database in one query for
+    the rest. Unknown ids are left out.
+    """
+    keys = {str(product_id): _product_key(product_id)
+            for product_id in product_ids}
+    cached = cache.get_many(keys.values())
+    products = {
+        product_id: cached[key]
+        for product_id, key in keys.items()
+        if key in cached
+    }
+
+    missing = [pid for pid in keys if pid not in products]
+    if missing:
+        fresh = {
+            product.pk: _product_snapshot(product)
+            for product in Product.objects.filter(pk__in=missing).only(
+                "id", "title", "price", "image",
+            )
+        }
+        cache.set_many(
+            {keys[pid]: snapshot for pid, snapshot in fresh.items()},
+            settings.CART_PRODUCT_CACHE_TIMEOUT,
+        )
+        products.update(fresh)
+    return products
+
+
+def invalidate_cart_product(product_id):
+    """Drops the cached cart snapshot of a changed product."""
+    cache.delete(_product_key(product_id))
+
+
+class RedisCartStore:
+    """Keeps each cart as a Redis hash of ``product_id -> quantity``."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def quantities(self, key):
+        return {
+            product_id.decode(): int(quantity)
+            for product_id, quantity in self.client.hgetall(key).items()
+        }
+
+    def set(self, key, product_id, quantity):
+        pipeline = self.client.pipeline()
+        pipeline.hset(key, product_id, quantity)
+        pipeline.expire(key, settings.CART_TIMEOUT)
+        pipeline.execute()
+
+    def remove(self, key, product_id):
+        pipeline = self.client.pipeline()
+        pipeline.hdel(key, product_id)
+        pipeline.expire(key, settings.CART_TIMEOUT)
+        pipeline.execute()
+
+    def clear(self, key):
+        self.client.delete(key)
+
+    def count(self, key):
+        return self.client.hlen(key)
+
+
+class CacheCartStore:
+    """
+    Fallback for cache backends without hashes (local development and
+    tests): the quantities dict is stored as one cache value.
+    """
+
+    def quantities(self, key):
+        return cache.get(key, {})
+
+    def set(self, key, product_id, quantity):
+        quantities = self.quantities(key)
+        quantities[product_id] = quantity
+        cache.set(key, quantities, settings.CART_TIMEOUT)
+
+    def remove(self, key, product_id):
+        quantities = self.quantities(key)
+        if quantities.pop(product_id, None) is not None:
+            cache.set(key, quantities, settings.CART_TIMEOUT)
+
+    def clear(self, key):
+        cache.delete(key)
+
+    def count(self, key):
+        return len(self.quantities(key))
+
+
+def get_store():
+    try:
+        from django_redis import get_redis_connection
+
+        return RedisCartStore(get_redis_connection("default"))
+    except (ImportError, NotImplementedError):
+        return CacheCartStore()
+
+
+class Cart:
+    """
+    The visitor's shopping cart.
+
+    Only product ids and quantities are stored, one field per product, so
+    every change is a single atomic write. Titles, prices and images are
+    filled in from the cached product lookup, and the hydrated items and
+    total are computed at most once between two changes.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        self.store = get_store()
+        self._contents = None
+
+    @property
+    def key(self):
+        cart_id = self.session.get(CART_SESSION_KEY)
+        return f"cart:{cart_id}" if cart_id else None
+
+    def _ensure_key(self):
+        if CART_SESSION_KEY not in self.session:
+            self.session[CART_SESSION_KEY] = uuid4().hex
+        return self.key
+
+    def set(self, product_id, quantity):
+        """Sets the quantity of a product; zero or less removes it."""
+        if quantity <= 0:
+            self.remove(product_id)
+            return
+        self.store.set(self._ensure_key(), str(product_id), quantity)
+        self._contents = None
+
+    def remove(self, product_id):
+        if self.key:
+            self.store.remove(self.key, str(product_id))
+        self._contents = None
+
+    def clear(self):
+        if self.key:
+            self.store.clear(self.key)
+        self._contents = None
+
+    def count(self):
+        """Number of distinct products, without hydrating the cart."""
+        if self._contents is not None:
+            return len(self._contents[0])
+        return self.store.count(self.key) if self.key else 0
+
+    def _hydrate(self):
+        if self._contents is None:
+            quantities = self.store.quantities(self.key) if self.key else {}
+            products = get_cart_products(quantities)
+            items = {}
+            total = Decimal("0.00")
+            for product_id, quantity in quantities.items():
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                subtotal = product["price"] * quantity
+                items[product_id] = {
+                    **product,
+                    "pid": product_id,
+                    "quantity": quantity,
+                    "subtotal": subtotal,
+                }
+                total += subtotal
+            self._contents = (items, total)
+        return self._contents
+
+    @property
+    def items(self):
+        """``{product_id: item}`` in the shape the cart templates expect."""
+        return self._hydrate()[0]
+
+    @property
+    def quantities(self):
+        """``{product_id: quantity}`` of the products still on sale."""
+        return {
+            product_id: item["quantity"]
+            for product_id, item in self.items.items()
+        }
+
+    @property
+    def total(self):
+        return self._hydrate()[1]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
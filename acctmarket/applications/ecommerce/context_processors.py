@@ -1,92 +1,80 @@
-from django.db.models import Max, Min
+from functools import partial
+
 from django.urls import reverse
-from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from acctmarket.applications.ecommerce import storefront
+from acctmarket.applications.ecommerce.cart import Cart
+from acctmarket.applications.ecommerce.models import Product, WishList
 
-from acctmarket.applications.blog.models import Banner, BlogCategory, Post
-from acctmarket.applications.ecommerce.models import (Category, Product,
-                                                      WishList)
+# Context keys served from each storefront snapshot section.
+SNAPSHOT_KEYS = {
+    storefront.PRODUCTS: (
+        "in_stock",
+        "best_seller",
+        "special_offer",
+        "featured",
+        "just_arrived",
+        "just_arrived2",
+        "all_products",
+        "min_max_price",
+    ),
+    storefront.CATEGORIES: ("top_categories",),
+    storefront.BLOG: ("blog_categories", "blog_posts"),
+    storefront.BANNERS: ("banners",),
+}
 
 
 def product_list(request):
     """
-    Context processor to provide a list of products to templates.
+    Context processor to provide the storefront lists to templates.
+
+    Every value is lazy: the cached storefront snapshot is only read
+    when a template actually uses one of these keys, and each section
+    is read at most once per request.
 
     :param request: HTTP request object
     :return: Dictionary containing the product list
     """
-    # Fetch all products and prefetch related fields for efficiency
-    products = Product.objects.prefetch_related("category").order_by(
-        "-created_at", "-updated_at", "-id"
-    )
-
-    # Attach discount info to all products
-    for product in products:
-        product.discount_info = product.get_applicable_discount()
-        print(f"Discount info for {product.title}: {product.discount_info}")
-
-    # Use in-memory filtered querysets for subsets to retain discount_info
-    visible_products = [
-        product for product in products if product.visible
-    ]
-    in_stock = [
-        product for product in visible_products if product.in_stock
-    ]
-    best_seller = [
-        product for product in visible_products if product.best_seller
-    ]
-    special_offer = [
-        product for product in visible_products if product.special_offer
-    ]
-    featured = [
-        product for product in visible_products if product.featured
-    ]
-    just_arrived = [
-        product for product in visible_products if product.just_arrived
-    ]
-    just_arrived2 = sorted(just_arrived, key=lambda p: p.id, reverse=True)
-
-    # Deal of the week product
-    now = timezone.now()
-    deal_product = next(
-        (
-            product for product in visible_products
-            if product.deal_of_the_week
-            and product.deal_start_date <= now
-            and product.deal_end_date >= now
-        ),
-        None,
-    )
-
-    # Fetch other data
-    blog_categories = BlogCategory.objects.all().order_by("-created_at")
-    blog_posts = Post.objects.all().order_by("-created_at")
-    categories = Category.objects.all().order_by("-id")
-    banners = Banner.objects.all().order_by("-created_at")
-    min_max_price = Product.objects.aggregate(Min("price"), Max("price"))
-
-    # Wishlist handling
-    try:
-        wishlist = WishList.objects.filter(user=request.user)
-    except Exception:
-        wishlist = 0
-
-    # Return the context dictionary
-    return {
-        "in_stock": in_stock,
-        "best_seller": best_seller,
-        "special_offer": special_offer,
-        "featured": featured,
-        "top_categories": categories,
-        "just_arrived": just_arrived,
-        "just_arrived2": just_arrived2,
-        "all_products": visible_products,
-        "min_max_price": min_max_price,
-        "blog_categories": blog_categories,
-        "blog_posts": blog_posts,
-        "banners": banners,
-        "wishlist": wishlist,
-        "deal_product": deal_product,
+    sections = {}
+
+    def read(section, key):
+        if section not in sections:
+            sections[section] = storefront.get_section(section)
+        return sections[section][key]
+
+    def deal_product():
+        return storefront.get_deal_product(
+            read(storefront.PRODUCTS, "deal_candidates"),
+        )
+
+    def wishlist():
+        if not request.user.is_authenticated:
+            return 0
+        return WishList.objects.filter(user=request.user)
+
+    def wishlist_count():
+        if not request.user.is_authenticated:
+            return 0
+        return WishList.objects.filter(user=request.user).count()
+
+    context = {
+        key: SimpleLazyObject(partial(read, section, key))
+        for section, keys in SNAPSHOT_KEYS.items()
+        for key in keys
     }
+    context["deal_product"] = SimpleLazyObject(deal_product)
+    context["wishlist"] = SimpleLazyObject(wishlist)
+    context["wishlist_count"] = SimpleLazyObject(wishlist_count)
+    return context
+
+
+def cart(request):
+    """
+    Adds the number of products in the visitor's cart, read only when a
+    template shows it.
+    """
+    return {"cart_item_count": SimpleLazyObject(lambda: Cart(request).count())}
 
 
 def products_by_category(request):
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from acctmarket.applications.ecommerce.models import Product
+from acctmarket.applications.ecommerce.search import search_products
+from acctmarket.utils.cache import bump_generation, get_generation
+from acctmarket.utils.choices import Rating
+
+logger = logging.getLogger(__name__)
+
+FACET_GENERATION_KEY = "facets:generation"
+
+# Best rated first, using the denormalised review aggregates.
+RATING_ORDERING = ("-rating_average", "-rating_count", "id")
+
+# Upper bounds of the price histogram buckets; the last bucket is open.
+PRICE_BUCKET_EDGES = (
+    Decimal("5"),
+    Decimal("10"),
+    Decimal("25"),
+    Decimal("50"),
+    Decimal("100"),
+)
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    if not price.is_finite() or price < 0:
+        return None
+    # "10", "10.0" and "10.00" must map to the same cache key.
+    return price.normalize()
+
+
+def _parse_rating(value):
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if rating in Rating.values else None
+
+
+def normalise_filters(params):
+    """
+    Reduces the sidebar's query parameters to a canonical dict, so that
+    equivalent filter combinations share one cache entry.
+    """
+    return {
+        "categories": sorted(set(params.getlist("category[]"))),
+        "min_price": _parse_price(params.get("min_price")),
+        "max_price": _parse_price(params.get("max_price")),
+        "min_rating": _parse_rating(params.get("min_rating")),
+        "q": (params.get("q") or "").strip().lower(),
+    }
+
+
+def filter_products(filters, ignore=()):
+    """
+    Returns the purchasable products matching ``filters``. Names listed in
+    ``ignore`` are skipped, so each facet can be counted against the other
+    active filters only.
+    """
+    products = Product.objects.filter(in_stock=True, digital=True)
+    if filters["min_price"] is not None and "price" not in ignore:
+        products = products.filter(price__gte=filters["min_price"])
+    if filters["max_price"] is not None and "price" not in ignore:
+        products = products.filter(price__lte=filters["max_price"])
+    if filters["min_rating"] is not None:
+        products = products.filter(rating_average__gte=filters["min_rating"])
+    if filters["categories"] and "categories" not in ignore:
+        products = products.filter(category__id__in=filters["categories"])
+    if filters["q"]:
+        products = search_products(filters["q"], products)
+    return products
+
+
+def _price_buckets():
+    lower = Decimal("0")
+    for upper in PRICE_BUCKET_EDGES:
+        yield lower, upper
+        lower = upper
+    yield lower, None
+
+
+def compute_facets(filters):
+    """
+    Counts products per category and per price bucket in two aggregate
+    queries. Each facet ignores its own filter so the sidebar can show
+    what selecting another option would return.
+    """
+    category_rows = (
+        filter_products(filters, ignore=("categories",))
+        .order_by()
+        .values("category_id", "category__title")
+        .annotate(count=Count("id"))
+        .order_by("category__title")
+    )
+    categories = [
+        {
+            "id": row["category_id"],
+            "title": row["category__title"],
+            "count": row["count"],
+        }
+        for row in category_rows
+        if row["category_id"] is not None
+    ]
+
+    buckets = list(_price_buckets())
+    aggregates = {}
+    for index, (lower, upper) in enumerate(buckets):
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        aggregates[f"bucket_{index}"] = Count("id", filter=condition)
+    bucket_counts = (
+        filter_products(filters, ignore=("price",))
+        .order_by()
+        .aggregate(**aggregates)
+    )
+    price_buckets = [
+        {
+            "min": str(lower),
+            "max": str(upper) if upper is not None else None,
+            "count": bucket_counts[f"bucket_{index}"],
+        }
+        for index, (lower, upper) in enumerate(buckets)
+    ]
+
+    return {"categories": categories, "price_buckets": price_buckets}
+
+
+def _facet_key(filters):
+    generation = get_generation(FACET_GENERATION_KEY)
+    payload = json.dumps(filters, sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode()).hexdigest()  # noqa: S324
+    return f"facets:v{generation}:{digest}"
+
+
+def get_facets(filters):
+    """Returns the facet counts for ``filters``, cached per filter key."""
+    key = _facet_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, settings.FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    """
+    Retires every cached facet result once the current transaction
+    commits.
+    """
+    bump_generation(FACET_GENERATION_KEY)
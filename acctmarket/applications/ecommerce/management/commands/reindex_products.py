@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from acctmarket.applications.ecommerce.search import (REINDEX_BATCH_SIZE,
+                                                      reindex_products)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search vector of every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REINDEX_BATCH_SIZE,
+            help="Number of products loaded per database round trip.",
+        )
+
+    def handle(self, *args, **options):
+        count = reindex_products(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Reindexed {count} products."),
+        )
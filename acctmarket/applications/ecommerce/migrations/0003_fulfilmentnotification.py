@@ -0,0 +1,43 @@
+# Generated by Django 5.0.10 on 2026-10-18 00:55
+
+import acctmarket.utils.models
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0002_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FulfilmentNotification',
+            fields=[
+                ('id', models.CharField(default=acctmarket.utils.models.generate_uuid, editable=False, max_length=120, primary_key=True, serialize=False, unique=True)),
+                ('visible', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('PRODUCT_ACCESS', 'PRODUCT_ACCESS'), ('INSUFFICIENT_KEYS', 'INSUFFICIENT_KEYS')], max_length=20)),
+                ('detail', models.TextField(blank=True, default='')),
+                ('user_notified_at', models.DateTimeField(blank=True, null=True)),
+                ('admin_notified_at', models.DateTimeField(blank=True, null=True)),
+                ('order', auto_prefetch.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fulfilment_notifications', to='ecommerce.cartorder', verbose_name='Order')),
+            ],
+            options={
+                'verbose_name_plural': 'Fulfilment notifications',
+                'ordering': ['-created_at'],
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fulfilmentnotification',
+            constraint=models.UniqueConstraint(fields=('order', 'kind'), name='unique_fulfilment_notification_per_order'),
+        ),
+    ]
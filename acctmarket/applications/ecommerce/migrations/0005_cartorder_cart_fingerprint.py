@@ -0,0 +1,24 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0004_webhookevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartorder',
+            name='cart_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddConstraint(
+            model_name='cartorder',
+            constraint=models.UniqueConstraint(condition=models.Q(('paid_status', False), models.Q(('cart_fingerprint', ''), _negated=True)), fields=('user', 'cart_fingerprint'), name='unique_draft_order_per_cart'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0006_product_rating_aggregates'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['user', 'paid_status', '-created_at'], name='cartorder_user_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['valid_from', 'valid_to'], name='coupon_validity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('visible', True)), fields=['-created_at', '-id'], name='product_visible_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('digital', True), ('in_stock', True)), fields=['price'], name='product_purchasable_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productkey',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['product', 'created_at'], name='productkey_unused_idx'),
+        ),
+    ]
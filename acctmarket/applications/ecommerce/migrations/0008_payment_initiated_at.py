@@ -0,0 +1,18 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0007_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='initiated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
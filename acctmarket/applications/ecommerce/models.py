@@ -7,21 +7,25 @@ from ckeditor_uploader.fields import RichTextUploadingField
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import Permission
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import transaction
 from django.db.models import (CASCADE, SET_NULL, BooleanField, CharField,
                               CheckConstraint, DateField, DateTimeField,
-                              DecimalField, F, FileField, IntegerField,
+                              DecimalField, F, FileField, Index, IntegerField,
                               JSONField, ManyToManyField, PositiveIntegerField,
-                              Q, SlugField, TextField)
+                              Q, SlugField, TextField, UniqueConstraint)
 from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from taggit.managers import TaggableManager
 from taggit.models import GenericTaggedItemBase, TaggedItemBase
 
-from acctmarket.utils.choices import (COUPON_CHOICE, ProductStatus, Rating,
-                                      Status)
+from acctmarket.utils.choices import (COUPON_CHOICE,
+                                      FulfilmentNotificationKind,
+                                      ProductStatus, Rating, Status,
+                                      WebhookEventStatus, WebhookProvider)
 from acctmarket.utils.media import MediaHelper
 from acctmarket.utils.models import (ImageTitleTimeBaseModels, TimeBasedModel,
                                      TitleandUIDTimeBasedModel)
@@ -86,6 +90,12 @@ class Category(ImageTitleTimeBaseModels):
 
 # Match your custom PK length
 
+# Written only by ratings.record_rating(), never by Product.save().
+RATING_FIELDS = frozenset(
+    ["rating_count", "rating_sum", "rating_average"]
+    + [f"rating_{stars}_count" for stars in Rating.values]
+)
+
 
 class Product(TitleandUIDTimeBasedModel, ImageTitleTimeBaseModels):
     user = auto_prefetch.ForeignKey(
@@ -145,14 +155,76 @@ class Product(TitleandUIDTimeBasedModel, ImageTitleTimeBaseModels):
         blank=True,
         null=True,
     )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Weighted full-text document used by product search.",
+    )
+    # Review aggregates, kept up to date by ratings.record_rating() so
+    # listings can sort and filter by rating without reading reviews.
+    rating_count = PositiveIntegerField(default=0, editable=False)
+    rating_sum = PositiveIntegerField(default=0, editable=False)
+    rating_average = DecimalField(
+        max_digits=3, decimal_places=2, default=0, editable=False,
+    )
+    rating_1_count = PositiveIntegerField(default=0, editable=False)
+    rating_2_count = PositiveIntegerField(default=0, editable=False)
+    rating_3_count = PositiveIntegerField(default=0, editable=False)
+    rating_4_count = PositiveIntegerField(default=0, editable=False)
+    rating_5_count = PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Products"
         ordering = ["-created_at", "-updated_at"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_idx"),
+            Index(
+                fields=["-rating_average", "-rating_count"],
+                name="product_rating_idx",
+            ),
+            # Shop listing: newest visible products, paged by keyset.
+            Index(
+                fields=["-created_at", "-id"],
+                condition=Q(visible=True),
+                name="product_visible_recent_idx",
+            ),
+            # Faceted search: purchasable products by price range.
+            Index(
+                fields=["price"],
+                condition=Q(in_stock=True, digital=True),
+                name="product_purchasable_price_idx",
+            ),
+        ]
         permissions = [
             ("can_crud_product", "Can create, update, and delete product"),
         ]
 
+    def save(self, *args, **kwargs):
+        """
+        Saves an existing product without its rating aggregates, so a copy
+        loaded before a review was posted cannot write back stale totals.
+        """
+        if (
+            not self._state.adding
+            and not args
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_histogram(self):
+        """``{stars: number of reviews}`` for one to five stars."""
+        return {
+            stars: getattr(self, f"rating_{stars}_count")
+            for stars in Rating.values
+        }
+
     def get_percentage(self, decimal_places=2):
         if self.oldprice > 0:
             percentage = ((self.oldprice - self.price) / self.oldprice) * 100
@@ -172,46 +244,18 @@ class Product(TitleandUIDTimeBasedModel, ImageTitleTimeBaseModels):
             return self.price * (1 - self.discount_percentage / 100)
         return self.price
 
-    def get_applicable_discount(self):
+    def get_applicable_discount(self, coupon_index=None):
         """
         Check if any valid coupon applies to this product
         and return the discount info.
-        """
-        today = timezone.now().date()
-        coupons = Coupon.objects.filter(
-            Q(universal=True)
-            | Q(applicable_products=self)
-            | Q(applicable_categories=self.category),
-            valid_from__lte=today,
-            valid_to__gte=today,
-            times_used__lt=F("usage_limit"),
-        )
-        print(f"Coupons for {self.title}: {coupons}")
-
-        # If no coupon is applicable
-        if not coupons.exists():
-            return None
-
-        # Get the highest discount (you can modify the logic if needed)
-        best_coupon = max(
-            coupons,
-            key=lambda coupon: (
-                coupon.discount_value
-                if coupon.discount_type == "flat"
-                else (self.price * coupon.discount_value / 100)
-            ),
-        )
 
-        if best_coupon.discount_type == COUPON_CHOICE.PERCENTAGE:
-            discount_value = (best_coupon.discount_value / 100) * self.price
-        else:
-            discount_value = min(best_coupon.discount_value, self.price)
+        Pass a shared ``CouponIndex`` when resolving discounts for many
+        products so the coupons are only loaded once.
+        """
+        from acctmarket.utils.coupon_discount import CouponIndex
 
-        return {
-            "code": best_coupon.code,
-            "discount_value": discount_value,
-            "discount_type": best_coupon.get_discount_type_display(),
-        }
+        coupon_index = coupon_index or CouponIndex.load()
+        return coupon_index.best_discount(self)
 
     def __str__(self):
         if not self.title:
@@ -231,6 +275,16 @@ class ProductKey(TimeBasedModel):
     password = CharField(max_length=255)
     is_used = BooleanField(default=False)
 
+    class Meta(TimeBasedModel.Meta):
+        indexes = [
+            # Key allocation claims the oldest unused keys of a product.
+            Index(
+                fields=["product", "created_at"],
+                condition=Q(is_used=False),
+                name="productkey_unused_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return (
             f"key for {self.product.title} - key {self.key} - password{self.password}"  # noqa
@@ -269,10 +323,28 @@ class CartOrder(TimeBasedModel):
         max_length=30,
     )
     payment_method = CharField(max_length=20, blank=True)
+    # Digest of the priced cart an unpaid order was drafted from, so that
+    # re-rendering the checkout reuses the order instead of creating one.
+    cart_fingerprint = CharField(
+        max_length=40, blank=True, default="", editable=False,
+    )
 
     class Meta:
         verbose_name_plural = "Cart Orders"
         ordering = ["-created_at", "-id"]
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "cart_fingerprint"],
+                condition=Q(paid_status=False) & ~Q(cart_fingerprint=""),
+                name="unique_draft_order_per_cart",
+            ),
+        ]
+        indexes = [
+            Index(
+                fields=["user", "paid_status", "-created_at"],
+                name="cartorder_user_paid_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user}'s cart order"
@@ -381,6 +453,8 @@ class Payment(TimeBasedModel):
         blank=True,
     )
     verified = BooleanField(default=False)
+    # Set when the payment is sent to a gateway; the reference is spent.
+    initiated_at = DateTimeField(blank=True, null=True)
 
     class Meta:
         verbose_name = "Payment"
@@ -428,15 +502,44 @@ class Payment(TimeBasedModel):
         self.save()
         return False
 
-    def verify_flutterwave_payment(self) -> bool:
+    def _schedule_flutterwave_reverify(self, task, args, result, attempt):
+        """
+        Marks a payment Flutterwave has not listed yet as processing and
+        queues ``task`` to verify it again after ``retry_after`` seconds,
+        up to ``FLUTTERWAVE_VERIFY_MAX_ATTEMPTS`` times in all.
+        """
+        if attempt >= settings.FLUTTERWAVE_VERIFY_MAX_ATTEMPTS:
+            logging.error(
+                f"Flutterwave never listed payment reference {self.reference}; giving up after {attempt} attempts."  # noqa
+            )
+            self.status = "failed"
+            self.save(update_fields=["status"])
+            return
+        self.status = "processing"
+        self.save(update_fields=["status"])
+        transaction.on_commit(
+            lambda: task.apply_async(
+                (*args, attempt + 1), countdown=result["retry_after"],
+            ),
+        )
+
+    def verify_flutterwave_payment(self, attempt=1) -> bool:
         """
         Verifies the payment with Flutterwave
         and updates the payment status.
 
+        A transaction Flutterwave has not listed yet leaves the payment
+        ``processing`` and is verified again by a Celery task, which
+        fulfils the order once it succeeds.
+
         Returns:
             bool: True if the payment is successfully verified,
             False otherwise
         """
+        # The re-verify task reloads Payment rows from this module.
+        from acctmarket.applications.ecommerce.tasks import \
+            reverify_flutterwave_payment
+
         flutterwave = Flutterwave()
         exchange_rate = get_exchange_rate()
         logging.info(
@@ -471,6 +574,11 @@ class Payment(TimeBasedModel):
                     f"Payment reference {self.reference} successfully verified."  # noqa
                 )
                 return True
+            if result["status"] == "pending":
+                self._schedule_flutterwave_reverify(
+                    reverify_flutterwave_payment, (self.pk,), result, attempt,
+                )
+                return False
             logging.error(
                 f"Verification failed for payment reference {self.reference}: "  # noqa
                 f"status {result['status']}, message {result.get('message')}."
@@ -488,6 +596,50 @@ class Payment(TimeBasedModel):
 
         return False
 
+    def verify_flutterwave_funding(self, transaction_id, attempt=1) -> bool:
+        """
+        Verifies a Flutterwave wallet top-up and credits the wallet once.
+
+        Like checkout payments, a transaction Flutterwave has not listed
+        yet leaves the payment ``processing`` and is verified again by a
+        Celery task, which credits the wallet once it succeeds.
+        """
+        from acctmarket.applications.ecommerce.tasks import \
+            reverify_flutterwave_funding
+
+        result = Flutterwave().verify_payment(transaction_id)
+        with transaction.atomic():
+            payment = (
+                Payment.objects.select_for_update(of=("self",))
+                .select_related("wallet")
+                .get(pk=self.pk)
+            )
+            if payment.verified:
+                return True
+            if result["status"] == "pending":
+                payment._schedule_flutterwave_reverify(
+                    reverify_flutterwave_funding,
+                    (payment.pk, transaction_id),
+                    result,
+                    attempt,
+                )
+            elif result["status"] == "success":
+                payment.status = "completed"
+                payment.verified = True
+                payment.save(update_fields=["status", "verified"])
+                payment.wallet.credit_wallet(payment.amount)
+                logging.info(
+                    f"Flutterwave transaction {transaction_id} credited {payment.amount} to wallet {payment.wallet_id}."  # noqa
+                )
+            else:
+                logging.error(
+                    f"Flutterwave funding verification failed for transaction {transaction_id}: {result.get('message')}"  # noqa
+                )
+                payment.status = "failed"
+                payment.save(update_fields=["status"])
+        self.status, self.verified = payment.status, payment.verified
+        return payment.verified
+
     def verify_payment_nowpayments(self, request) -> bool:
         """
         Verifies a payment made via NOWPayments.
@@ -737,6 +889,12 @@ class Coupon(TimeBasedModel):
                 name="valid_to_after_valid_from",
             ),
         ]
+        indexes = [
+            Index(
+                fields=["valid_from", "valid_to"],
+                name="coupon_validity_idx",
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -751,3 +909,77 @@ class Coupon(TimeBasedModel):
             and (self.valid_from is None or self.valid_from <= today)
             and (self.valid_to is None or self.valid_to >= today)
         )
+
+
+class FulfilmentNotification(TimeBasedModel):
+    """
+    An email owed to a buyer after their order was fulfilled, recorded in
+    the same transaction as the key allocation. The buyer email is sent by
+    a Celery task and the site admin hears about it in the next digest.
+    """
+
+    order = auto_prefetch.ForeignKey(
+        CartOrder,
+        verbose_name=_("Order"),
+        on_delete=CASCADE,
+        related_name="fulfilment_notifications",
+    )
+    kind = CharField(
+        max_length=20,
+        choices=FulfilmentNotificationKind.choices,
+    )
+    detail = TextField(blank=True, default="")
+    user_notified_at = DateTimeField(null=True, blank=True)
+    admin_notified_at = DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Fulfilment notifications"
+        ordering = ["-created_at"]
+        constraints = [
+            UniqueConstraint(
+                fields=["order", "kind"],
+                name="unique_fulfilment_notification_per_order",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for order {self.order_id}"
+
+
+class WebhookEvent(TimeBasedModel):
+    """
+    A payment provider notification, stored as received and processed
+    later by a Celery worker. The provider's event ID is unique per
+    provider, so redelivered notifications are recorded only once.
+    """
+
+    provider = CharField(max_length=20, choices=WebhookProvider.choices)
+    event_id = CharField(max_length=255)
+    payload = JSONField(default=dict)
+    status = CharField(
+        max_length=10,
+        choices=WebhookEventStatus.choices,
+        default=WebhookEventStatus.PENDING,
+    )
+    attempts = PositiveIntegerField(default=0)
+    last_error = TextField(blank=True, default="")
+    processed_at = DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Webhook events"
+        ordering = ["created_at"]
+        constraints = [
+            UniqueConstraint(
+                fields=["provider", "event_id"],
+                name="unique_webhook_event_per_provider",
+            ),
+        ]
+        indexes = [
+            Index(
+                fields=["status", "created_at"],
+                name="webhook_event_inbox_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} event {self.event_id} ({self.status})"
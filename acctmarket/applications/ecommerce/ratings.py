@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from acctmarket.applications.ecommerce.models import Product
+from acctmarket.utils.choices import Rating
+
+AVERAGE_FIELD = DecimalField(max_digits=3, decimal_places=2)
+
+
+def record_rating(product_id, rating, sign=1):
+    """
+    Adds (``sign=1``) or removes (``sign=-1``) one review rating from a
+    product's aggregates in a single UPDATE. Every column is computed from
+    its current value with ``F()``, so concurrent reviews never overwrite
+    each other's counts.
+    """
+    if product_id is None or rating not in Rating.values:
+        return
+    count = F("rating_count") + sign
+    total = F("rating_sum") + sign * rating
+    histogram_field = f"rating_{rating}_count"
+    Product.objects.filter(pk=product_id).update(
+        rating_count=count,
+        rating_sum=total,
+        rating_average=Coalesce(
+            Cast(total, DecimalField(max_digits=12, decimal_places=4))
+            / NullIf(count, 0),
+            Value(Decimal("0")),
+            output_field=AVERAGE_FIELD,
+        ),
+        **{histogram_field: F(histogram_field) + sign},
+    )
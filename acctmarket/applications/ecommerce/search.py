@@ -0,0 +1,109 @@
+import functools
+import logging
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import F, Q, TextField, Value
+from django.utils.html import strip_tags
+
+from acctmarket.applications.ecommerce.models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = "english"
+# Stemming one or two characters matches nothing useful, so shorter
+# queries go straight to the prefix/trigram match.
+MIN_FULL_TEXT_LENGTH = 3
+TRIGRAM_THRESHOLD = 0.2
+REINDEX_BATCH_SIZE = 500
+
+
+@functools.cache
+def trigram_available():
+    """Whether the pg_trgm extension is installed in the database."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def _weighted(text, weight):
+    return SearchVector(
+        Value(text or "", output_field=TextField()),
+        weight=weight,
+        config=SEARCH_CONFIG,
+    )
+
+
+def product_search_vector(product):
+    """
+    Returns the weighted search document of a product: title first, then
+    tags and category, then the description and specification text.
+    """
+    tags = " ".join(tag.name for tag in product.tags.all())
+    category = product.category.title if product.category else ""
+    return (
+        _weighted(product.title, "A")
+        + _weighted(tags, "B")
+        + _weighted(category, "B")
+        + _weighted(strip_tags(product.description or ""), "C")
+        + _weighted(strip_tags(product.specification or ""), "D")
+    )
+
+
+def reindex_products(queryset=None, batch_size=REINDEX_BATCH_SIZE):
+    """
+    Rebuilds the search vector of every product in ``queryset`` (all
+    products by default) and returns how many were indexed.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    products = queryset.select_related("category").prefetch_related("tags")
+
+    count = 0
+    for product in products.iterator(chunk_size=batch_size):
+        # update() keeps post_save (and this reindex) from firing again.
+        Product.objects.filter(pk=product.pk).update(
+            search_vector=product_search_vector(product),
+        )
+        count += 1
+    return count
+
+
+def _fuzzy_match(queryset, query):
+    if trigram_available():
+        return queryset.annotate(
+            similarity=TrigramSimilarity("title", query),
+        ).filter(
+            Q(similarity__gt=TRIGRAM_THRESHOLD) | Q(title__istartswith=query)
+        ).order_by("-similarity", "title")
+    return queryset.filter(title__istartswith=query).order_by("title")
+
+
+def search_products(query, queryset=None):
+    """
+    Returns the products matching ``query``, best matches first.
+
+    Full-text matches are ranked against the weighted search vector; short
+    queries and queries with no full-text hit (typos, partial words) fall
+    back to trigram similarity on the title, or a title prefix match when
+    pg_trgm is not installed.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    query = (query or "").strip()
+    if not query:
+        return queryset.none()
+
+    if len(query) >= MIN_FULL_TEXT_LENGTH:
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type="websearch",
+        )
+        results = queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query),
+        ).order_by("-rank", "-created_at")
+        if results.exists():
+            return results
+
+    logger.info(f"No full-text match for '{query}', using fuzzy match.")
+    return _fuzzy_match(queryset, query)
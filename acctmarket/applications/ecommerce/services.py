@@ -0,0 +1,268 @@
+import hashlib
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+
+from acctmarket.applications.ecommerce import facets, storefront
+from acctmarket.applications.ecommerce.models import (CartOrder,
+                                                      CartOrderItems,
+                                                      FulfilmentNotification,
+                                                      Payment, Product,
+                                                      ProductKey)
+from acctmarket.applications.ecommerce.tasks import send_order_notifications
+from acctmarket.applications.refer import notifications
+from acctmarket.utils.choices import (FulfilmentNotificationKind,
+                                      NOTIFICATION_TYPES_Choice)
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_keys(product_id, quantity):
+    """
+    Locks up to ``quantity`` unused keys of a product, oldest first.
+
+    Rows already locked by a concurrent allocation are skipped rather than
+    waited on, so buyers of the same product never queue behind each other.
+    """
+    return list(
+        ProductKey.objects.select_for_update(skip_locked=True)
+        .filter(product_id=product_id, is_used=False)
+        .order_by("created_at")
+        .values("id", "key", "password")[:quantity]
+    )
+
+
+def _decrement_stock(product_id, quantity):
+    """Takes ``quantity`` off the stock and hides the product at zero."""
+    Product.objects.filter(pk=product_id).update(
+        quantity_in_stock=Greatest(F("quantity_in_stock") - quantity, 0),
+        visible=Case(
+            When(quantity_in_stock__gt=quantity, then=Value(True)),
+            default=Value(False),
+        ),
+    )
+
+
+def allocate_order_keys(order):
+    """
+    Assigns product keys to every item of ``order`` in one pass.
+
+    Keys are claimed per product with ``FOR UPDATE SKIP LOCKED``, marked as
+    used in a single UPDATE and written to the order items with one bulk
+    update. Stock is decremented by the number of keys actually handed
+    out. Returns the order items that could not be filled completely.
+    """
+    with transaction.atomic():
+        items = [
+            item
+            for item in order.order_items.select_related("product").order_by(
+                "created_at"
+            )
+            if item.product_id
+        ]
+
+        needed = defaultdict(int)
+        for item in items:
+            needed[item.product_id] += item.quantity
+        claimed = {
+            product_id: _claim_keys(product_id, quantity)
+            for product_id, quantity in needed.items()
+        }
+
+        handed_out_by_product = {
+            product_id: len(keys) for product_id, keys in claimed.items()
+        }
+        claimed_ids = [key["id"] for keys in claimed.values() for key in keys]
+        if claimed_ids:
+            ProductKey.objects.filter(id__in=claimed_ids).update(is_used=True)
+
+        shortfalls = []
+        for item in items:
+            keys = claimed[item.product_id]
+            assigned = keys[:item.quantity]
+            claimed[item.product_id] = keys[item.quantity:]
+            item.keys_and_passwords = [
+                {"key": key["key"], "password": key["password"]}
+                for key in assigned
+            ]
+            if len(assigned) < item.quantity:
+                shortfalls.append(item)
+        CartOrderItems.objects.bulk_update(items, ["keys_and_passwords"])
+
+        for product_id, handed_out in handed_out_by_product.items():
+            if handed_out:
+                _decrement_stock(product_id, handed_out)
+
+        # The stock updates bypass post_save, so drop the cached listings
+        # that show stock and visibility here.
+        storefront.invalidate_sections(
+            *storefront.SECTIONS_BY_MODEL[Product]
+        )
+        facets.invalidate_facets()
+
+    logger.info(
+        f"Allocated {len(claimed_ids)} keys for order {order.id}; "
+        f"{len(shortfalls)} items short."
+    )
+    return shortfalls
+
+
+def record_fulfilment_notifications(order, shortfalls):
+    """
+    Records the emails owed for a fulfilled order. Recording an order
+    twice (e.g. a webhook racing the return URL) keeps the first record,
+    so each email goes out once.
+    """
+    FulfilmentNotification.objects.get_or_create(
+        order=order,
+        kind=FulfilmentNotificationKind.PRODUCT_ACCESS,
+    )
+    if shortfalls:
+        FulfilmentNotification.objects.get_or_create(
+            order=order,
+            kind=FulfilmentNotificationKind.INSUFFICIENT_KEYS,
+            defaults={
+                "detail": ", ".join(
+                    item.product.title for item in shortfalls
+                ),
+            },
+        )
+
+
+def fulfil_order(order, purchased_products_url):
+    """
+    Allocates keys for a paid order and queues its emails, exactly once.
+
+    The return URL and the provider webhook can both report the same
+    payment; the order row lock serialises them and the recorded product
+    access notification marks the order as fulfilled. Returns False when
+    the order had already been fulfilled.
+    """
+    with transaction.atomic():
+        CartOrder.objects.select_for_update().filter(pk=order.pk).first()
+        if FulfilmentNotification.objects.filter(
+            order=order,
+            kind=FulfilmentNotificationKind.PRODUCT_ACCESS,
+        ).exists():
+            logger.info(f"Order {order.id} is already fulfilled.")
+            return False
+
+        shortfalls = allocate_order_keys(order)
+        record_fulfilment_notifications(order, shortfalls)
+        if order.user_id:
+            notifications.notify(
+                order.user_id,
+                f"Your payment for order #{order.id} has been successfully processed.",  # noqa
+                NOTIFICATION_TYPES_Choice.PAYMENT_SUCCESS,
+            )
+        transaction.on_commit(
+            lambda: send_order_notifications.delay(
+                order.id, purchased_products_url,
+            )
+        )
+    return True
+
+
+def _cart_fingerprint(lines, discount):
+    payload = "|".join(
+        f"{product.pk}:{quantity}:{product.price}"
+        for product, quantity in sorted(lines, key=lambda line: line[0].pk)
+    )
+    payload = f"{payload}|discount:{discount}"
+    return hashlib.sha1(payload.encode()).hexdigest()  # noqa: S324
+
+
+def _reusable_draft(user, fingerprint):
+    """
+    Returns the locked unpaid order drafted from the same cart, or None.
+    A draft whose payment was sent to a gateway or settled otherwise is
+    retired instead, so a gateway never sees the same reference twice.
+    """
+    order = (
+        CartOrder.objects.select_for_update(of=("self",))
+        .filter(user=user, paid_status=False, cart_fingerprint=fingerprint)
+        .first()
+    )
+    if order is None:
+        return None
+    payment = Payment.objects.filter(order=order).first()
+    if payment is None or (
+        payment.initiated_at is None
+        and payment.status == "pending"
+        and not payment.verified
+    ):
+        return order
+    order.cart_fingerprint = ""
+    order.save(update_fields=["cart_fingerprint"])
+    return None
+
+
+def get_or_create_draft_order(user, quantities, discount=Decimal("0.00"),
+                              wallet=None, payment_method=""):
+    """
+    Returns the pending ``(order, payment)`` for a cart, creating them only
+    when the cart, its prices or the discount changed since the last
+    checkout render.
+
+    ``quantities`` maps product ids to quantities. Every product is
+    resolved with one ``in_bulk()`` query and priced from the database;
+    unknown products are left out of the order.
+    """
+    products = Product.objects.in_bulk(list(quantities))
+    lines = [
+        (products[product_id], quantity)
+        for product_id, quantity in quantities.items()
+        if product_id in products
+    ]
+    total = sum(
+        (product.price * quantity for product, quantity in lines),
+        Decimal("0.00"),
+    ) - discount
+    fingerprint = _cart_fingerprint(lines, discount)
+
+    try:
+        with transaction.atomic():
+            order = _reusable_draft(user, fingerprint)
+            if order is None:
+                order = CartOrder.objects.create(
+                    user=user,
+                    price=total,
+                    paid_status=False,
+                    payment_method=payment_method,
+                    cart_fingerprint=fingerprint,
+                )
+                CartOrderItems.objects.bulk_create(
+                    CartOrderItems(
+                        order=order,
+                        product=product,
+                        invoice_no=f"INVOICE_NO_{order.id}",
+                        quantity=quantity,
+                        price=product.price,
+                        total=product.price * quantity,
+                    )
+                    for product, quantity in lines
+                )
+            payment, created = Payment.objects.get_or_create(
+                order=order,
+                defaults={
+                    "user": user,
+                    "amount": order.price,
+                    "wallet": wallet,
+                    "status": "pending",
+                },
+            )
+            if not created and wallet is not None and payment.wallet_id != wallet.pk:  # noqa
+                payment.wallet = wallet
+                payment.save(update_fields=["wallet"])
+    except IntegrityError:
+        # A concurrent render of the same cart drafted the order first.
+        logger.info(f"Reusing draft order drafted concurrently for {user}.")
+        order = CartOrder.objects.get(
+            user=user, paid_status=False, cart_fingerprint=fingerprint,
+        )
+        payment = Payment.objects.get(order=order)
+    return order, payment
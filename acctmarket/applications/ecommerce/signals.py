@@ -1,9 +1,16 @@
 import logging
 
-from django.db.models.signals import post_save
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
 from django.dispatch import receiver
 
-from acctmarket.applications.ecommerce.models import CartOrderItems, ProductKey
+from acctmarket.applications.ecommerce import (cart, facets, ratings, search,
+                                               storefront)
+from acctmarket.applications.ecommerce.models import (CartOrderItems, Category,
+                                                      Coupon, Product,
+                                                      ProductKey,
+                                                      ProductReview)
+from acctmarket.utils import coupon_discount
 
 logger = logging.getLogger(__name__)
 
@@ -38,4 +45,118 @@ def update_product_quantity(sender, instance, created, **kwargs):
             product.quantity_in_stock += 1
             product.in_stock = product.quantity_in_stock > 0
             logger.info(f"product {product.quantity_in_stock} is updated")
-            product.save()
+            product.save(update_fields=["quantity_in_stock", "in_stock"])
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_storefront_snapshot(sender, **kwargs):
+    """
+    Drops the storefront snapshot sections that depend on the saved or
+    deleted model, so the next page render rebuilds only those sections.
+    """
+    sections = storefront.SECTIONS_BY_MODEL.get(sender)
+    if sections:
+        storefront.invalidate_sections(*sections)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_facet_counts(sender, **kwargs):
+    """Product and category changes alter the shop sidebar counts."""
+    facets.invalidate_facets()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cart_product(sender, instance, **kwargs):
+    """Carts show the product's current title, price and image."""
+    cart.invalidate_cart_product(instance.pk)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_storefront_discounts(sender, **kwargs):
+    """Coupon changes alter the discount attached to listed products."""
+    storefront.invalidate_sections(storefront.PRODUCTS)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cart_discounts(sender, **kwargs):
+    """
+    Coupon edits and product category moves change which cart lines a
+    coupon discounts.
+    """
+    coupon_discount.invalidate_discounts()
+
+
+@receiver(m2m_changed, sender=Coupon.applicable_products.through)
+@receiver(m2m_changed, sender=Coupon.applicable_categories.through)
+def invalidate_cart_discount_targets(sender, action, **kwargs):
+    """Re-targeting a coupon changes which cart lines it discounts."""
+    if action in ("post_add", "post_remove", "post_clear"):
+        coupon_discount.invalidate_discounts()
+
+
+@receiver(m2m_changed, sender=Coupon.applicable_products.through)
+@receiver(m2m_changed, sender=Coupon.applicable_categories.through)
+def invalidate_storefront_coupon_targets(sender, action, **kwargs):
+    """Re-targeting a coupon alters the discount of listed products."""
+    if action in ("post_add", "post_remove", "post_clear"):
+        storefront.invalidate_sections(storefront.PRODUCTS)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    """Keeps the product's full-text search document in step with it."""
+    search.reindex_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_tagged_product_search_vector(sender, instance, action, reverse,
+                                        **kwargs):
+    """Tags are part of the search document, so re-index on tag changes."""
+    if action in ("post_add", "post_remove", "post_clear") and not reverse:
+        search.reindex_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, created, **kwargs):
+    """The category title is indexed on each of its products."""
+    if not created:
+        search.reindex_products(Product.objects.filter(category=instance))
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Keeps the stored rating of an edited review for the aggregates."""
+    instance._previous_rating = None
+    if not instance._state.adding:
+        instance._previous_rating = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list("product_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    """Moves the review's rating into the product's aggregates."""
+    current = (instance.product_id, instance.rating)
+    previous = getattr(instance, "_previous_rating", None)
+    if created or previous is None:
+        ratings.record_rating(*current)
+    elif previous != current:
+        ratings.record_rating(*previous, sign=-1)
+        ratings.record_rating(*current)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    """Takes a deleted review's rating out of the product's aggregates."""
+    ratings.record_rating(instance.product_id, instance.rating, sign=-1)
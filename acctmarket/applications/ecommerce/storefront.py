@@ -0,0 +1,156 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from acctmarket.applications.blog.models import Banner, BlogCategory, Post
+from acctmarket.applications.ecommerce.models import Category, Product
+from acctmarket.utils.coupon_discount import CouponIndex
+
+logger = logging.getLogger(__name__)
+
+# Part of every section key; raise it when a SECTION_BUILDERS entry
+# changes what it stores, so a deploy starts from fresh sections.
+STOREFRONT_SNAPSHOT_VERSION = 1
+
+PRODUCTS = "products"
+CATEGORIES = "categories"
+BLOG = "blog"
+BANNERS = "banners"
+
+# Which snapshot sections have to be rebuilt when a given model changes.
+SECTIONS_BY_MODEL = {
+    Product: (PRODUCTS, BANNERS),
+    Category: (PRODUCTS, CATEGORIES, BANNERS),
+    Banner: (BANNERS,),
+    Post: (BLOG,),
+    BlogCategory: (BLOG,),
+}
+
+
+def _section_key(section):
+    """
+    Returns the cache key of a snapshot section.
+
+    The products section embeds today's date because coupon validity is
+    evaluated per day, so a new day always starts with a fresh snapshot.
+    """
+    key = f"storefront:v{STOREFRONT_SNAPSHOT_VERSION}:{section}"
+    if section == PRODUCTS:
+        key = f"{key}:{timezone.now().date().isoformat()}"
+    return key
+
+
+def _build_products():
+    """
+    Loads the catalogue once and splits it into the homepage lists,
+    attaching the applicable coupon discount to every product.
+    """
+    products = list(
+        Product.objects.select_related("category").order_by(
+            "-created_at", "-updated_at", "-id"
+        )
+    )
+    CouponIndex.load().annotate(products)
+
+    visible_products = [product for product in products if product.visible]
+    just_arrived = [
+        product for product in visible_products if product.just_arrived
+    ]
+    prices = [product.price for product in products]
+
+    return {
+        "in_stock": [p for p in visible_products if p.in_stock],
+        "best_seller": [p for p in visible_products if p.best_seller],
+        "special_offer": [p for p in visible_products if p.special_offer],
+        "featured": [p for p in visible_products if p.featured],
+        "just_arrived": just_arrived,
+        "just_arrived2": sorted(
+            just_arrived, key=lambda p: p.id, reverse=True
+        ),
+        "all_products": visible_products,
+        # The active deal depends on the current time, so the candidates
+        # are cached and the live one is picked when the snapshot is read.
+        "deal_candidates": [
+            p for p in visible_products
+            if p.deal_of_the_week and p.deal_start_date and p.deal_end_date
+        ],
+        "min_max_price": {
+            "price__min": min(prices) if prices else None,
+            "price__max": max(prices) if prices else None,
+        },
+    }
+
+
+def _build_categories():
+    return {
+        "top_categories": list(
+            Category.objects.prefetch_related(
+                "subcategories__subcategories"
+            ).order_by("-id")
+        ),
+    }
+
+
+def _build_blog():
+    return {
+        "blog_categories": list(
+            BlogCategory.objects.all().order_by("-created_at")
+        ),
+        "blog_posts": list(Post.objects.all().order_by("-created_at")),
+    }
+
+
+def _build_banners():
+    return {
+        "banners": list(
+            Banner.objects.select_related(
+                "featured_product", "featured_category"
+            ).order_by("-created_at")
+        ),
+    }
+
+
+SECTION_BUILDERS = {
+    PRODUCTS: _build_products,
+    CATEGORIES: _build_categories,
+    BLOG: _build_blog,
+    BANNERS: _build_banners,
+}
+
+
+def get_section(section):
+    """
+    Returns a snapshot section from the cache, building and storing it
+    when it is missing.
+    """
+    key = _section_key(section)
+    data = cache.get(key)
+    if data is None:
+        logger.info(f"Building storefront snapshot section '{section}'.")
+        data = SECTION_BUILDERS[section]()
+        cache.set(key, data, settings.STOREFRONT_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_sections(*sections):
+    """
+    Drops the given snapshot sections once the current transaction commits,
+    so the next read rebuilds them from committed data.
+    """
+    keys = [_section_key(section) for section in sections]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_deal_product(deal_candidates):
+    """Returns the deal of the week that is running right now, if any."""
+    now = timezone.now()
+    return next(
+        (
+            product for product in deal_candidates
+            if product.deal_start_date <= now <= product.deal_end_date
+        ),
+        None,
+    )
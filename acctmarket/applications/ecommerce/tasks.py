@@ -0,0 +1,185 @@
+import logging
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from acctmarket.applications.ecommerce.models import (FulfilmentNotification,
+                                                      Payment)
+from acctmarket.utils import payments
+from acctmarket.utils.choices import FulfilmentNotificationKind
+
+logger = logging.getLogger(__name__)
+
+# Transient mail failures are retried with exponential backoff.
+MAIL_RETRY_OPTIONS = {
+    "autoretry_for": (SMTPException, OSError),
+    "retry_backoff": True,
+    "retry_backoff_max": 10 * 60,
+    "retry_jitter": True,
+    "max_retries": 8,
+}
+
+
+def _user_email(notification, purchased_products_url):
+    product_titles = notification.detail
+    if notification.kind == FulfilmentNotificationKind.INSUFFICIENT_KEYS:
+        return (
+            "Insufficient Product Keys",
+            f"We're sorry, but we do not have enough keys for '{product_titles}'. "  # noqa
+            f"We will contact you shortly.",
+        )
+    return (
+        "Your Purchase is Complete",
+        f"Thank you for your purchase. You can access your products here: {purchased_products_url}",  # noqa
+    )
+
+
+@shared_task(**MAIL_RETRY_OPTIONS)
+def send_order_notifications(order_id, purchased_products_url):
+    """
+    Sends the buyer every email still owed for an order.
+
+    Each notification is locked, mailed and marked sent in its own
+    transaction, so retries and duplicate deliveries of this task never
+    mail the same notification twice.
+    """
+    pending = FulfilmentNotification.objects.filter(
+        order_id=order_id,
+        user_notified_at__isnull=True,
+    ).values_list("pk", flat=True)
+
+    for pk in list(pending):
+        with transaction.atomic():
+            notification = (
+                FulfilmentNotification.objects.select_for_update(
+                    skip_locked=True, of=("self",),
+                )
+                .select_related("order__user")
+                .filter(pk=pk, user_notified_at__isnull=True)
+                .first()
+            )
+            if notification is None or notification.order.user is None:
+                continue
+
+            subject, message = _user_email(
+                notification, purchased_products_url,
+            )
+            send_mail(
+                subject,
+                message,
+                settings.DEFAULT_FROM_EMAIL,
+                [notification.order.user.email],
+                fail_silently=False,
+            )
+            notification.user_notified_at = timezone.now()
+            notification.save(update_fields=["user_notified_at"])
+
+
+def _digest_line(notification):
+    user = notification.order.user
+    buyer = f"{user.username} ({user.email})" if user else "unknown user"
+    if notification.kind == FulfilmentNotificationKind.INSUFFICIENT_KEYS:
+        return (
+            f"- ACTION REQUIRED: order #{notification.order_id} by {buyer} "
+            f"is missing keys for {notification.detail}. Please add more "
+            f"keys and update the order."
+        )
+    return f"- New purchase: order #{notification.order_id} by {buyer}."
+
+
+@shared_task(**MAIL_RETRY_OPTIONS)
+def send_admin_fulfilment_digest():
+    """
+    Mails the site admin one summary of every fulfilment they have not
+    heard about yet, instead of one email per purchase.
+    """
+    with transaction.atomic():
+        notifications = list(
+            FulfilmentNotification.objects.select_for_update(
+                skip_locked=True, of=("self",),
+            )
+            .select_related("order__user")
+            .filter(admin_notified_at__isnull=True)
+            .order_by("created_at")[:settings.FULFILMENT_DIGEST_BATCH_SIZE]
+        )
+        if not notifications:
+            return 0
+
+        send_mail(
+            f"Purchase digest: {len(notifications)} new notifications",
+            "\n".join(_digest_line(n) for n in notifications),
+            settings.DEFAULT_FROM_EMAIL,
+            [settings.EMAIL_HOST_USER],
+            fail_silently=False,
+        )
+        FulfilmentNotification.objects.filter(
+            pk__in=[notification.pk for notification in notifications],
+        ).update(admin_notified_at=timezone.now())
+
+    logger.info(f"Sent admin digest of {len(notifications)} notifications.")
+    return len(notifications)
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=5 * 60,
+    max_retries=5,
+)
+def refresh_exchange_rates():
+    """
+    Re-fetches the exchange rate table so payments read it from the cache.
+    Scheduled by beat and queued when a request finds the table stale.
+    """
+    entry = payments.refresh_exchange_rates()
+    logger.info(f"Refreshed {len(entry['rates'])} exchange rates.")
+
+
+@shared_task
+def process_webhook_events():
+    """
+    Drains the webhook inbox. Queued whenever a new event is received and
+    run by beat as a safety net for events whose queueing was lost.
+    """
+    # webhooks.py binds process_webhook_events from here while loading.
+    from acctmarket.applications.ecommerce import webhooks
+
+    attempted = webhooks.drain()
+    if attempted:
+        logger.info(f"Processed {attempted} webhook events.")
+    return attempted
+
+
+@shared_task
+def reverify_flutterwave_payment(payment_id, attempt):
+    """
+    Verifies a checkout payment Flutterwave had not listed yet, and
+    fulfils its order once it went through.
+    """
+    # services.py imports send_order_notifications from this module.
+    from acctmarket.applications.ecommerce.services import fulfil_order
+
+    payment = Payment.objects.select_related("order").get(pk=payment_id)
+    if payment.status != "processing":
+        return False
+    if not payment.verify_flutterwave_payment(attempt=attempt):
+        return False
+    fulfil_order(
+        payment.order,
+        f"{settings.SITE_URL}{reverse('ecommerce:purchased_products')}",
+    )
+    return True
+
+
+@shared_task
+def reverify_flutterwave_funding(payment_id, transaction_id, attempt):
+    """Verifies a wallet top-up Flutterwave had not listed yet."""
+    payment = Payment.objects.get(pk=payment_id)
+    if payment.status != "processing":
+        return payment.verified
+    return payment.verify_flutterwave_funding(transaction_id, attempt=attempt)
@@ -1 +1,888 @@
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from acctmarket.applications.ecommerce import (cart, search, storefront, tasks,
+                                               webhooks)
+from acctmarket.applications.ecommerce.context_processors import product_list
+from acctmarket.applications.ecommerce.models import (CartOrder,
+                                                      CartOrderItems, Category,
+                                                      Coupon,
+                                                      FulfilmentNotification,
+                                                      Payment, Product,
+                                                      ProductKey,
+                                                      ProductReview,
+                                                      WebhookEvent)
+from acctmarket.applications.ecommerce.services import (
+    allocate_order_keys, fulfil_order, get_or_create_draft_order,
+    record_fulfilment_notifications)
+from acctmarket.applications.ecommerce.tasks import (
+    send_admin_fulfilment_digest, send_order_notifications)
+from acctmarket.applications.refer.models import Notification
+from acctmarket.utils import payments
+from acctmarket.utils.choices import (COUPON_CHOICE, NOTIFICATION_TYPES_Choice,
+                                      WebhookEventStatus, WebhookProvider)
+from acctmarket.utils.coupon_discount import (CouponIndex, calculate_discount,
+                                              discount_breakdown)
+from acctmarket.utils.gateway import (CircuitOpenError, GatewayClient,
+                                      gateway_call_finished)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def category():
+    return Category.objects.create(title="Streaming")
+
+
+def make_product(category, **kwargs):
+    defaults = {
+        "title": "Netflix",
+        "price": Decimal("10.00"),
+        "oldprice": Decimal("12.00"),
+        "category": category,
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+def make_coupon(code, **kwargs):
+    today = timezone.now().date()
+    defaults = {
+        "code": code,
+        "discount_type": COUPON_CHOICE.PERCENTAGE,
+        "discount_value": Decimal("10.00"),
+        "usage_limit": 5,
+        "valid_from": today - timedelta(days=1),
+        "valid_to": today + timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    return Coupon.objects.create(**defaults)
+
+
+class TestCouponIndex:
+    def test_resolves_many_products_in_constant_queries(
+        self, category, django_assert_num_queries
+    ):
+        products = [
+            make_product(category, title=f"Product {i}") for i in range(5)
+        ]
+        coupon = make_coupon("CATEGORY10")
+        coupon.applicable_categories.add(category)
+
+        with django_assert_num_queries(3):
+            CouponIndex.load().annotate(products)
+
+        assert all(
+            product.discount_info["code"] == "CATEGORY10"
+            for product in products
+        )
+
+    def test_picks_the_largest_discount(self, category):
+        product = make_product(category, price=Decimal("100.00"))
+        make_coupon("ALL5", discount_value=Decimal("5.00"), universal=True)
+        fixed = make_coupon(
+            "FLAT20",
+            discount_type=COUPON_CHOICE.FIXED,
+            discount_value=Decimal("20.00"),
+        )
+        fixed.applicable_products.add(product)
+
+        discount = product.get_applicable_discount()
+
+        assert discount["code"] == "FLAT20"
+        assert discount["discount_value"] == Decimal("20.00")
+
+    def test_ignores_expired_and_used_up_coupons(self, category):
+        product = make_product(category)
+        yesterday = timezone.now().date() - timedelta(days=1)
+        make_coupon(
+            "EXPIRED",
+            universal=True,
+            valid_from=yesterday,
+            valid_to=yesterday,
+        )
+        used_up = make_coupon("USEDUP", universal=True, usage_limit=1)
+        Coupon.objects.filter(pk=used_up.pk).update(times_used=1)
+
+        assert product.get_applicable_discount() is None
+
+
+class TestDiscountBreakdown:
+    def cart_data(self, products, quantity=1):
+        return {
+            product.pk: {"price": str(product.price), "quantity": quantity}
+            for product in products
+        }
+
+    def test_large_cart_costs_constant_queries(
+        self, category, django_assert_num_queries
+    ):
+        other = Category.objects.create(title="Music")
+        products = [
+            make_product(category, title=f"Product {i}") for i in range(6)
+        ]
+        excluded = make_product(other, title="Spotify")
+        coupon = make_coupon("CATEGORY10")
+        coupon.applicable_categories.add(category)
+        cart_data = self.cart_data([*products, excluded], quantity=2)
+
+        with django_assert_num_queries(3):
+            breakdown = discount_breakdown(coupon, cart_data)
+        with django_assert_num_queries(0):
+            assert discount_breakdown(coupon, cart_data) == breakdown
+
+        assert set(breakdown["lines"]) == {product.pk for product in products}
+        assert breakdown["total"] == Decimal("12.00")
+
+    def test_flat_universal_coupon_is_spread_over_the_lines(self, category):
+        products = [
+            make_product(category, price=Decimal("10.00")) for _ in range(3)
+        ]
+        coupon = make_coupon(
+            "FLAT10",
+            universal=True,
+            discount_type=COUPON_CHOICE.FIXED,
+            discount_value=Decimal("10.00"),
+        )
+
+        breakdown = discount_breakdown(coupon, self.cart_data(products))
+
+        assert sorted(breakdown["lines"].values()) == [
+            Decimal("3.33"), Decimal("3.33"), Decimal("3.34"),
+        ]
+        assert breakdown["total"] == Decimal("10.00")
+
+    def test_retargeting_the_coupon_retires_cached_breakdowns(
+        self, category, django_capture_on_commit_callbacks
+    ):
+        product = make_product(category)
+        coupon = make_coupon("PRODUCT10")
+        cart_data = self.cart_data([product])
+        assert calculate_discount(coupon, cart_data) == Decimal("0.00")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            coupon.applicable_products.add(product)
+
+        assert calculate_discount(coupon, cart_data) == Decimal("1.00")
+
+
+class TestStorefrontSnapshot:
+    def test_context_processor_is_lazy(self, rf: RequestFactory,
+                                       django_assert_num_queries):
+        request = rf.get("/")
+        with django_assert_num_queries(0):
+            context = product_list(request)
+        assert "featured" in context
+
+    def test_section_is_served_from_cache(self, category,
+                                          django_assert_num_queries):
+        make_product(category, featured=True)
+        storefront.get_section(storefront.PRODUCTS)
+        with django_assert_num_queries(0):
+            section = storefront.get_section(storefront.PRODUCTS)
+        assert [p.title for p in section["featured"]] == ["Netflix"]
+        assert section["min_max_price"]["price__min"] == Decimal("10.00")
+
+    def test_product_save_rebuilds_products_section(
+        self, category, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            make_product(category, featured=True)
+        assert len(storefront.get_section(storefront.PRODUCTS)["featured"]) == 1  # noqa
+
+        with django_capture_on_commit_callbacks(execute=True):
+            make_product(category, title="Spotify", featured=True)
+        assert len(storefront.get_section(storefront.PRODUCTS)["featured"]) == 2  # noqa
+
+
+class TestProductSearch:
+    def test_ranks_title_matches_above_description_matches(self, category):
+        make_product(
+            category, title="Premium account", description="<p>Netflix</p>"
+        )
+        make_product(category, title="Netflix premium")
+
+        results = search.search_products("netflix")
+
+        assert [p.title for p in results] == [
+            "Netflix premium", "Premium account",
+        ]
+
+    def test_matches_tags_and_category(self, category):
+        product = make_product(category, title="Gift card")
+        product.tags.add("voucher")
+
+        assert list(search.search_products("voucher")) == [product]
+        assert list(search.search_products("streaming")) == [product]
+
+    def test_short_query_falls_back_to_prefix_match(self, category):
+        product = make_product(category)
+
+        assert list(search.search_products("ne")) == [product]
+        assert list(search.search_products("")) == []
+
+    def test_reindex_command(self, category):
+        product = make_product(category)
+        Product.objects.update(search_vector=None)
+
+        call_command("reindex_products", stdout=StringIO())
+
+        assert list(search.search_products("netflix")) == [product]
+
+
+class TestKeyAllocation:
+    def make_order(self, product, *quantities):
+        order = CartOrder.objects.create(price=Decimal("10.00"))
+        for quantity in quantities:
+            CartOrderItems.objects.create(
+                order=order,
+                product=product,
+                quantity=quantity,
+                price=product.price,
+                total=product.price * quantity,
+            )
+        return order
+
+    def stock_product(self, category, keys):
+        product = make_product(category)
+        for i in range(keys):
+            ProductKey.objects.create(
+                product=product, key=f"key-{i}", password=f"pass-{i}",
+            )
+        Product.objects.filter(pk=product.pk).update(quantity_in_stock=keys)
+        return product
+
+    def test_fills_every_item_and_decrements_stock(self, category):
+        product = self.stock_product(category, keys=4)
+        order = self.make_order(product, 2, 1)
+
+        shortfalls = allocate_order_keys(order)
+
+        assert shortfalls == []
+        assigned = [
+            key["key"]
+            for item in order.order_items.all()
+            for key in item.keys_and_passwords
+        ]
+        assert len(assigned) == len(set(assigned)) == 3
+        assert ProductKey.objects.filter(is_used=True).count() == 3
+        product.refresh_from_db()
+        assert product.quantity_in_stock == 1
+        assert product.visible
+
+    def test_partial_fulfilment_reports_shortfall(self, category):
+        product = self.stock_product(category, keys=1)
+        order = self.make_order(product, 2)
+
+        shortfalls = allocate_order_keys(order)
+
+        assert [item.quantity for item in shortfalls] == [2]
+        item = order.order_items.get()
+        assert item.keys_and_passwords == [
+            {"key": "key-0", "password": "pass-0"},
+        ]
+        product.refresh_from_db()
+        assert product.quantity_in_stock == 0
+        assert not product.visible
+
+
+class TestFulfilmentNotifications:
+    URL = "https://example.com/purchased/"
+
+    def fulfil(self, user, category, keys=1, quantity=1):
+        product = make_product(category)
+        for i in range(keys):
+            ProductKey.objects.create(
+                product=product, key=f"key-{i}", password="secret",
+            )
+        order = CartOrder.objects.create(user=user, price=product.price)
+        CartOrderItems.objects.create(
+            order=order, product=product, quantity=quantity,
+            price=product.price, total=product.price * quantity,
+        )
+        record_fulfilment_notifications(order, allocate_order_keys(order))
+        return order
+
+    def test_user_is_emailed_once_per_order(self, user, category,
+                                            mailoutbox):
+        order = self.fulfil(user, category)
+
+        send_order_notifications(order.id, self.URL)
+        send_order_notifications(order.id, self.URL)
+        record_fulfilment_notifications(order, [])
+        send_order_notifications(order.id, self.URL)
+
+        assert [mail.subject for mail in mailoutbox] == [
+            "Your Purchase is Complete",
+        ]
+        assert self.URL in mailoutbox[0].body
+
+    def test_shortfall_emails_the_user(self, user, category, mailoutbox):
+        order = self.fulfil(user, category, keys=0)
+
+        send_order_notifications(order.id, self.URL)
+
+        assert sorted(mail.subject for mail in mailoutbox) == [
+            "Insufficient Product Keys", "Your Purchase is Complete",
+        ]
+
+    def test_admin_gets_one_digest(self, user, category, mailoutbox,
+                                   settings):
+        settings.EMAIL_HOST_USER = "admin@example.com"
+        first = self.fulfil(user, category)
+        second = self.fulfil(user, category, keys=0)
+
+        assert send_admin_fulfilment_digest() == 3
+        assert send_admin_fulfilment_digest() == 0
+
+        assert len(mailoutbox) == 1
+        assert f"order #{first.id}" in mailoutbox[0].body
+        assert "ACTION REQUIRED" in mailoutbox[0].body
+        assert f"order #{second.id}" in mailoutbox[0].body
+
+    def test_payment_is_notified_once(self, user, category, monkeypatch):
+        monkeypatch.setattr(
+            send_order_notifications, "delay", lambda *args: None,
+        )
+        product = make_product(category)
+        order = CartOrder.objects.create(user=user, price=product.price)
+        CartOrderItems.objects.create(
+            order=order, product=product, quantity=1,
+            price=product.price, total=product.price,
+        )
+
+        assert fulfil_order(order, self.URL)
+        assert not fulfil_order(order, self.URL)
+
+        assert list(
+            Notification.objects.values_list("user_id", "notification_type"),
+        ) == [(user.pk, NOTIFICATION_TYPES_Choice.PAYMENT_SUCCESS)]
+
+
+class TestGatewayClient:
+    @pytest.fixture
+    def client(self, settings):
+        settings.PAYMENT_GATEWAY_FAILURE_THRESHOLD = 2
+        settings.PAYMENT_GATEWAY_RESET_TIMEOUT = 60
+        return GatewayClient("test", "https://gateway.example.com")
+
+    def test_applies_timeouts_and_reports_latency(self, client, monkeypatch):
+        calls, metrics = [], []
+        response = requests.Response()
+        response.status_code = 200
+
+        def fake_request(method, url, **kwargs):
+            calls.append((method, url, kwargs))
+            return response
+
+        def on_call(sender, **kwargs):
+            metrics.append(kwargs)
+
+        monkeypatch.setattr(client.session, "request", fake_request)
+        gateway_call_finished.connect(on_call)
+        try:
+            client.get("/ping")
+        finally:
+            gateway_call_finished.disconnect(on_call)
+
+        method, url, kwargs = calls[0]
+        assert url == "https://gateway.example.com/ping"
+        assert kwargs["timeout"] == (3.05, 10)
+        assert metrics[0]["provider"] == "test"
+        assert metrics[0]["status_code"] == 200
+        assert metrics[0]["elapsed"] >= 0
+
+    def test_circuit_opens_after_repeated_failures(self, client, monkeypatch):
+        attempts = []
+
+        def failing_request(method, url, **kwargs):
+            attempts.append(url)
+            raise requests.exceptions.ConnectTimeout()
+
+        monkeypatch.setattr(client.session, "request", failing_request)
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectTimeout):
+                client.get("/ping")
+
+        with pytest.raises(CircuitOpenError):
+            client.get("/ping")
+        assert len(attempts) == 2
+
+
+class TestFlutterwaveReverification:
+    @pytest.fixture
+    def gateway(self, monkeypatch, settings):
+        settings.FLUTTERWAVE_VERIFY_RETRY_AFTER = 7
+        state = {"status": "pending", "retry_after": 7}
+        monkeypatch.setattr(
+            payments.Flutterwave, "verify_payment",
+            lambda self, *args: dict(state),
+        )
+        monkeypatch.setattr(
+            "acctmarket.applications.ecommerce.models.get_exchange_rate",
+            lambda: Decimal("1500"),
+        )
+        return state
+
+    @pytest.fixture
+    def queued(self, monkeypatch):
+        calls = []
+        for task in (
+            tasks.reverify_flutterwave_payment,
+            tasks.reverify_flutterwave_funding,
+        ):
+            monkeypatch.setattr(
+                task, "apply_async",
+                lambda args, countdown: calls.append((args, countdown)),
+            )
+        return calls
+
+    def test_unlisted_checkout_payment_is_fulfilled_later(
+        self, client, user, category, gateway, queued, monkeypatch,
+        django_capture_on_commit_callbacks,
+    ):
+        monkeypatch.setattr(
+            send_order_notifications, "delay", lambda *args: None,
+        )
+        product = make_product(category)
+        order, payment = get_or_create_draft_order(user, {product.pk: 1})
+        order.payment_method = "flutterwave"
+        order.save()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.get(
+                reverse("ecommerce:verify_payment", args=[payment.reference]),
+            )
+
+        assert "pages/payment_pending.html" in [
+            template.name for template in response.templates
+        ]
+        assert queued == [((payment.pk, 2), 7)]
+
+        gateway["status"] = "success"
+        assert tasks.reverify_flutterwave_payment(payment.pk, 2)
+        order.refresh_from_db()
+        assert order.paid_status
+        assert FulfilmentNotification.objects.filter(order=order).exists()
+
+    def test_unlisted_wallet_top_up_is_credited_once(
+        self, client, user, gateway, queued,
+        django_capture_on_commit_callbacks,
+    ):
+        client.force_login(user)
+        session = client.session
+        session["original_amount"] = "10.00"
+        session.save()
+        url = reverse("referals:flutterwave_callback")
+        params = {"status": "successful", "transaction_id": "42"}
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.get(url, params)
+
+        assert response.status_code == 200
+        payment = Payment.objects.get(reference="flutterwave_42")
+        assert queued == [((payment.pk, "42", 2), 7)]
+
+        gateway["status"] = "success"
+        assert tasks.reverify_flutterwave_funding(payment.pk, "42", 2)
+        response = client.get(url, params)
+
+        assert response.status_code == 302
+        assert user.wallet.transactions.count() == 1
+        user.wallet.refresh_from_db()
+        assert user.wallet.balance == Decimal("10.00")
+
+
+class TestExchangeRates:
+    @pytest.fixture
+    def api_calls(self, monkeypatch):
+        calls = []
+
+        def fake_get(url, **kwargs):
+            calls.append(url)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"conversion_rates": {"NGN": 1500.5}}'
+            return response
+
+        monkeypatch.setattr(payments.exchange_rate_client, "get", fake_get)
+        return calls
+
+    def test_rates_are_fetched_once_and_cached(self, api_calls):
+        assert payments.get_exchange_rate() == Decimal("1500.5")
+        assert payments.get_exchange_rate("NGN") == Decimal("1500.5")
+        assert len(api_calls) == 1
+
+    def test_stale_rates_are_served_while_refresh_is_queued(
+        self, api_calls, monkeypatch, settings
+    ):
+        queued = []
+        monkeypatch.setattr(
+            tasks.refresh_exchange_rates, "delay", lambda: queued.append(1),
+        )
+        payments.refresh_exchange_rates()
+        settings.EXCHANGE_RATE_FRESH_FOR = -1
+
+        assert payments.get_exchange_rate() == Decimal("1500.5")
+        assert payments.get_exchange_rate() == Decimal("1500.5")
+
+        assert len(api_calls) == 1
+        assert len(queued) == 1
+
+
+class TestWebhookInbox:
+    @pytest.fixture(autouse=True)
+    def queued(self, monkeypatch):
+        queued = []
+        monkeypatch.setattr(
+            tasks.process_webhook_events, "delay", lambda: queued.append(1),
+        )
+        monkeypatch.setattr(
+            tasks.send_order_notifications, "delay",
+            lambda *args: queued.append(args),
+        )
+        return queued
+
+    def make_payment(self, user, category):
+        product = make_product(category)
+        ProductKey.objects.create(product=product, key="key-0", password="pw")
+        order = CartOrder.objects.create(user=user, price=product.price)
+        CartOrderItems.objects.create(
+            order=order, product=product, quantity=1,
+            price=product.price, total=product.price,
+        )
+        return Payment.objects.create(
+            user=user, order=order, amount=product.price, reference="tx-1",
+        )
+
+    def flutterwave_event(self, status="successful"):
+        return {"data": {"id": 42, "tx_ref": "tx-1", "status": status}}
+
+    def test_duplicate_deliveries_are_stored_once(
+        self, django_capture_on_commit_callbacks, queued
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            assert webhooks.ingest(
+                WebhookProvider.FLUTTERWAVE, "42:successful",
+                self.flutterwave_event(),
+            )
+            assert not webhooks.ingest(
+                WebhookProvider.FLUTTERWAVE, "42:successful",
+                self.flutterwave_event(),
+            )
+
+        assert WebhookEvent.objects.count() == 1
+        assert queued == [1]
+
+    def test_successful_payment_is_fulfilled_once(self, user, category):
+        payment = self.make_payment(user, category)
+        webhooks.ingest(
+            WebhookProvider.FLUTTERWAVE, "42:successful",
+            self.flutterwave_event(),
+        )
+        webhooks.ingest(
+            WebhookProvider.FLUTTERWAVE, "43:successful",
+            self.flutterwave_event(),
+        )
+
+        assert webhooks.drain() == 2
+        assert webhooks.drain() == 0
+
+        payment.refresh_from_db()
+        assert payment.verified
+        assert payment.order.paid_status
+        assert ProductKey.objects.filter(is_used=True).count() == 1
+        assert FulfilmentNotification.objects.filter(
+            order=payment.order,
+        ).count() == 1
+        assert set(
+            WebhookEvent.objects.values_list("status", flat=True)
+        ) == {WebhookEventStatus.PROCESSED}
+
+    def test_failing_event_is_retried_until_attempts_run_out(self, settings):
+        settings.WEBHOOK_MAX_ATTEMPTS = 2
+        webhooks.ingest(
+            WebhookProvider.FLUTTERWAVE, "42:successful",
+            self.flutterwave_event(),
+        )
+
+        assert webhooks.drain() == 1
+        event = WebhookEvent.objects.get()
+        assert event.status == WebhookEventStatus.PENDING
+        assert event.attempts == 1
+        assert "does not exist" in event.last_error
+
+        webhooks.drain()
+        event.refresh_from_db()
+        assert event.status == WebhookEventStatus.FAILED
+        assert event.attempts == 2
+
+
+class TestCart:
+    def test_cart_keeps_ids_and_quantities_only(self, client, category):
+        product = make_product(category, price=Decimal("4.00"))
+
+        response = client.get(
+            reverse("ecommerce:add_to_cart"),
+            {"id": product.pk, "qty": 3, "price": "0.01", "title": "x"},
+        )
+
+        assert response.json()["totalcartitems"] == 1
+        item = response.json()["data"][product.pk]
+        assert item["title"] == product.title
+        assert item["price"] == "4.00"
+        assert item["quantity"] == 3
+        assert "cart_data_obj" not in client.session
+        cart_key = f"cart:{client.session[cart.CART_SESSION_KEY]}"
+        assert cache.get(cart_key) == {product.pk: 3}
+
+    def test_update_and_delete_recompute_total(self, client, category):
+        first = make_product(category, price=Decimal("4.00"))
+        second = make_product(category, price=Decimal("2.50"))
+        for product in (first, second):
+            client.get(reverse("ecommerce:add_to_cart"), {"id": product.pk})
+
+        response = client.get(
+            "/ecommerce/update-to-cart", {"id": first.pk, "quantity": 2},
+        )
+        assert response.json()["totalcartitems"] == 2
+        assert "$10.50" in response.json()["data"]
+
+        response = client.get(
+            "/ecommerce/delete-from-cart", {"id": first.pk},
+        )
+        assert response.json()["totalcartitems"] == 1
+        assert "$2.50" in response.json()["data"]
+
+    def test_unknown_product_is_rejected(self, client):
+        response = client.get(
+            reverse("ecommerce:add_to_cart"), {"id": "missing"},
+        )
+
+        assert response.status_code == 404
+
+    def test_product_lookup_is_cached_until_the_product_changes(
+        self, category, django_assert_num_queries
+    ):
+        product = make_product(category, price=Decimal("4.00"))
+        cart.get_cart_products([product.pk])
+
+        with django_assert_num_queries(0):
+            assert cart.get_cart_products([product.pk])[product.pk][
+                "price"
+            ] == Decimal("4.00")
+
+        product.price = Decimal("5.00")
+        product.save()
+        assert cart.get_cart_products([product.pk])[product.pk][
+            "price"
+        ] == Decimal("5.00")
+
+
+class TestDraftOrders:
+    def test_unchanged_cart_reuses_the_pending_order(self, user, category):
+        product = make_product(category, price=Decimal("4.00"))
+
+        order, payment = get_or_create_draft_order(user, {product.pk: 2})
+        again, same_payment = get_or_create_draft_order(
+            user, {product.pk: 2},
+        )
+
+        assert (again, same_payment) == (order, payment)
+        assert order.price == Decimal("8.00")
+        assert CartOrder.objects.count() == 1
+        assert order.order_items.get().total == Decimal("8.00")
+
+    def test_changed_cart_or_price_drafts_a_new_order(self, user, category):
+        product = make_product(category, price=Decimal("4.00"))
+        first, _ = get_or_create_draft_order(user, {product.pk: 1})
+
+        second, _ = get_or_create_draft_order(user, {product.pk: 3})
+        product.price = Decimal("5.00")
+        product.save()
+        third, _ = get_or_create_draft_order(user, {product.pk: 3})
+
+        assert len({first.pk, second.pk, third.pk}) == 3
+        assert third.price == Decimal("15.00")
+
+    def test_attempted_payment_retires_the_draft(self, user, category):
+        product = make_product(category)
+        order, payment = get_or_create_draft_order(user, {product.pk: 1})
+        Payment.objects.filter(pk=payment.pk).update(status="failed")
+
+        retry, retry_payment = get_or_create_draft_order(
+            user, {product.pk: 1},
+        )
+
+        assert retry.pk != order.pk
+        assert retry_payment.status == "pending"
+        order.refresh_from_db()
+        assert order.cart_fingerprint == ""
+
+    def test_initiated_payment_retires_the_draft(self, user, category):
+        product = make_product(category)
+        order, payment = get_or_create_draft_order(user, {product.pk: 1})
+        Payment.objects.filter(pk=payment.pk).update(
+            initiated_at=timezone.now(),
+        )
+
+        retry, retry_payment = get_or_create_draft_order(
+            user, {product.pk: 1},
+        )
+
+        assert retry.pk != order.pk
+        assert retry_payment.reference != payment.reference
+
+    def test_proceeding_reuses_the_discounted_checkout_draft(
+        self, client, user, category,
+    ):
+        product = make_product(category, price=Decimal("10.00"))
+        make_coupon("TENOFF", universal=True)
+        client.force_login(user)
+        client.get(reverse("ecommerce:add_to_cart"), {"id": product.pk})
+        session = client.session
+        session["applied_coupon"] = "TENOFF"
+        session.save()
+
+        client.get(reverse("ecommerce:checkout"))
+        client.get(reverse("ecommerce:proceed_payment"))
+
+        order = CartOrder.objects.get()
+        assert order.price == Decimal("9.00")
+
+
+class TestRatingAggregates:
+    def test_reviews_update_the_product_aggregates(self, user, category):
+        product = make_product(category)
+        first = ProductReview.objects.create(
+            user=user, product=product, review="Great", rating=5,
+        )
+        second = ProductReview.objects.create(
+            user=user, product=product, review="Fine", rating=2,
+        )
+
+        product.refresh_from_db()
+        assert product.rating_count == 2
+        assert product.rating_average == Decimal("3.50")
+        assert product.rating_histogram == {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}
+
+        second.rating = 4
+        second.save()
+        first.delete()
+
+        product.refresh_from_db()
+        assert product.rating_count == 1
+        assert product.rating_sum == 4
+        assert product.rating_average == Decimal("4.00")
+        assert product.rating_histogram == {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}
+
+    def test_last_review_removed_resets_the_average(self, user, category):
+        product = make_product(category)
+        review = ProductReview.objects.create(
+            user=user, product=product, review="Meh", rating=3,
+        )
+
+        review.delete()
+
+        product.refresh_from_db()
+        assert (product.rating_count, product.rating_average) == (0, 0)
+
+    def test_saving_an_outdated_copy_keeps_the_totals(self, user, category):
+        product = make_product(category)
+        outdated = Product.objects.get(pk=product.pk)
+        ProductReview.objects.create(
+            user=user, product=product, review="Great", rating=5,
+        )
+
+        outdated.title = "Renamed"
+        outdated.save()
+
+        product.refresh_from_db()
+        assert product.title == "Renamed"
+        assert (product.rating_count, product.rating_sum) == (1, 5)
+        assert product.rating_average == Decimal("5.00")
+        assert product.rating_histogram[5] == 1
+
+
+class TestQueryBudgets:
+    def buy(self, user, product, count):
+        for _ in range(count):
+            order = CartOrder.objects.create(
+                user=user, price=product.price, paid_status=True,
+            )
+            CartOrderItems.objects.create(
+                order=order,
+                product=product,
+                quantity=1,
+                price=product.price,
+                total=product.price,
+            )
+
+    def test_purchased_products_do_not_grow_with_orders(
+        self, client, query_budget, category, user,
+    ):
+        client.force_login(user)
+        url = reverse("ecommerce:purchased_products")
+        product = make_product(category)
+        self.buy(user, product, 1)
+        # The first visit rebuilds the storefront snapshot in the header.
+        query_budget(url, 8)
+        small = query_budget(url, 6)
+
+        self.buy(user, make_product(category, title="Spotify"), 10)
+        large = query_budget(url, 6)
+
+        assert large.queries == small.queries
+
+
+@pytest.mark.usefixtures("seqscan_disabled")
+class TestQueryPatternIndexes:
+    def test_key_allocation_uses_unused_keys_index(self, category):
+        product = make_product(category)
+        plan = (
+            ProductKey.objects.filter(product_id=product.pk, is_used=False)
+            .order_by("created_at")
+            .explain()
+        )
+        assert "productkey_unused_idx" in plan
+
+    def test_purchased_orders_use_user_paid_index(self, user):
+        plan = CartOrder.objects.filter(user=user, paid_status=True).explain()
+        assert "cartorder_user_paid_idx" in plan
+
+    def test_coupon_validity_uses_index(self):
+        today = timezone.now().date()
+        plan = Coupon.objects.filter(
+            valid_from__lte=today, valid_to__gte=today,
+        ).explain()
+        assert "coupon_validity_idx" in plan
+
+    def test_shop_listing_uses_visible_index(self):
+        plan = (
+            Product.objects.filter(visible=True)
+            .order_by("-created_at", "-id")[:20]
+            .explain()
+        )
+        assert "product_visible_recent_idx" in plan
+
+    def test_price_facet_uses_purchasable_index(self):
+        plan = Product.objects.filter(
+            in_stock=True, digital=True, price__gte=Decimal("5.00"),
+        ).explain()
+        assert "product_purchasable_price_idx" in plan
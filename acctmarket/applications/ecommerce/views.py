@@ -11,7 +11,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import send_mail  # noqa
 from django.db import transaction
 # from django.core.exceptions import ValidationError
-from django.db.models import Avg, Count, F, Q
+from django.db.models import Count, F, Q
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
@@ -23,6 +23,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (CreateView, DeleteView, FormView, ListView,
                                   TemplateView, UpdateView, View)
 
+from acctmarket.applications.ecommerce import services, webhooks
+from acctmarket.applications.ecommerce.cart import Cart, get_cart_products
 from acctmarket.applications.ecommerce.forms import (CategoryForm, ProductForm,
                                                      ProductImagesForm,
                                                      ProductKeyFormSet,
@@ -32,15 +34,16 @@ from acctmarket.applications.ecommerce.models import (CartOrder,
                                                       Coupon, Payment, Product,
                                                       ProductImages,
                                                       ProductReview, WishList)
-from acctmarket.applications.refer.models import (Notification, Wallet,
-                                                  WalletTransaction)
-from acctmarket.utils.choices import ProductStatus, WalletTransactionTypeChoice
+from acctmarket.applications.refer.models import Wallet
+from acctmarket.utils.choices import ProductStatus, WebhookProvider
 from acctmarket.utils.coupon_discount import (calculate_discount,
                                               validate_coupon)
 from acctmarket.utils.mixins import (ContentManagerRequiredMixin,
+                                     CursorPaginationMixin,
                                      InitiatePaymentBaseView,
                                      PaymentVerificationMixin)
-from acctmarket.utils.payments import NowPayment
+from acctmarket.utils.payments import (NowPayment, nowpayments_client,
+                                       paystack_client)
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +59,9 @@ class AddCategoryView(ContentManagerRequiredMixin, CreateView):
     success_url = reverse_lazy("ecommerce:list_category")
 
 
-class ListCategoryView(ContentManagerRequiredMixin, ListView):
+class ListCategoryView(
+    ContentManagerRequiredMixin, CursorPaginationMixin, ListView,
+):
     """
     A view for listing all categories.
     """
@@ -64,12 +69,10 @@ class ListCategoryView(ContentManagerRequiredMixin, ListView):
     model = Category
     template_name = "pages/ecommerce/category_list.html"
     paginate_by = 10
+    approximate_count = True
 
     def get_queryset(self):
-        return Category.objects.annotate(
-            total_products=Count("product")).order_by(
-            "-created_at",
-        )
+        return Category.objects.annotate(total_products=Count("product"))
 
 
 class EditCategoryView(ContentManagerRequiredMixin, UpdateView):
@@ -126,7 +129,9 @@ class DeleteProductImages(ContentManagerRequiredMixin, DeleteView):
     success_url = reverse_lazy("ecommerce:list_product_images")
 
 
-class ListProductView(ContentManagerRequiredMixin, ListView):
+class ListProductView(
+    ContentManagerRequiredMixin, CursorPaginationMixin, ListView,
+):
     """
     A view for listing all products.
     """
@@ -134,6 +139,7 @@ class ListProductView(ContentManagerRequiredMixin, ListView):
     model = Product
     template_name = "pages/ecommerce/product_list.html"
     paginate_by = 10
+    approximate_count = True
 
 
 class AddProductView(LoginRequiredMixin, CreateView):
@@ -276,15 +282,15 @@ class AddReviewsView(LoginRequiredMixin, CreateView):
 
         # Check if the user is authenticated and if the user has
         # added a review already
-        product = form.instance.product
-
         form.instance.user = self.request.user
         form.instance.product = Product.objects.get(pk=self.kwargs["pk"])
         self.object = form.save()
 
-        average_review = ProductReview.objects.filter(product=product).aggregate(   # noqa
-            rating=Avg("rating"),
+        # The review signals keep the product's rating aggregates current.
+        product = Product.objects.only("rating_average").get(
+            pk=self.kwargs["pk"],
         )
+        average_review = {"rating": float(product.rating_average)}
 
         context = {
             "user": self.request.user.name,
@@ -316,7 +322,7 @@ class AddReviewsView(LoginRequiredMixin, CreateView):
 class AddToCartView(View):
     def get(self, request, *args, **kwargs):
         """
-        Adds a product to the cart session data.
+        Adds a product to the visitor's cart.
 
         Parameters:
             request (HttpRequest): The HTTP request object.
@@ -328,55 +334,67 @@ class AddToCartView(View):
             data and the total number of items in the cart.
 
         Description:
-            This function is used to add a product to the cart session data.
-            It takes the request object as a parameter,
-            along with any additional arguments and keyword arguments.
-            The function retrieves the product details from the request
-            GET parameters
-            and creates a dictionary representation of the product.
-            It then checks if there is already a cart data object
-            in the session.
-            If there is, it updates the quantity of the product
-            if it already exists in the cart, otherwise
-            it adds the product to the cart data. Finally,
-            it returns a JSON response containing the updated
-            cart data and the total number of items in the cart.
+            Sets the quantity of the product given by the ``id`` and
+            ``qty`` GET parameters. Only the product id and quantity are
+            stored; the title, price and image are always read from the
+            product itself, whatever the request sends.
         """
+        product_id = str(request.GET.get("id"))
+        logger.debug("Request data: %s", request.GET)
 
-        cart_product = {
-            str(request.GET.get("id")): {
-                "title": request.GET.get("title"),
-                "quantity": request.GET.get("qty"),
-                "price": request.GET.get("price"),
-                "image": request.GET.get("image"),
-                "pid": request.GET.get("id"),
-            },
-        }
+        if not get_cart_products([product_id]):
+            return JsonResponse(
+                {"status": "error", "message": "Product not found."},
+                status=404,
+            )
 
-        logger.debug("Request data: %s", request.GET)
-        logger.debug("ProductsID (pid): %s", request.GET.get("product_id"))
-
-        if "cart_data_obj" in request.session:
-            cart_data = request.session["cart_data_obj"]
-            product_id = str(request.GET.get("id"))
-            if product_id in cart_data:
-                cart_data[product_id]["quantity"] = int(
-                    cart_product[product_id]["quantity"],
-                )
-            else:
-                cart_data.update(cart_product)
-            request.session["cart_data_obj"] = cart_data
-        else:
-            request.session["cart_data_obj"] = cart_product
+        cart = Cart(request)
+        cart.set(product_id, _cart_quantity(request.GET.get("qty")))
 
         return JsonResponse(
             {
-                "data": request.session["cart_data_obj"],
-                "totalcartitems": len(request.session["cart_data_obj"]),
+                "data": _cart_json(cart),
+                "totalcartitems": len(cart),
             },
         )
 
 
+def _cart_quantity(value, default=1):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _cart_json(cart):
+    return {
+        product_id: {
+            **item,
+            "price": str(item["price"]),
+            "subtotal": str(item["subtotal"]),
+        }
+        for product_id, item in cart.items.items()
+    }
+
+
+def _cart_list_response(cart):
+    """Renders the cart table fragment returned by the cart AJAX views."""
+    context = render_to_string(
+        "pages/async/cart_list.html",
+        {
+            "cart_data": cart.items,
+            "totalcartitems": len(cart),
+            "cart_total_amount": cart.total,
+        },
+    )
+    return JsonResponse(
+        {
+            "data": context,
+            "totalcartitems": len(cart),
+        },
+    )
+
+
 # ---------------------------  ----------------------------------
 # ---------------------- Add to cart  ends here ----------------
 
@@ -385,13 +403,9 @@ class CartListView(TemplateView):
     """
     A view that displays the cart items and calculates the total amount.
 
-    This view retrieves the cart data from the session and calculates
-    the total amount
-    based on the quantity and price of each item in the cart. It then renders
-      the
+    This view reads the visitor's cart and renders the
     "pages/ecommerce/cart_list.html" template, passing the cart data, total
-    cart items,
-    and total amount as context variables.
+    cart items, and total amount as context variables.
     """
 
     template_name = "pages/ecommerce/cart_list.html"
@@ -401,10 +415,8 @@ class CartListView(TemplateView):
         Handles GET requests and checks if the cart is empty.
         Redirects to the home page with a warning message if the cart is empty.
         """
-        if (
-            "cart_data_obj" not in request.session
-            or not request.session["cart_data_obj"]
-        ):
+        self.cart = Cart(request)
+        if not self.cart:
             messages.warning(
                 request, "Your cart is empty add products to your cart."
             )
@@ -420,21 +432,15 @@ class CartListView(TemplateView):
 
         Returns:
             dict: The context data containing the following keys:
-                - cart_data (dict): The cart data stored in the session.
+                - cart_data (dict): The items in the cart.
                 - totalcartitems (int): The total number of items in the cart.
-                - cart_total_amount (float): The total amount of the items
+                - cart_total_amount (Decimal): The total amount of the items
                 in the cart.
         """
         context = super().get_context_data(**kwargs)
-        cart_total_amount = 0
-        cart_data = self.request.session["cart_data_obj"]
-
-        for product_id, item in cart_data.items():
-            cart_total_amount += int(item["quantity"]) * float(item["price"])
-
-        context["cart_data"] = cart_data
-        context["totalcartitems"] = len(cart_data)
-        context["cart_total_amount"] = cart_total_amount
+        context["cart_data"] = self.cart.items
+        context["totalcartitems"] = len(self.cart)
+        context["cart_total_amount"] = self.cart.total
 
         return context
 
@@ -447,75 +453,18 @@ class DeleteFromCartView(View):
     """
     View to handle removing a product from the
     user's shopping cart.
-    The cart is stored in the session, and the item is removed
-    based on its product_id.
-    After removing the item, it calculates the total price
-    of the remaining cart items and returns
-    the updated cart data as a JSON response.
+    After removing the item, it returns the re-rendered cart
+    and the number of remaining items as a JSON response.
     """
     def get(self, request, *args, **kwargs):
         """
         Handles the GET request to remove an item from the cart.
-        It retrieves the product_id from the request and removes
-        the item from the session-based cart.
-        It also calculates the total cart amount
-        and renders the updated cart content.
-        """
-
-        # Get the product ID from the request
-        product_id = str(request.GET.get("id"))
-        # Remove the item from the cart
-        self.remove_item_from_cart(request, product_id)
-        # Calculate the updated cart total amount
-        cart_total_amount = self.calculate_cart_total(request)
-
-        context = render_to_string(
-            "pages/async/cart_list.html",
-            {
-                "cart_data": request.session.get("cart_data_obj", {}),
-                "totalcartitems": len(request.session.get(
-                    "cart_data_obj", {})),
-                "cart_total_amount": cart_total_amount,
-            },
-        )
-        # Return the updated cart content and the
-        # total number of items as a JSON response
-        return JsonResponse(
-            {
-                "data": context,
-                "totalcartitems": len(request.session.get(
-                    "cart_data_obj", {})),
-            },
-        )
-
-    def remove_item_from_cart(self, request, product_id):
-        """
-        Removes a specific item from the cart stored in the session.
-        If the product exists in the cart,
-        it deletes the product from the cart.
-        """
-        if "cart_data_obj" in request.session:
-            cart_data = request.session["cart_data_obj"]
-            # Remove the product from the cart
-            if product_id in cart_data:
-                del cart_data[product_id]
-                # Save the updated cart to the session
-                request.session["cart_data_obj"] = cart_data
-
-    def calculate_cart_total(self, request):
-        """
-        Calculates the total amount of the cart
-        based on the items and their quantities.
-        Returns the total cart amount as a float.
+        It retrieves the product_id from the request, removes
+        the item from the cart and renders the updated cart content.
         """
-        cart_total_amount = 0
-        if "cart_data_obj" in request.session:
-            for item in request.session["cart_data_obj"].values():
-                # Multiply quantity by price for each item
-                # and add to the total cart amount
-                cart_total_amount += int(
-                    item["quantity"]) * float(item["price"])
-        return cart_total_amount
+        cart = Cart(request)
+        cart.remove(str(request.GET.get("id")))
+        return _cart_list_response(cart)
 
 
 # ---------------------------  ----------------------------------
@@ -526,68 +475,53 @@ class UpdateCartView(View):
     """
     View to handle updating the quantity of a product
     in the user's shopping cart.
-    The cart is stored in the session,
-    and the quantity of an item is updated based on
-    the given product_id.
-    After updating the quantity, it calculates the total price
-    of the cart and returns the updated data as a JSON response.
+    After updating the quantity, it returns the re-rendered cart
+    and the number of items as a JSON response.
     """
     def get(self, request, *args, **kwargs):
         """
         Handles the GET request to update the quantity
         of an item in the cart.
         It retrieves the product_id and the new quantity
-        from the request and updates the item in the cart.
-        It also calculates the updated total cart
-        amount and renders the updated cart content.
+        from the request, updates the item in the cart and
+        renders the updated cart content.
         """
-        # Get the product ID from the request
         product_id = str(request.GET.get("id"))
-        # Get the new quantity for the product (default to 1)
-        new_quantity = int(request.GET.get("quantity", 1))
-        self.update_item_in_cart(request, product_id, new_quantity)
-        # Calculate the updated cart total amount
-        cart_total_amount = self.calculate_cart_total(request)
-
-        context = render_to_string(
-            "pages/async/cart_list.html",
-            {
-                "cart_data": request.session.get("cart_data_obj", {}),
-                "totalcartitems": len(request.session.get(
-                    "cart_data_obj", {})),
-                "cart_total_amount": cart_total_amount,
-            },
-        )
-        # Return the updated cart content
-        # and the total number of items as a JSON response
-        return JsonResponse(
-            {
-                "data": context,
-                "totalcartitems": len(request.session.get(
-                    "cart_data_obj", {})),
-            },
-        )
-
-    def update_item_in_cart(self, request, product_id, new_quantity):
-        if "cart_data_obj" in request.session:
-            cart_data = request.session["cart_data_obj"]
-            if product_id in cart_data:
-                cart_data[product_id]["quantity"] = new_quantity
-                request.session["cart_data_obj"] = cart_data
-
-    def calculate_cart_total(self, request):
-        cart_total_amount = 0
-        if "cart_data_obj" in request.session:
-            for item in request.session["cart_data_obj"].values():
-                cart_total_amount += int(
-                    item["quantity"]) * float(item["price"])
-        return cart_total_amount
+        cart = Cart(request)
+        # Only products already in the cart can be updated.
+        if product_id in cart.items:
+            cart.set(
+                product_id, _cart_quantity(request.GET.get("quantity")),
+            )
+        return _cart_list_response(cart)
 
 
 # ---------------------------  ----------------------------------
 # ---------------------- Update Cart  ends here ----------------
 
 
+def applied_coupon_discount(request, cart_data):
+    """
+    Returns the ``(discount, message)`` of the coupon applied in the
+    session, dropping it from the session when it is no longer valid.
+    """
+    applied_coupon_code = request.session.get("applied_coupon")
+    if not applied_coupon_code:
+        return Decimal("0.00"), None
+    try:
+        coupon = Coupon.objects.get(code=applied_coupon_code)
+    except ObjectDoesNotExist:
+        messages.error(request, "Invalid coupon. Removing it from your session.")  # noqa
+        del request.session["applied_coupon"]
+        return Decimal("0.00"), None
+    if not coupon.is_valid():
+        messages.error(request, "The applied coupon is no longer valid.")
+        del request.session["applied_coupon"]
+        return Decimal("0.00"), None
+    discount = calculate_discount(coupon, cart_data)
+    return discount, f"Coupon '{applied_coupon_code}' applied successfully!"  # noqa
+
+
 class CheckoutView(LoginRequiredMixin, TemplateView):
     """
     A view for the checkout process, including applying discounts and
@@ -598,20 +532,13 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        cart_data = self.request.session.get("cart_data_obj", {})
+        cart = Cart(self.request)
+        cart_data = cart.items
         if not cart_data:
             messages.error(self.request, "Your cart is empty.")
             return redirect("ecommerce:cart_list")
 
-        # Calculate the total cart amount
-        cart_total_amount = sum(
-            Decimal(item["price"]) * int(item["quantity"]) for item in cart_data.values()  # noqa
-        )
-
-        # Coupon logic
-        applied_coupon_code = self.request.session.get("applied_coupon")
-        discount = Decimal("0.00")
-        coupon_message = None  # Message to display on the front-end
+        cart_total_amount = cart.total
 
         # Check if any valid coupons exist in the database
         valid_coupons = Coupon.objects.filter(
@@ -623,64 +550,34 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
         # Set whether there are any valid coupons
         show_coupon_form = valid_coupons.exists()
 
-        if applied_coupon_code:
-            try:
-                coupon = Coupon.objects.get(code=applied_coupon_code)
-                if coupon.is_valid():
-                    discount = calculate_discount(coupon, cart_data)
-                    coupon_message = f"Coupon '{applied_coupon_code}' applied successfully!" # noqa
-                else:
-                    messages.error(self.request, "The applied coupon is no longer valid.")  # noqa
-                    del self.request.session["applied_coupon"]
-            except ObjectDoesNotExist:
-                messages.error(self.request, "Invalid coupon. Removing it from your session.")  # noqa
-                del self.request.session["applied_coupon"]
-
-        # Update cart total after applying the discount
-        cart_total_amount -= discount
+        discount, coupon_message = applied_coupon_discount(
+            self.request, cart_data,
+        )
 
         wallet = get_object_or_404(Wallet, user=self.request.user)
-        wallet_balance = wallet.balance
-        can_pay_with_wallet = wallet_balance >= cart_total_amount
 
-        # Create order and payment (unchanged from your original code)
-        with transaction.atomic():
-            try:
-                order = CartOrder.objects.create(
-                    user=self.request.user,
-                    price=cart_total_amount,
-                    paid_status=False,
-                    payment_method="wallet",
-                )
-
-                payment = Payment.objects.create(
-                    order=order,
-                    amount=cart_total_amount,
-                    wallet=wallet,
-                    status="pending",
-                    user=self.request.user,
-                )
-
-                order_items = [
-                    CartOrderItems(
-                        order=order,
-                        product=get_object_or_404(Product, id=product_id),
-                        invoice_no=f"INVOICE_NO_{order.id}",
-                        quantity=int(item["quantity"]),
-                        price=Decimal(item["price"]),
-                        total=Decimal(item["price"]) * int(item["quantity"]),
-                    )
-                    for product_id, item in cart_data.items()
-                ]
-                CartOrderItems.objects.bulk_create(order_items)
+        # Re-rendering the checkout reuses the pending draft order of an
+        # unchanged cart instead of creating another one.
+        try:
+            order, payment = services.get_or_create_draft_order(
+                self.request.user,
+                cart.quantities,
+                discount=discount,
+                wallet=wallet,
+                payment_method="wallet",
+            )
+        except Exception as e:
+            logging.error(f"Error during checkout: {e}")
+            messages.error(self.request, "An error occurred during checkout.")  # noqa
+            return redirect("ecommerce:cart_list")
 
-                self.request.session['order_id'] = order.id
-                self.request.session['payment_id'] = payment.id
+        if self.request.session.get("payment_id") != payment.id:
+            self.request.session['order_id'] = order.id
+            self.request.session['payment_id'] = payment.id
 
-            except Exception as e:
-                logging.error(f"Error during checkout: {e}")
-                messages.error(self.request, "An error occurred during checkout.")  # noqa
-                return redirect("ecommerce:cart_list")
+        cart_total_amount = order.price
+        wallet_balance = wallet.balance
+        can_pay_with_wallet = wallet_balance >= cart_total_amount
 
         # Update context with necessary data
         context.update({
@@ -703,7 +600,7 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
 class ApplyCouponView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         coupon_code = request.POST.get("coupon_code")
-        cart_data = self.request.session.get("cart_data_obj", {})
+        cart_data = Cart(self.request).items
 
         if not cart_data:
             messages.error(self.request, "Your cart is empty.")
@@ -760,14 +657,10 @@ class WalletPaymentView(PaymentVerificationMixin, View):
         try:
             with transaction.atomic():
                 # Verify wallet payment
+                # The debit and its wallet transaction are recorded by
+                # the ledger.
                 if payment.verify_wallet_payment(request):
 
-                    # Record the transaction (debit)
-                    wallet = payment.wallet
-                    WalletTransaction.record_transaction(
-                        wallet, payment.amount,
-                        WalletTransactionTypeChoice.DEBIT)
-
                     # Update the CartOrder's paid status
                     order: CartOrder = payment.order
                     order.paid_status = True
@@ -799,38 +692,16 @@ class ProceedPayment(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart_data = self.request.session.get(
-            "cart_data_obj",
-            {},
-        )  # Fetch cart data from session
-
-        # Calculate total cart amount
-        cart_total_amount = sum(
-            Decimal(item["price"]) * int(item["quantity"])
-            for item in cart_data.values()
-        )
-
-        # Create an order in the database
-        order = CartOrder.objects.create(
-            user=self.request.user,
-            price=cart_total_amount,
-            paid_status=False,
+        cart = Cart(self.request)
+        cart_data = cart.items
+
+        # Reuses the pending draft order the checkout drafted for this
+        # cart, which the applied coupon is part of.
+        discount, _message = applied_coupon_discount(self.request, cart_data)
+        order, _payment = services.get_or_create_draft_order(
+            self.request.user, cart.quantities, discount=discount,
         )
-
-        # Create order items in the database
-        order_items = [
-            CartOrderItems(
-                order=order,
-                product=get_object_or_404(Product, id=product_id),
-                invoice_no=f"INVOICE_NO_{order.id}",
-                quantity=int(item["quantity"]),
-                price=Decimal(item["price"]),
-                total=Decimal(item["price"]) * int(item["quantity"]),
-            )
-            for product_id, item in cart_data.items()
-        ]
-
-        CartOrderItems.objects.bulk_create(order_items)
+        cart_total_amount = order.price
 
         user = self.request.user
         # Update context with necessary data
@@ -880,12 +751,19 @@ class InitiatePaystackPaymentView(InitiatePaymentBaseView):
             ),
         }
 
-        response = requests.post(
-            "https://api.paystack.co/transaction/initialize",
-            headers=headers,
-            json=data,
-        )
-        response_data = response.json()
+        try:
+            response = paystack_client.post(
+                "/transaction/initialize",
+                headers=headers,
+                json=data,
+            )
+            response_data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Error initializing Paystack payment: {e}")
+            messages.error(
+                request, "Paystack is unavailable right now, please try again shortly.",  # noqa
+            )
+            return redirect("ecommerce:checkout")
 
         if response_data.get("status") is True:
             authorization_url = response_data["data"]["authorization_url"]
@@ -981,10 +859,12 @@ class HandleFlutterwavePaymentView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class FlutterwaveWebhookView(View, PaymentVerificationMixin):
+class FlutterwaveWebhookView(View):
     def post(self, request, *args, **kwargs):
         """
-        Handles Flutterwave webhook notifications for payment status updates.
+        Receives Flutterwave payment status updates into the webhook inbox.
+        The update itself is applied by the inbox worker, so Flutterwave
+        gets its 200 straight away and never retries a slow delivery.
         """
         # Step 1: Verify the request
         if not self.verify_webhook(request):
@@ -996,7 +876,7 @@ class FlutterwaveWebhookView(View, PaymentVerificationMixin):
             data = json.loads(request.body)
             tx_ref = data["data"]["tx_ref"]
             status = data["data"]["status"]
-        except (json.JSONDecodeError, KeyError) as e:
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
             logging.error(f"Error parsing webhook data: {e}")
             return JsonResponse(
                 {
@@ -1004,24 +884,13 @@ class FlutterwaveWebhookView(View, PaymentVerificationMixin):
                 }, status=400
             )
 
-        # Step 3: Look for the Payment instance by transaction reference (tx_ref)  # noqa
-        payment = get_object_or_404(Payment, reference=tx_ref)
-        logging.info(f"Processing payment for tx_ref: {tx_ref}, status: {status}")  # noqa
-
-        # Step 4: Handle payment status
-        if status == "successful":
-            # Reuse existing method
-            return self.assign_keys_and_notify(payment)
-        elif status == "pending":
-            return self.handle_pending_payment(payment)
-        elif status == "failed":
-            return self.handle_failed_payment(payment)
-        else:
-            return JsonResponse(
-                {
-                    "status": "error", "message": "Unknown status received"
-                }, status=400
-            )
+        # Step 3: Store the event; a status change is a new event,
+        # a redelivery of the same one is ignored.
+        transaction_id = data["data"].get("id") or tx_ref
+        webhooks.ingest(
+            WebhookProvider.FLUTTERWAVE, f"{transaction_id}:{status}", data,
+        )
+        return JsonResponse({"status": "received"}, status=200)
 
     def verify_webhook(self, request):
         """
@@ -1038,28 +907,6 @@ class FlutterwaveWebhookView(View, PaymentVerificationMixin):
 
         return True
 
-    def handle_pending_payment(self, payment):
-        payment.status = "pending"
-        payment.save()
-        messages.info(
-            None,
-            "Payment is pending, we will notify you once it's confirmed."
-        )
-        return JsonResponse(
-            {"status": "pending", "message": "Payment is pending."},
-            status=200
-        )
-
-    def handle_failed_payment(self, payment):
-        payment.status = "failed"
-        payment.save()
-        messages.error(None, "Payment failed, please try again.")
-        return JsonResponse(
-            {
-                "status": "failed", "message": "Payment failed."
-            }, status=200
-        )
-
 
 class VerifyPaymentView(View, PaymentVerificationMixin):
     """
@@ -1088,6 +935,14 @@ class VerifyPaymentView(View, PaymentVerificationMixin):
 
         if verified:
             return self.assign_keys_and_notify(request, payment)
+        elif payment.status == "processing":
+            # Flutterwave has not listed the transaction yet; a task
+            # verifies it again and fulfils the order.
+            return render(
+                request,
+                "pages/payment_pending.html",
+                {"continue_url": reverse("ecommerce:purchased_products")},
+            )
         else:
             messages.error(request, "Verification failed no flutter")
             return redirect("ecommerce:payment_failed")
@@ -1181,7 +1036,11 @@ class NowPaymentView(View):
         url = f"{nowpayment.api_url}/currencies"
 
         headers = {"x-api-key": nowpayment.api_key}
-        response = requests.get(url, headers=headers)
+        try:
+            response = nowpayments_client.get(url, headers=headers)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error fetching NOWPayments currencies: {e}")
+            return []
 
         if response.status_code == 200:
             return response.json().get("currencies", [])
@@ -1251,50 +1110,22 @@ class NowPaymentView(View):
 class IPNView(View):
     def post(self, request, *args, **kwargs):
         """
-        Handle IPN (Instant Payment Notification)
-        from NOWPayments.
+        Receive IPN (Instant Payment Notification) from NOWPayments into
+        the webhook inbox; the inbox worker verifies and applies it.
         """
-        data = json.loads(request.body)
-        order_id = data.get("order_id")
-        messages.info(
-            request,
-            f"IPN received for order ID: {order_id}"
-        )
-
         try:
-            order = get_object_or_404(CartOrder, id=order_id)
-            payment = order.payment
-
-            if not payment:
-                messages.error(
-                    request,
-                    "Payment not found for order."
-                )
-                return JsonResponse({
-                    "status": "error",
-                    "message": "Payment not found for order"
-                }, status=404)
-
-            verify_payment_view = VerifyNowPaymentView()
-            response = verify_payment_view.verify_and_process_payment(
-                request, payment.reference
+            data = json.loads(request.body)
+            order_id = data["order_id"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logging.error(f"Error parsing IPN data: {e}")
+            return JsonResponse(
+                {"status": "error", "message": "Invalid payload"},
+                status=400,
             )
 
-            if response.status_code == 302 and "payment_complete" in response.url:   # noqa
-                return JsonResponse({
-                    "status": "success",
-                    "redirect_url": response.url
-                })
-            else:
-                return JsonResponse({
-                    "status": "failed",
-                    "redirect_url": response.url
-                }, status=400)
-        except Exception as e:
-            messages.error(request, f"IPN processing error: {e}")
-            return JsonResponse({
-                "status": "error",
-                "message": str(e)}, status=500)
+        event_id = f"{data.get('payment_id') or order_id}:{data.get('payment_status')}"  # noqa
+        webhooks.ingest(WebhookProvider.NOWPAYMENTS, event_id, data)
+        return JsonResponse({"status": "received"}, status=200)
 
 
 class PaymentCompleteView(LoginRequiredMixin, TemplateView):
@@ -1321,16 +1152,6 @@ class PaymentCompleteView(LoginRequiredMixin, TemplateView):
                         kwargs={"order_id": order.id}
                     )
 
-                # Create a notification for payment success
-                if payment.verified:
-                    Notification.objects.create(
-                        user=user,
-                        message=f"Your payment for order #{order.id} has been successfully processed.",  # noqa
-                        notification_type='payment_success'
-                    )
-                    context["payment_status"] = payment.status
-                    context["payment_id"] = payment.id
-
                 # Add payment details to context
                 context["payment_status"] = payment.status
                 context["payment_id"] = payment.id
@@ -1348,22 +1169,17 @@ class PaymentCompleteView(LoginRequiredMixin, TemplateView):
                 if 'payment_id' in self.request.session:
                     del self.request.session['payment_id']
 
-        # Calculate total cart amount from session data
-        cart_data_obj = self.request.session.get("cart_data_obj", {})
-        cart_total_amount = sum(
-            Decimal(item["quantity"]) * Decimal(item["price"]) for item in cart_data_obj.values()  # noqa
-        )
+        cart = Cart(self.request)
 
         # Add cart details to context
         context.update({
-            "cart_data": cart_data_obj,
-            "total_cart_items": len(cart_data_obj),
-            "cart_total_amount": cart_total_amount,
+            "cart_data": cart.items,
+            "total_cart_items": len(cart),
+            "cart_total_amount": cart.total,
         })
 
-        # Clear the cart session data upon payment completion
-        if 'cart_data_obj' in self.request.session:
-            del self.request.session['cart_data_obj']
+        # Clear the cart upon payment completion
+        cart.clear()
 
         return context
 
@@ -1373,9 +1189,9 @@ class PaymentFailedView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart_data_obj = self.request.session.get("cart_data_obj", {})
-        context["cart_data"] = cart_data_obj
-        context["totalcartitems"] = len(cart_data_obj)
+        cart = Cart(self.request)
+        context["cart_data"] = cart.items
+        context["totalcartitems"] = len(cart)
         return context
 
 
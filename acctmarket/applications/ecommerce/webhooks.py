@@ -0,0 +1,156 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from acctmarket.applications.ecommerce.models import Payment, WebhookEvent
+from acctmarket.applications.ecommerce.services import fulfil_order
+from acctmarket.applications.ecommerce.tasks import process_webhook_events
+from acctmarket.utils.choices import WebhookEventStatus, WebhookProvider
+from acctmarket.utils.payments import NowPayment
+
+logger = logging.getLogger(__name__)
+
+
+def ingest(provider, event_id, payload):
+    """
+    Stores a provider notification in the inbox and queues the drain task
+    once it is committed. Returns False for an event already received.
+    """
+    event, created = WebhookEvent.objects.get_or_create(
+        provider=provider,
+        event_id=str(event_id),
+        defaults={"payload": payload},
+    )
+    if created:
+        transaction.on_commit(process_webhook_events.delay)
+    else:
+        logger.info(f"Duplicate {provider} webhook event {event_id} ignored.")
+    return created
+
+
+def _purchased_products_url():
+    return f"{settings.SITE_URL}{reverse('ecommerce:purchased_products')}"
+
+
+def _mark_paid(payment):
+    if not payment.verified:
+        payment.status = "verified"
+        payment.verified = True
+        payment.save(update_fields=["status", "verified"])
+        payment.order.paid_status = True
+        payment.order.save(update_fields=["paid_status"])
+
+
+def handle_flutterwave(payload):
+    """A Flutterwave charge update for a checkout payment."""
+    data = payload["data"]
+    payment = Payment.objects.select_for_update(of=("self",)).select_related(
+        "order",
+    ).get(reference=data["tx_ref"])
+
+    if data["status"] == "successful":
+        _mark_paid(payment)
+        fulfil_order(payment.order, _purchased_products_url())
+    elif data["status"] in ("pending", "failed") and not payment.verified:
+        payment.status = data["status"]
+        payment.save(update_fields=["status"])
+
+
+def handle_nowpayments(payload):
+    """A NOWPayments IPN for a checkout payment, re-verified with the API."""
+    payment = Payment.objects.select_for_update(of=("self",)).select_related(
+        "order",
+    ).get(order_id=payload["order_id"])
+
+    success, result = NowPayment().verify_payment(int(payment.payment_id))
+    if not success:
+        raise RuntimeError(result)
+
+    payment_status = result.get("payment_status")
+    if payment_status == "confirmed":
+        _mark_paid(payment)
+        fulfil_order(payment.order, _purchased_products_url())
+    elif payment_status in ("failed", "expired") and not payment.verified:
+        payment.status = "failed"
+        payment.save(update_fields=["status"])
+
+
+def handle_nowpayments_wallet(payload):
+    """A NOWPayments IPN for a wallet top-up, re-verified with the API."""
+    payment = Payment.objects.select_for_update(of=("self",)).select_related(
+        "wallet",
+    ).get(payment_id=payload["payment_id"])
+    if payment.status == "completed":
+        return
+
+    success, result = NowPayment().verify_payment(payload["payment_id"])
+    if not success:
+        raise RuntimeError(result)
+
+    if result.get("payment_status") == "finished":
+        payment.status = "completed"
+        payment.verified = True
+        payment.save(update_fields=["status", "verified"])
+        payment.wallet.credit_wallet(payment.amount)
+        logger.info(
+            f"Payment ID {payment.payment_id} verified and wallet credited with {payment.amount}."  # noqa
+        )
+
+
+HANDLERS = {
+    WebhookProvider.FLUTTERWAVE: handle_flutterwave,
+    WebhookProvider.NOWPAYMENTS: handle_nowpayments,
+    WebhookProvider.NOWPAYMENTS_WALLET: handle_nowpayments_wallet,
+}
+
+
+def process_event(event):
+    """
+    Runs the handler of one locked inbox event. A failing handler rolls
+    back its own work; the event is retried by later drains until it runs
+    out of attempts.
+    """
+    event.attempts += 1
+    try:
+        with transaction.atomic():
+            HANDLERS[event.provider](event.payload)
+    except Exception as e:
+        logger.exception(
+            f"Error processing {event.provider} event {event.event_id}: {e}"
+        )
+        event.last_error = str(e)
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            event.status = WebhookEventStatus.FAILED
+    else:
+        event.status = WebhookEventStatus.PROCESSED
+        event.processed_at = timezone.now()
+        event.last_error = ""
+    event.save(
+        update_fields=["attempts", "status", "processed_at", "last_error"],
+    )
+
+
+def drain(batch_size=None):
+    """
+    Processes pending inbox events oldest first and returns how many were
+    attempted. Workers draining concurrently skip each other's batches, and
+    an event that fails is not retried again within the same drain.
+    """
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    attempted = []
+    while True:
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=WebhookEventStatus.PENDING)
+                .exclude(pk__in=attempted)
+                .order_by("created_at")[:batch_size]
+            )
+            if not events:
+                return len(attempted)
+            for event in events:
+                process_event(event)
+                attempted.append(event.pk)
@@ -1 +1,280 @@
-# Create your tests here.
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from acctmarket.applications.ecommerce.models import (Category, Coupon,
+                                                      Product, ProductReview)
+from acctmarket.applications.home.views import (ProductFilterView,
+                                                ProductShopListView)
+from acctmarket.utils.choices import COUPON_CHOICE
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def category():
+    return Category.objects.create(title="Streaming")
+
+
+@pytest.fixture
+def universal_coupon():
+    today = timezone.now().date()
+    return Coupon.objects.create(
+        code="EVERYTHING",
+        discount_type=COUPON_CHOICE.PERCENTAGE,
+        discount_value=Decimal("10.00"),
+        universal=True,
+        usage_limit=5,
+        valid_from=today - timedelta(days=1),
+        valid_to=today + timedelta(days=1),
+    )
+
+
+def make_products(category, count):
+    for i in range(count):
+        Product.objects.create(
+            title=f"Product {i}",
+            price=Decimal("10.00"),
+            oldprice=Decimal("12.00"),
+            category=category,
+        )
+
+
+def shop_list_page(rf: RequestFactory):
+    response = ProductShopListView.as_view()(rf.get("/shop"))
+    return response.context_data["all_products"]
+
+
+class TestDiscountedPagination:
+    def test_only_the_page_is_annotated(self, rf, category, universal_coupon):
+        make_products(category, 12)
+
+        page = shop_list_page(rf)
+
+        assert len(page) == ProductShopListView.paginate_by
+        assert all(
+            product.discount_info["code"] == "EVERYTHING" for product in page
+        )
+
+    def test_page_queries_do_not_grow_with_catalogue(
+        self, rf, category, universal_coupon
+    ):
+        make_products(category, ProductShopListView.paginate_by)
+        with CaptureQueriesContext(connection) as small_catalogue:
+            shop_list_page(rf)
+
+        make_products(category, 30)
+        with CaptureQueriesContext(connection) as large_catalogue:
+            shop_list_page(rf)
+
+        assert len(large_catalogue) == len(small_catalogue)
+
+
+class TestProductFilterFacets:
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        cache.clear()
+        yield
+        cache.clear()
+
+    def filter_response(self, rf, **params):
+        response = ProductFilterView.as_view()(
+            rf.get("/filter-product/", params),
+        )
+        return json.loads(response.content)
+
+    def test_returns_page_with_category_and_price_counts(self, rf, category):
+        games = Category.objects.create(title="Games")
+        make_products(category, 3)
+        Product.objects.create(
+            title="Steam", price=Decimal("60.00"),
+            oldprice=Decimal("70.00"), category=games,
+        )
+
+        payload = self.filter_response(
+            rf, **{"category[]": [games.id], "max_price": "100"}
+        )
+
+        assert "Steam" in payload["data"]
+        assert "Product 0" not in payload["data"]
+        # The category facet ignores the selected category.
+        assert {
+            facet["title"]: facet["count"]
+            for facet in payload["facets"]["categories"]
+        } == {"Games": 1, "Streaming": 3}
+        buckets = {
+            bucket["min"]: bucket["count"]
+            for bucket in payload["facets"]["price_buckets"]
+        }
+        assert buckets["50"] == 1
+        assert buckets["10"] == 0
+
+    def test_repeated_filters_are_served_from_cache(
+        self, rf, category, django_assert_num_queries
+    ):
+        make_products(category, 3)
+        self.filter_response(rf, min_price="1")
+
+        # Only the product page itself is queried again.
+        with django_assert_num_queries(2):
+            payload = self.filter_response(rf, min_price="1.0")
+
+        assert payload["facets"]["categories"][0]["count"] == 3
+
+    def test_pages_through_every_match(self, rf, category, monkeypatch):
+        make_products(category, 3)
+        monkeypatch.setattr(ProductFilterView, "paginate_by", 2)
+
+        first = self.filter_response(rf)
+        second = self.filter_response(rf, page=first["page"] + 1)
+
+        assert first["has_next"] is True
+        assert second["has_next"] is False
+        assert second["data"].count("product-single") == 1
+        assert second["facets"] == first["facets"]
+
+
+class TestProductReviews:
+    def test_reviews_are_paged_by_cursor(self, client, category, user,
+                                         settings):
+        settings.REVIEWS_PAGE_SIZE = 2
+        product = Product.objects.create(
+            title="Netflix",
+            price=Decimal("10.00"),
+            oldprice=Decimal("12.00"),
+            category=category,
+        )
+        for rating in (1, 2, 3, 4, 5):
+            ProductReview.objects.create(
+                user=user, product=product, review="ok", rating=rating,
+            )
+        url = reverse("homeapp:product_detail", args=[product.pk])
+
+        seen = []
+        cursor = ""
+        while True:
+            reviews = client.get(url, {"reviews_cursor": cursor}).context[
+                "reviews"
+            ]
+            seen.extend(review.rating for review in reviews)
+            if not reviews.has_next():
+                break
+            cursor = reviews.next_cursor
+
+        assert seen == [5, 4, 3, 2, 1]
+        previous = client.get(
+            url, {"reviews_cursor": reviews.previous_cursor},
+        ).context["reviews"]
+        assert [review.rating for review in previous] == [3, 2]
+
+    def test_shop_can_be_sorted_by_rating(self, rf, category, user):
+        make_products(category, 3)
+        best = Product.objects.get(title="Product 1")
+        ProductReview.objects.create(
+            user=user, product=best, review="Top", rating=5,
+        )
+
+        response = ProductShopListView.as_view()(
+            rf.get("/shop", {"sort": "rating"}),
+        )
+
+        assert response.context_data["all_products"][0] == best
+
+
+class TestQueryBudgets:
+    def test_home_page(self, client, query_budget, category, user):
+        make_products(category, 5)
+        client.force_login(user)
+        url = reverse("homeapp:home")
+
+        # The first visit rebuilds the storefront snapshot.
+        query_budget(url, 10)
+        warm = query_budget(url, 5)
+
+        assert warm.cache_misses == 0
+
+    def test_shop_list_does_not_grow_with_catalogue(
+        self, client, query_budget, category, user,
+    ):
+        client.force_login(user)
+        url = reverse("homeapp:shop_list")
+        make_products(category, 3)
+        small = query_budget(url, 7)
+
+        make_products(category, 30)
+        large = query_budget(url, 7)
+
+        assert large.queries == small.queries
+
+    def test_product_detail_does_not_grow_with_reviews(
+        self, client, query_budget, category, user,
+    ):
+        client.force_login(user)
+        make_products(category, 2)
+        product = Product.objects.first()
+        url = reverse("homeapp:product_detail", args=[product.pk])
+        ProductReview.objects.create(
+            user=user, product=product, review="ok", rating=4,
+        )
+        small = query_budget(url, 10)
+
+        make_products(category, 20)
+        ProductReview.objects.bulk_create(
+            ProductReview(user=user, product=product, review="ok", rating=3)
+            for _ in range(20)
+        )
+        large = query_budget(url, 10)
+
+        assert large.queries == small.queries
+
+
+class TestRequestMetrics:
+    def test_metrics_headers(self, client, settings, request_metrics):
+        settings.REQUEST_METRICS_HEADERS = True
+
+        response = client.get(reverse("homeapp:home"))
+
+        metrics = request_metrics[-1]
+        assert response["X-Query-Count"] == str(metrics.queries)
+        assert f'desc="{metrics.queries} queries"' in response[
+            "Server-Timing"
+        ]
+
+    def test_headers_are_off_by_default(self, client):
+        response = client.get(reverse("homeapp:home"))
+
+        assert "Server-Timing" not in response
+
+    def test_cache_reads_and_templates_are_measured(
+        self, client, request_metrics,
+    ):
+        cache.clear()
+        url = reverse("homeapp:home")
+        client.get(url)
+        cold = request_metrics[-1]
+        client.get(url)
+        warm = request_metrics[-1]
+
+        assert cold.cache_misses > 0
+        assert warm.cache_hits > 0
+        assert warm.queries < cold.queries
+        assert warm.template_time > 0
+        assert warm.sql_time > 0
+
+    def test_sampled_requests_are_logged(self, client, settings, caplog):
+        settings.REQUEST_METRICS_SAMPLE_RATE = 1.0
+
+        with caplog.at_level("INFO", logger="acctmarket.utils.metrics"):
+            client.get(reverse("homeapp:home"))
+
+        record = caplog.records[-1]
+        assert record.path == reverse("homeapp:home")
+        assert record.queries > 0
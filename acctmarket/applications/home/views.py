@@ -2,6 +2,7 @@ from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
+from django.core.paginator import Paginator
 from django.db import DatabaseError
 from django.db.models import Q
 from django.http import JsonResponse
@@ -13,12 +14,20 @@ from django.views.generic import (DetailView, FormView, ListView, TemplateView,
                                   View)
 
 from acctmarket.applications.blog.models import Announcement
+from acctmarket.applications.ecommerce.facets import (RATING_ORDERING,
+                                                      filter_products,
+                                                      get_facets,
+                                                      normalise_filters)
 from acctmarket.applications.ecommerce.forms import ProductReviewForm
 from acctmarket.applications.ecommerce.models import (CartOrder,
                                                       CartOrderItems, Category,
                                                       Product, ProductImages,
                                                       ProductReview)
+from acctmarket.applications.ecommerce.search import search_products
 from acctmarket.applications.home.forms import ContactForm
+from acctmarket.applications.users import roles
+from acctmarket.utils.mixins import CursorPaginationMixin, DiscountedPageMixin
+from acctmarket.utils.pagination import keyset_page
 
 # Create your views here.
 
@@ -43,7 +52,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     )  # Assuming "login" is the name of the login URL pattern
 
     def dispatch(self, request, *args, **kwargs):
-        if not request.user.administrator_profile.exists():
+        if not roles.has_role(request.user, roles.ADMINISTRATOR):
             # If the user is not an administrator,
             # redirect them to another page
             return redirect(
@@ -54,27 +63,21 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         return super().dispatch(request, *args, **kwargs)
 
 
-class ProductShopListView(ListView):
+class ProductShopListView(
+    DiscountedPageMixin, CursorPaginationMixin, ListView,
+):
     model = Product
     template_name = "pages/shop_lists.html"
     paginate_by = 8
     context_object_name = "all_products"
 
     def get_queryset(self):
-        # Add ordering to the queryset
-        products = Product.objects.filter(visible=True).order_by("id")
-        for product in products:
-            product.discount_info = product.get_applicable_discount()
-            print(f" shoplist Discount info for {product.title}: {product.discount_info}")  # noqa
-        return products
+        return Product.objects.filter(visible=True)
 
-    def get_context_data(self, **kwargs):
-        """Add pagination context data."""
-        context = super().get_context_data(**kwargs)
-        context["page_obj"] = context["paginator"].page(
-            context["page_obj"].number,
-        )  # Set page_obj
-        return context
+    def get_cursor_ordering(self):
+        if self.request.GET.get("sort") == "rating":
+            return RATING_ORDERING
+        return super().get_cursor_ordering()
 
     # Add filter functionality
     def post(self, request, *args, **kwargs):
@@ -85,21 +88,28 @@ class ProductShopDetailView(DetailView):
     model = Product
     template_name = "pages/shop_details.html"
     context_object_name = "product"
+    queryset = Product.objects.select_related("category")
+    related_products_limit = 8
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
-        category = product.category
+        product = self.object
 
         # fetching the product images
         product_images = ProductImages.objects.filter(product=product)
         # related products in the same category
-        related_products = Product.objects.filter(category=category).exclude(
-            id=product.id,
+        related_products = (
+            Product.objects.filter(category_id=product.category_id)
+            .exclude(id=product.id)
+            .select_related("category")[:self.related_products_limit]
         )
-        # reviews for the products
-        product_reviews = ProductReview.objects.filter(product=product).order_by(   # noqa
-            "-created_at",
+        # reviews for the product, one keyset page at a time
+        product_reviews = keyset_page(
+            ProductReview.objects.filter(product=product).select_related(
+                "user",
+            ),
+            cursor=self.request.GET.get("reviews_cursor"),
+            size=settings.REVIEWS_PAGE_SIZE,
         )
 
         review_form = ProductReviewForm()
@@ -123,7 +133,7 @@ class ProductShopDetailView(DetailView):
         return context
 
 
-class ProductsCategoryList(ListView):
+class ProductsCategoryList(DiscountedPageMixin, ListView):
     model = Product
     template_name = "pages/shop_by_category.html"
     context_object_name = "products"
@@ -132,20 +142,14 @@ class ProductsCategoryList(ListView):
     def get_queryset(self):
         # Get the category based on the slug in the URL
         category_slug = self.kwargs.get("category_slug")
-        print("cccccccccc", category_slug)
 
         # Safely get the category or return 404 if not found
         category = get_object_or_404(Category, slug=category_slug)
-        print(category, "xxxx")
 
         # Filter products based on the category or its subcategories
-        products = Product.objects.filter(
+        return Product.objects.filter(
             Q(category=category) | Q(category__sub_category=category)
         ).distinct().order_by("-created_at")
-        for product in products:
-            product.discount_info = product.get_applicable_discount()
-            print(f" shoplist Discount info for {product.title}: {product.discount_info}")  # noqa
-        return products
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -166,7 +170,7 @@ class ProductsCategoryList(ListView):
         return ProductFilterView.as_view()(request, *args, **kwargs)
 
 
-class ProductTagsList(ListView):
+class ProductTagsList(DiscountedPageMixin, ListView):
     model = Product
     template_name = "pages/shop_by_tag.html"
     context_object_name = "products"
@@ -182,7 +186,7 @@ class ProductTagsList(ListView):
         return ProductFilterView.as_view()(request, *args, **kwargs)
 
 
-class ProductSearchView(ListView):
+class ProductSearchView(DiscountedPageMixin, ListView):
     model = Product
     template_name = "pages/product_search.html"
     context_object_name = "all_products"
@@ -190,17 +194,7 @@ class ProductSearchView(ListView):
 
     def get_queryset(self):
         query = self.request.GET.get("q")
-        return Product.objects.filter(
-            title__icontains=query,
-        )
-
-    def get_context_data(self, **kwargs):
-        """Add pagination context data."""
-        context = super().get_context_data(**kwargs)
-        context["page_obj"] = context["paginator"].page(
-            context["page_obj"].number,
-        )  # Set page_obj
-        return context
+        return search_products(query, Product.objects.all())
 
     # Add filter functionality
     def post(self, request, *args, **kwargs):
@@ -208,41 +202,36 @@ class ProductSearchView(ListView):
 
 
 class ProductFilterView(View):
+    paginate_by = 24
+
     # Handle GET requests
     def get(self, request, *args, **kwargs):
-        # Get the filter criteria from the request
-        categories = request.GET.getlist("category[]")
-        min_price = request.GET.get("min_price")
-        max_price = request.GET.get("max_price")
+        # Normalise the filter criteria so equal filters share cached facets
+        filters = normalise_filters(request.GET)
 
         try:
-            # Filter products that are in stock and digital
-            products = Product.objects.filter(in_stock=True, digital=True)
-
-            # Apply the minimum price filter if provided
-            if min_price is not None and min_price != "":
-                min_price = float(min_price)
-                products = products.filter(price__gte=min_price)
-
-            # Apply the maximum price filter if provided
-            if max_price is not None and max_price != "":
-                max_price = float(max_price)
-                products = products.filter(price__lte=max_price)
-
-            # Apply the category filter if provided
-            if categories:
-                products = products.filter(category__id__in=categories)
-
-            # Prepare the context with the filtered products
-            context = {"products": products}
-
-            # Log the context data for debugging
+            products = filter_products(filters).select_related("category")
+            if request.GET.get("sort") == "rating":
+                products = products.order_by(*RATING_ORDERING)
+            page = Paginator(products, self.paginate_by).get_page(
+                request.GET.get("page"),
+            )
 
             # Render the HTML for the filtered products using a template
-            data = render_to_string("pages/async/product_filter.html", context)
+            data = render_to_string(
+                "pages/async/product_filter.html",
+                {"products": page.object_list},
+            )
 
-            # Return the rendered HTML as a JSON response
-            return JsonResponse({"data": data})
+            # Return the rendered HTML and the sidebar counts as JSON
+            return JsonResponse(
+                {
+                    "data": data,
+                    "facets": get_facets(filters),
+                    "page": page.number,
+                    "has_next": page.has_next(),
+                }
+            )
 
         except (ValidationError, DatabaseError):
             # Log the error for debugging
@@ -3,8 +3,10 @@ import logging
 
 from django.contrib import admin
 
-from acctmarket.applications.refer.models import (Notification, Referral,
-                                                  SMSCampaign, Wallet,
+from acctmarket.applications.refer.models import (CommissionEvent,
+                                                  Notification, Referral,
+                                                  ReferrerStats, SMSCampaign,
+                                                  SMSDelivery, Wallet,
                                                   WalletTransaction)
 from acctmarket.utils.choices import SMSCampaignStatusChoices
 
@@ -29,6 +31,15 @@ class ReferralAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ReferrerStats)
+class ReferrerStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "user", "referral_count", "completed_count", "total_spend", "tier",
+    )
+    list_filter = ("tier",)
+    raw_id_fields = ("user",)
+
+
 @admin.register(WalletTransaction)
 class WalletTransactionAdmin(admin.ModelAdmin):
     list_display = (
@@ -38,6 +49,16 @@ class WalletTransactionAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(CommissionEvent)
+class CommissionEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "order", "referral", "purchase_amount", "kind", "commission",
+        "processed_at",
+    )
+    list_filter = ("kind",)
+    raw_id_fields = ("order", "referral")
+
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = (
@@ -48,7 +69,14 @@ class NotificationAdmin(admin.ModelAdmin):
 
 @admin.register(SMSCampaign)
 class SMSCampaignAdmin(admin.ModelAdmin):
-    list_display = ("name", "status", "created_at")
+    list_display = (
+        "name", "status", "total_recipients", "sent_count", "failed_count",
+        "progress", "created_at",
+    )
+    readonly_fields = (
+        "total_recipients", "sent_count", "failed_count", "started_at",
+        "completed_at",
+    )
     list_filter = ("status", "scheduled_at", "created_at")
     search_fields = ("name", "message")
     ordering = ("-created_at",)
@@ -67,6 +95,16 @@ class SMSCampaignAdmin(admin.ModelAdmin):
 
         self.message_user(
             request,
-            f"{sent_count} campaign(s) sent successfully.",
+            f"{sent_count} campaign(s) queued for sending.",
             level="success" if sent_count > 0 else "warning"
         )
+
+
+@admin.register(SMSDelivery)
+class SMSDeliveryAdmin(admin.ModelAdmin):
+    list_display = (
+        "campaign", "user", "phone_no", "status", "attempts", "sent_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("phone_no", "provider_sid")
+    raw_id_fields = ("campaign", "user")
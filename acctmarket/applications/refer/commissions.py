@@ -0,0 +1,213 @@
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from acctmarket.applications.refer import ledger
+from acctmarket.applications.refer.models import (CommissionEvent, Referral,
+                                                  ReferrerStats, Wallet,
+                                                  referrer_stats_changed)
+from acctmarket.applications.refer.tasks import process_commission_events
+from acctmarket.applications.users.models import Customer
+from acctmarket.utils.choices import (TIER_CHOICE_TYPE, CommissionKind,
+                                      WalletTransactionTypeChoice)
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+# The referred user's first purchase must reach this to earn commission.
+FIRST_PURCHASE_MINIMUM = Decimal("5.00")
+FIRST_PURCHASE_CAP = Decimal("70.00")
+
+FIRST_PURCHASE_RATES = {
+    TIER_CHOICE_TYPE.STARTER: Decimal("0.10"),
+    TIER_CHOICE_TYPE.POWER_REFERRER: Decimal("0.12"),
+    TIER_CHOICE_TYPE.ELITE_REFERRER: Decimal("0.15"),
+}
+FIRST_PURCHASE_DEFAULT_RATE = Decimal("0.07")
+
+ONGOING_RATES = {
+    TIER_CHOICE_TYPE.STARTER: Decimal("0.01"),
+    TIER_CHOICE_TYPE.POWER_REFERRER: Decimal("0.015"),
+    TIER_CHOICE_TYPE.ELITE_REFERRER: Decimal("0.02"),
+}
+ONGOING_DEFAULT_RATE = Decimal("0.01")
+
+
+def record_order(order):
+    """
+    Appends the commission event of a paid order by a referred user and
+    queues a commission run once it is committed. Cheap enough for every
+    order save: one lookup, and nothing is written twice for an order.
+    """
+    if not order.paid_status or order.user_id is None:
+        return None
+    referral_id = (
+        Referral.objects.filter(referred_user_id=order.user_id)
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if referral_id is None:
+        return None
+    event, created = CommissionEvent.objects.get_or_create(
+        order=order,
+        defaults={
+            "referral_id": referral_id,
+            "purchase_amount": order.price,
+        },
+    )
+    if created:
+        transaction.on_commit(process_commission_events.delay)
+    return event
+
+
+def _commission(event, referral, customer, tier):
+    """
+    Classifies ``event`` against the referral's state and returns its
+    ``(kind, commission)`` at the referrer's current ``tier``.
+    """
+    amount = event.purchase_amount
+    if customer is None:
+        return CommissionKind.NONE, Decimal("0.00")
+    if not referral.first_purchase_done:
+        if amount < FIRST_PURCHASE_MINIMUM:
+            return CommissionKind.NONE, Decimal("0.00")
+        rate = FIRST_PURCHASE_RATES.get(tier, FIRST_PURCHASE_DEFAULT_RATE)
+        commission = min(amount * rate, FIRST_PURCHASE_CAP)
+        kind = CommissionKind.FIRST_PURCHASE
+    else:
+        rate = ONGOING_RATES.get(tier, ONGOING_DEFAULT_RATE)
+        commission = amount * rate
+        kind = CommissionKind.ONGOING
+    return kind, commission.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _apply(events):
+    """
+    Turns one locked batch of events, oldest first, into commissions.
+
+    Referrals, referrer stats, customers and wallets are loaded once per
+    batch and the results written back in bulk: the referrers' wallets
+    are credited by a single ledger batch, and each referrer's tier
+    follows the spend added to their ``ReferrerStats``.
+    """
+    referrals = {event.referral_id: event.referral for event in events}
+    referrer_ids = {
+        referral.referrer_id for referral in referrals.values()
+    }
+    ReferrerStats.ensure(referrer_ids)
+    stats = {
+        row.user_id: row
+        for row in ReferrerStats.objects.select_for_update()
+        .filter(user_id__in=referrer_ids)
+        .order_by("pk")
+    }
+    customers = {}
+    for customer in (
+        Customer.objects.select_for_update()
+        .filter(user_id__in=referrer_ids)
+        .order_by("pk")
+    ):
+        customers.setdefault(customer.user_id, customer)
+    wallets = dict(
+        Wallet.objects.filter(user_id__in=referrer_ids).values_list(
+            "user_id", "pk",
+        ),
+    )
+
+    now = timezone.now()
+    postings = []
+    for event in events:
+        referral = referrals[event.referral_id]
+        customer = customers.get(referral.referrer_id)
+        wallet_id = wallets.get(referral.referrer_id)
+        if wallet_id is None:
+            customer = None
+        if customer is None:
+            logger.error(
+                f"No Customer profile or wallet found for user "
+                f"{referral.referrer_id}; order {event.order_id} earns no "
+                f"commission."
+            )
+
+        referrer_stats = stats[referral.referrer_id]
+        was_completed = referral.is_completed
+        event.kind, event.commission = _commission(
+            event, referral, customer, referrer_stats.tier,
+        )
+        event.processed_at = now
+        if event.kind == CommissionKind.FIRST_PURCHASE:
+            referral.first_purchase_done = True
+            referral.is_completed = True
+            referral.first_purchase_amount = event.purchase_amount
+        referral.total_referred_spend = (
+            (referral.total_referred_spend or Decimal("0.00"))
+            + event.purchase_amount
+        )
+        referrer_stats.total_spend += event.purchase_amount
+        referrer_stats.completed_count += int(
+            referral.is_completed and not was_completed,
+        )
+        referrer_stats.tier = Customer.tier_for_spend(
+            referrer_stats.total_spend,
+        )
+        if customer is not None:
+            customer.commission_balance += event.commission
+            customer.tier = referrer_stats.tier
+        if event.commission > 0:
+            postings.append(
+                (
+                    wallet_id,
+                    event.commission,
+                    WalletTransactionTypeChoice.CREDIT,
+                ),
+            )
+
+    Referral.objects.bulk_update(
+        referrals.values(),
+        [
+            "first_purchase_done",
+            "is_completed",
+            "first_purchase_amount",
+            "total_referred_spend",
+        ],
+    )
+    ReferrerStats.objects.bulk_update(
+        stats.values(), ["completed_count", "total_spend", "tier"],
+    )
+    referrer_stats_changed.send(sender=ReferrerStats, user_ids=list(stats))
+    Customer.objects.bulk_update(
+        customers.values(), ["commission_balance", "tier"],
+    )
+    CommissionEvent.objects.bulk_update(
+        events, ["kind", "commission", "processed_at"],
+    )
+    # Last, so referral updates made by wallet_balance_changed receivers
+    # are not overwritten by this batch's copies.
+    ledger.post_many(postings)
+
+
+def run(batch_size=None):
+    """
+    Processes pending commission events oldest first and returns how many
+    were processed. Concurrent runs skip each other's batches.
+    """
+    batch_size = batch_size or settings.COMMISSION_BATCH_SIZE
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                CommissionEvent.objects.select_for_update(
+                    skip_locked=True, of=("self", "referral"),
+                )
+                .select_related("referral")
+                .filter(processed_at__isnull=True)
+                .order_by("created_at", "id")[:batch_size]
+            )
+            if not events:
+                return processed
+            _apply(events)
+            processed += len(events)
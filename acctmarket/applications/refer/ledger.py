@@ -0,0 +1,198 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from acctmarket.applications.refer.models import Wallet, WalletTransaction
+from acctmarket.applications.refer.tasks import send_wallet_notifications
+from acctmarket.utils.choices import WalletTransactionTypeChoice
+
+logger = logging.getLogger(__name__)
+
+# Sent inside the posting's transaction for every wallet whose balance
+# changed, with ``wallet_id``, ``user_id`` and the new ``balance``.
+wallet_balance_changed = Signal()
+
+CENT = Decimal("0.01")
+
+
+class InsufficientFunds(ValueError):
+    """Raised instead of taking a wallet below zero."""
+
+
+def _delta(amount, transaction_type):
+    if transaction_type not in WalletTransactionTypeChoice.values:
+        raise ValueError(f"Unknown transaction type {transaction_type!r}.")
+    amount = Decimal(amount).quantize(CENT)
+    if amount <= 0:
+        raise ValueError("Amount must be positive.")
+    if transaction_type == WalletTransactionTypeChoice.DEBIT:
+        return amount, -amount
+    return amount, amount
+
+
+def _insert_sql(entry):
+    """
+    ``INSERT ... SELECT`` of ``entry`` reading ``wallet_id`` from the
+    ``updated`` CTE, so it is only written when the balance changed.
+    """
+    fields = [
+        field for field in WalletTransaction._meta.concrete_fields
+        if field.attname != "wallet_id"
+    ]
+    columns = ", ".join(
+        connection.ops.quote_name(field.column)
+        for field in [*fields, WalletTransaction._meta.get_field("wallet")]
+    )
+    params = [
+        field.get_db_prep_save(field.pre_save(entry, add=True), connection)
+        for field in fields
+    ]
+    placeholders = ", ".join(["%s"] * len(params))
+    sql = (
+        f"INSERT INTO {WalletTransaction._meta.db_table} ({columns}) "
+        f"SELECT {placeholders}, id FROM updated"
+    )
+    return sql, params
+
+
+def _notify(postings):
+    """Queues the wallet notifications once the postings are committed."""
+    notifications = [
+        [user_id, str(amount), transaction_type]
+        for user_id, amount, transaction_type in postings
+    ]
+    transaction.on_commit(
+        lambda: send_wallet_notifications.delay(notifications),
+    )
+
+
+def post(wallet_id, amount, transaction_type):
+    """
+    Credits or debits one wallet and returns its new balance.
+
+    The balance change and its ``WalletTransaction`` row are one
+    statement: the balance is computed by the database from its current
+    value, so concurrent postings never overwrite each other, and a debit
+    that would take the wallet below zero changes nothing and raises
+    ``InsufficientFunds``.
+    """
+    amount, delta = _delta(amount, transaction_type)
+    entry = WalletTransaction(
+        wallet_id=wallet_id,
+        amount=amount,
+        transaction_type=transaction_type,
+    )
+    insert_sql, insert_params = _insert_sql(entry)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH updated AS ("
+                f"UPDATE {Wallet._meta.db_table} "
+                f"SET balance = balance + %s, updated_at = %s "
+                f"WHERE id = %s AND balance + %s >= 0 "
+                f"RETURNING id, user_id, balance"
+                f"), inserted AS ({insert_sql}) "
+                f"SELECT user_id, balance FROM updated",
+                [delta, timezone.now(), wallet_id, delta, *insert_params],
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            if not Wallet.objects.filter(pk=wallet_id).exists():
+                raise Wallet.DoesNotExist(f"Wallet {wallet_id} not found.")
+            raise InsufficientFunds("Insufficient balance.")
+
+        user_id, balance = row
+        logger.info(
+            f"Posted {transaction_type} of {amount} to wallet {wallet_id}, "
+            f"balance now {balance}."
+        )
+        wallet_balance_changed.send(
+            sender=Wallet,
+            wallet_id=wallet_id,
+            user_id=user_id,
+            balance=balance,
+        )
+        _notify([(user_id, amount, transaction_type)])
+    return balance
+
+
+def post_many(postings):
+    """
+    Applies many ``(wallet_id, amount, transaction_type)`` postings, e.g.
+    a commission run, and returns ``{wallet_id: balance}``.
+
+    Every wallet is updated by one ``UPDATE ... FROM (VALUES ...)`` with
+    the net change of its postings and every posting gets its own
+    ``WalletTransaction`` row, all or nothing: if any wallet would go
+    below zero, none is changed and ``InsufficientFunds`` is raised.
+    """
+    entries = []
+    deltas = defaultdict(Decimal)
+    for wallet_id, amount, transaction_type in postings:
+        amount, delta = _delta(amount, transaction_type)
+        deltas[wallet_id] += delta
+        entries.append(
+            WalletTransaction(
+                wallet_id=wallet_id,
+                amount=amount,
+                transaction_type=transaction_type,
+            ),
+        )
+    if not entries:
+        return {}
+
+    values = ", ".join(["(%s, %s::numeric)"] * len(deltas))
+    params = [value for item in deltas.items() for value in item]
+    table = Wallet._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS wallet "
+                f"SET balance = wallet.balance + posting.delta, "
+                f"updated_at = %s "
+                f"FROM (VALUES {values}) AS posting (id, delta) "
+                f"WHERE wallet.id = posting.id "
+                f"AND wallet.balance + posting.delta >= 0 "
+                f"RETURNING wallet.id, wallet.user_id, wallet.balance",
+                [timezone.now(), *params],
+            )
+            rows = cursor.fetchall()
+
+        if len(rows) != len(deltas):
+            # Rolls the wallets already updated back with the transaction.
+            missing = set(deltas) - {wallet_id for wallet_id, _, _ in rows}
+            raise InsufficientFunds(
+                f"Wallets {sorted(missing)} are missing or would go below "
+                f"zero.",
+            )
+        WalletTransaction.objects.bulk_create(entries)
+
+        users = {wallet_id: user_id for wallet_id, user_id, _ in rows}
+        for wallet_id, user_id, balance in rows:
+            wallet_balance_changed.send(
+                sender=Wallet,
+                wallet_id=wallet_id,
+                user_id=user_id,
+                balance=balance,
+            )
+        _notify([
+            (users[entry.wallet_id], entry.amount, entry.transaction_type)
+            for entry in entries
+        ])
+    logger.info(f"Posted {len(entries)} entries to {len(rows)} wallets.")
+    return {wallet_id: balance for wallet_id, _, balance in rows}
+
+
+def credit(wallet_id, amount):
+    return post(wallet_id, amount, WalletTransactionTypeChoice.CREDIT)
+
+
+def debit(wallet_id, amount):
+    return post(wallet_id, amount, WalletTransactionTypeChoice.DEBIT)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from acctmarket.applications.refer.models import Referral, ReferrerStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount every referrer's stats from their referrals and fix the "
+        "ones that drifted, e.g. after referrals were edited in the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of referrers recounted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        referrer_ids = sorted(
+            set(
+                Referral.objects.order_by()
+                .values_list("referrer_id", flat=True)
+                .distinct(),
+            )
+            | set(ReferrerStats.objects.values_list("user_id", flat=True)),
+        )
+        batch_size = options["batch_size"]
+        fixed = 0
+        for start in range(0, len(referrer_ids), batch_size):
+            fixed += len(
+                ReferrerStats.rebuild(referrer_ids[start:start + batch_size]),
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {len(referrer_ids)} referrers, fixed {fixed}.",
+            ),
+        )
@@ -40,7 +40,7 @@ class ReferralManager(models.Manager):
             tier (str): The referral tier to filter by
             (e.g., "Starter", "Power", "Elite").
         """
-        return self.filter(referrer__profile__referral_tier=tier)
+        return self.filter(referrer__referrer_stats__tier=tier)
 
     def active_within_period(self, start_date, end_date):
         """
@@ -63,18 +63,14 @@ class ReferralManager(models.Manager):
         Returns:
             dict: A dictionary with total and average referred user spending.
         """
-        completed_referrals = self.for_user(user).completed()
-        total_spend = completed_referrals.aggregate(
-            total=models.Sum(
-                "total_referred_spend",
-            )
-        )["total"] or Decimal("0.00")
-        average_spend = completed_referrals.aggregate(
-            avg=models.Avg("total_referred_spend"),
-        )["avg"] or Decimal("0.00")
+        # ReferralManager is attached to Referral before ReferrerStats exists.
+        from acctmarket.applications.refer.models import ReferrerStats
 
+        stats = ReferrerStats.for_user(user)
         return {
-            "total_spend": total_spend,
-            "average_spend": average_spend,
-            "completed_count": completed_referrals.count(),
+            "total_spend": stats.total_spend,
+            "average_spend": stats.average_spend,
+            "referral_count": stats.referral_count,
+            "completed_count": stats.completed_count,
+            "tier": stats.tier,
         }
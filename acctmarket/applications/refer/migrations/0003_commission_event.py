@@ -0,0 +1,43 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:23
+
+import acctmarket.utils.models
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0007_query_pattern_indexes'),
+        ('refer', '0002_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionEvent',
+            fields=[
+                ('id', models.CharField(default=acctmarket.utils.models.generate_uuid, editable=False, max_length=120, primary_key=True, serialize=False, unique=True)),
+                ('visible', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('purchase_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('kind', models.CharField(blank=True, choices=[('FIRST_PURCHASE', 'FIRST_PURCHASE'), ('ONGOING', 'ONGOING'), ('NONE', 'NONE')], max_length=20)),
+                ('commission', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('order', auto_prefetch.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='commission_event', to='ecommerce.cartorder')),
+                ('referral', auto_prefetch.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_events', to='refer.referral')),
+            ],
+            options={
+                'verbose_name': 'Commission Event',
+                'verbose_name_plural': 'Commission Events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created_at'], name='commission_pending_idx')],
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
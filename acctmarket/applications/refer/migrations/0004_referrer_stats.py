@@ -0,0 +1,78 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:27
+
+import acctmarket.utils.models
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_referrer_stats(apps, schema_editor):
+    Referral = apps.get_model("refer", "Referral")
+    ReferrerStats = apps.get_model("refer", "ReferrerStats")
+
+    rows = Referral.objects.order_by().values("referrer_id").annotate(
+        referrals=Count("id", filter=Q(referred_user__isnull=False)),
+        completed=Count("id", filter=Q(is_completed=True)),
+        spend=Sum("total_referred_spend"),
+    )
+    stats = []
+    for row in rows:
+        spend = row["spend"] or Decimal("0.00")
+        if spend >= 1000:
+            tier = "Elite Referrer'"
+        elif spend >= 500:
+            tier = "Power Referrer"
+        else:
+            tier = "Starter"
+        stats.append(
+            ReferrerStats(
+                user_id=row["referrer_id"],
+                referral_count=row["referrals"],
+                completed_count=row["completed"],
+                total_spend=spend,
+                tier=tier,
+            ),
+        )
+    ReferrerStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('refer', '0003_commission_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferrerStats',
+            fields=[
+                ('id', models.CharField(default=acctmarket.utils.models.generate_uuid, editable=False, max_length=120, primary_key=True, serialize=False, unique=True)),
+                ('visible', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('referral_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('total_spend', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('tier', models.CharField(choices=[('Starter', 'Starter'), ('Power Referrer', 'Power Referrer'), ("Elite Referrer'", 'Elite Referrer')], default='Starter', max_length=20)),
+                ('user', auto_prefetch.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='referrer_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Referrer Stats',
+                'verbose_name_plural': 'Referrer Stats',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.RunPython(
+            backfill_referrer_stats, migrations.RunPython.noop,
+        ),
+    ]
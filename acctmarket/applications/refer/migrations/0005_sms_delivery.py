@@ -0,0 +1,81 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:30
+
+import acctmarket.utils.models
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('refer', '0004_referrer_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smscampaign',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='smscampaign',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='smscampaign',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='smscampaign',
+            name='started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='smscampaign',
+            name='total_recipients',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='smscampaign',
+            name='status',
+            field=models.CharField(choices=[('Sent', 'Sent'), ('Draft', 'Draft'), ('Failed', 'Failed'), ('Scheduled', 'Scheduled'), ('No recipient', 'No recipient'), ('Sending', 'Sending')], default='Draft', help_text='The current status of the SMS campaign.(leave as draft system will update authomatically)', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='SMSDelivery',
+            fields=[
+                ('id', models.CharField(default=acctmarket.utils.models.generate_uuid, editable=False, max_length=120, primary_key=True, serialize=False, unique=True)),
+                ('visible', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('phone_no', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('SENDING', 'SENDING'), ('SENT', 'SENT'), ('FAILED', 'FAILED')], default='PENDING', max_length=20)),
+                ('provider_sid', models.CharField(blank=True, max_length=64)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', auto_prefetch.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='refer.smscampaign')),
+                ('user', auto_prefetch.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sms_deliveries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'SMS Delivery',
+                'verbose_name_plural': 'SMS Deliveries',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+                'indexes': [models.Index(fields=['campaign', 'status'], name='smsdelivery_status_idx')],
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='smsdelivery',
+            constraint=models.UniqueConstraint(fields=('campaign', 'user'), name='smsdelivery_unique_recipient'),
+        ),
+    ]
@@ -3,19 +3,28 @@ from decimal import Decimal
 
 import auto_prefetch
 from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
+from django.dispatch import Signal
 
 from acctmarket.applications.refer.manager import ReferralManager
-from acctmarket.applications.users.models import Customer
-from acctmarket.applications.users.services import TwilloSMSService
-from acctmarket.utils.choices import (TIER_CHOICE_TYPE,
+from acctmarket.applications.users.models import (REFERRAL_TIER_THRESHOLDS,
+                                                  Customer)
+from acctmarket.utils.choices import (TIER_CHOICE_TYPE, CommissionKind,
                                       NOTIFICATION_TYPES_Choice,
                                       SMSCampaignStatusChoices,
+                                      SMSDeliveryStatusChoices,
                                       WalletTransactionTypeChoice)
 from acctmarket.utils.models import TimeBasedModel
 
 # Create your models here.
 logger = logging.getLogger(__name__)
 
+# Sent with the ``user_ids`` whose ``ReferrerStats`` were changed by an
+# ``UPDATE`` or in bulk, which ``post_save`` receivers never see.
+referrer_stats_changed = Signal()
+
 
 class Referral(TimeBasedModel):
     """
@@ -78,6 +87,15 @@ class Referral(TimeBasedModel):
         verbose_name = "Referral"
         verbose_name_plural = "Referrals"
         ordering = ["-created_at"]
+        indexes = [
+            # referred_user already has its foreign key index; this one
+            # serves the referrer's list of successful referrals.
+            models.Index(
+                fields=["referrer", "-created_at"],
+                condition=models.Q(referred_user__isnull=False),
+                name="referral_successful_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Referral by {self.referrer.username}"
@@ -100,76 +118,6 @@ class Referral(TimeBasedModel):
             referred_user__isnull=False,  # Ensure there's a referred user
         ).select_related("referred_user")
 
-    def apply_first_purchase_reward(self, purchase_amount):
-        """
-        Applies first purchase commission to the referrer.
-        """
-        if self.first_purchase_done:
-            return  # Referral is already completed
-
-        # referrer_customer = self.referrer.customer
-        # Retrieve the Customer profile and wallet  associated with the referrer    # noqa
-        try:
-            referrer_customer = Customer.objects.get(
-                user=self.referrer,
-            )
-            referrer_wallet = Wallet.objects.get(
-                user=self.referrer,
-            )
-            logger.info(
-                f"getting the referrers wallet for first purchase {referrer_wallet}"  # noqa
-            )  # noqa
-        except (Customer.DoesNotExist, Wallet.DoesNotExist):
-            # Handle the case where no Customer profile exists for the referrer
-            raise ValueError(
-                f"No Customer profile or wallet found for user {self.referrer}"
-            )  # noqa
-        tier_commission_map = {
-            TIER_CHOICE_TYPE.STARTER: Decimal("0.10"),
-            TIER_CHOICE_TYPE.POWER_REFERRER: Decimal("0.12"),
-            TIER_CHOICE_TYPE.ELITE_REFERRER: Decimal("0.15"),
-        }
-        tier_rate = tier_commission_map.get(
-            referrer_customer.tier,
-            Decimal("0.07"),
-        )
-        commission = min(purchase_amount * tier_rate, Decimal("70.00"))
-        # Update balances
-        referrer_customer.commission_balance += commission
-        referrer_wallet.credit_wallet(commission)
-        # Mark referral as completed
-        self.first_purchase_done = True
-        self.is_completed = True
-        self.first_purchase_amount = purchase_amount
-        self.save(
-            update_fields=[
-                "first_purchase_done",
-                "is_completed",
-                "first_purchase_amount",
-            ]
-        )
-
-    def apply_ongoing_commission(self, purchase_amount):
-        try:
-            referrer_customer = Customer.objects.get(user=self.referrer)
-            referrer_wallet = Wallet.objects.get(user=self.referrer)
-        except (Customer.DoesNotExist, Wallet.DoesNotExist):
-            raise ValueError(
-                f"No Customer profile or Wallet found for user {self.referrer}"
-            )  # noqa
-
-        # Calculate ongoing commission
-        tier_rate_map = {
-            TIER_CHOICE_TYPE.STARTER: Decimal("0.01"),
-            TIER_CHOICE_TYPE.POWER_REFERRER: Decimal("0.015"),
-            TIER_CHOICE_TYPE.ELITE_REFERRER: Decimal("0.02"),
-        }
-        tier_rate = tier_rate_map.get(referrer_customer.tier, Decimal("0.01"))
-        commission = purchase_amount * tier_rate
-        # Update balances
-        referrer_customer.commission_balance += commission
-        referrer_wallet.credit_wallet(commission)
-
     def finalize_referral(self):
         """
         Completes the referral process and rewards the referred user.
@@ -184,6 +132,7 @@ class Referral(TimeBasedModel):
 
         self.is_completed = True
         self.save(update_fields=["is_completed"])
+        ReferrerStats.record(self.referrer_id, completed=1)
 
     def check_and_complete_referral(self):
         """
@@ -197,6 +146,171 @@ class Referral(TimeBasedModel):
             self.is_completed = True
             self.first_purchase_done = True
             self.save(update_fields=["is_completed", "first_purchase_done"])
+            ReferrerStats.record(self.referrer_id, completed=1)
+
+
+class ReferrerStats(TimeBasedModel):
+    """
+    Materialised referral totals of one referrer, kept up to date from
+    deltas as referrals are made, completed and spent on, so tiers and
+    dashboards never aggregate the referrer's referrals.
+    Deleted referrals and edits made outside those paths are recounted by
+    ``rebuild()``, run on delete and by ``manage.py rebuild_referrer_stats``.
+
+    - `referral_count`: Referrals with a signed-up referred user.
+    - `completed_count`: Referrals that were completed.
+    - `total_spend`: What the referred users spent in total.
+    - `tier`: The tier earned by `total_spend`.
+    """
+
+    user = auto_prefetch.OneToOneField(
+        "users.User",
+        on_delete=models.CASCADE,
+        related_name="referrer_stats",
+    )
+    referral_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    total_spend = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+    )
+    tier = models.CharField(
+        max_length=20,
+        choices=TIER_CHOICE_TYPE.choices,
+        default=TIER_CHOICE_TYPE.STARTER,
+    )
+
+    class Meta(TimeBasedModel.Meta):
+        verbose_name = "Referrer Stats"
+        verbose_name_plural = "Referrer Stats"
+
+    def __str__(self):
+        return f"Referral stats of {self.user}"
+
+    @property
+    def average_spend(self):
+        """Average spend per referred user."""
+        if not self.referral_count:
+            return Decimal("0.00")
+        return (self.total_spend / self.referral_count).quantize(
+            Decimal("0.01"),
+        )
+
+    @staticmethod
+    def tier_expression(total_spend):
+        """``Customer.tier_for_spend`` as a database expression."""
+        return models.Case(
+            *[
+                models.When(
+                    GreaterThanOrEqual(total_spend, threshold),
+                    then=Value(tier),
+                )
+                for threshold, tier in REFERRAL_TIER_THRESHOLDS
+            ],
+            default=Value(TIER_CHOICE_TYPE.STARTER),
+            output_field=models.CharField(),
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """The user's stats, or empty unsaved ones if they have none."""
+        return cls.objects.filter(user=user).first() or cls(user=user)
+
+    @classmethod
+    def ensure(cls, user_ids):
+        """Creates the missing stats rows of ``user_ids``."""
+        cls.objects.bulk_create(
+            [cls(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def record(cls, user_id, referrals=0, completed=0, spend=0):
+        """
+        Adds the given deltas to the referrer's stats and moves their tier
+        along in a single ``UPDATE``, so concurrent changes never
+        overwrite each other.
+        """
+        cls.ensure([user_id])
+        total_spend = F("total_spend") + Decimal(spend)
+        cls.objects.filter(user_id=user_id).update(
+            referral_count=F("referral_count") + referrals,
+            completed_count=F("completed_count") + completed,
+            total_spend=total_spend,
+            tier=cls.tier_expression(total_spend),
+        )
+        referrer_stats_changed.send(sender=cls, user_ids=[user_id])
+
+    @staticmethod
+    def referral_totals(referrals):
+        """
+        Aggregates ``referrals`` per ``referrer_id`` into the counted
+        columns: ``referral_count``, ``completed_count`` and
+        ``total_spend``.
+        """
+        return (
+            referrals.order_by()
+            .values("referrer_id")
+            .annotate(
+                referral_count=Count(
+                    "pk", filter=Q(referred_user__isnull=False),
+                ),
+                completed_count=Count("pk", filter=Q(is_completed=True)),
+                total_spend=Coalesce(
+                    Sum("total_referred_spend"), Value(Decimal("0.00")),
+                ),
+            )
+        )
+
+    @classmethod
+    def rebuild(cls, user_ids):
+        """
+        Recomputes the stats of the referrers ``user_ids`` from their
+        referrals, for changes the deltas never saw, and returns the ids
+        whose stored stats were wrong. The stats rows stay locked while
+        the referrals are counted, so no delta lands in between.
+        """
+        user_ids = set(user_ids)
+        with transaction.atomic():
+            totals = {
+                row["referrer_id"]: row
+                for row in cls.referral_totals(
+                    Referral.objects.filter(referrer_id__in=user_ids),
+                )
+            }
+            # Referrers without referrals only get their old rows reset.
+            cls.ensure(totals)
+            stale = []
+            for stats in (
+                cls.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by("pk")
+            ):
+                row = totals.get(stats.user_id, {})
+                expected = {
+                    "referral_count": row.get("referral_count", 0),
+                    "completed_count": row.get("completed_count", 0),
+                    "total_spend": row.get("total_spend", Decimal("0.00")),
+                }
+                expected["tier"] = Customer.tier_for_spend(
+                    expected["total_spend"],
+                )
+                if any(
+                    getattr(stats, field) != value
+                    for field, value in expected.items()
+                ):
+                    for field, value in expected.items():
+                        setattr(stats, field, value)
+                    stale.append(stats)
+            cls.objects.bulk_update(
+                stale,
+                ["referral_count", "completed_count", "total_spend", "tier"],
+            )
+        changed = [stats.user_id for stats in stale]
+        if changed:
+            referrer_stats_changed.send(sender=cls, user_ids=changed)
+        return changed
 
 
 class Wallet(TimeBasedModel):
@@ -226,51 +340,25 @@ class Wallet(TimeBasedModel):
     def __str__(self):
         return f"Wallet of {self.user} (Balance: {self.balance})"
 
-    @transaction.atomic
     def credit_wallet(self, amount):
         """Credits the wallet with a specified amount."""
-        if amount <= 0:
+        # The ledger posts against Wallet rows and cannot load before it.
+        from acctmarket.applications.refer import ledger
+
+        if Decimal(amount) <= 0:
             logger.error(
                 "Attempted to credit wallet with non-positive amount.",
             )
             raise ValueError(
                 "Amount must be positive to credit the wallet.",
             )
+        self.balance = ledger.credit(self.pk, amount)
 
-        logger.info(
-            f"Crediting wallet of user {self.user.username} with amount {amount}."  # noqa
-        )  # noqa
-
-        # Perform balance update and save
-        self.balance += Decimal(amount)
-        self.save(update_fields=["balance"])
-
-        # Record transaction history
-        self.record_transaction(
-            amount,
-            WalletTransactionTypeChoice.CREDIT,
-        )
-        # Create a notification
-        Notification.objects.create(
-            user=self.user,
-            message=f"Your wallet has been credited with {amount}.",
-            notification_type=NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
-        )
-
-    @transaction.atomic
     def debit_wallet(self, amount):
         """Debits the wallet with a specified amount."""
-        if amount > self.balance:
-            raise ValueError("Insufficient balance.")
-        self.balance -= amount
-        self.save()
-        self.record_transaction(amount, "debit")
-        # Create a notification
-        Notification.objects.create(
-            user=self.user,
-            message=f"Your wallet has been debited by {amount}.",
-            notification_type="wallet_debit",
-        )
+        from acctmarket.applications.refer import ledger
+
+        self.balance = ledger.debit(self.pk, amount)
 
     def apply_admin_fee(self, amount):
         """Apply a 10% admin fee to the wallet transaction."""
@@ -325,6 +413,12 @@ class WalletTransaction(TimeBasedModel):
         verbose_name = "Wallet Transaction"
         verbose_name_plural = "Wallet Transactions"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["wallet", "-created_at", "-id"],
+                name="wallettx_wallet_recent_idx",
+            ),
+        ]
 
     @classmethod
     def record_transaction(cls, wallet, amount, transaction_type):
@@ -345,6 +439,53 @@ class WalletTransaction(TimeBasedModel):
         return f"{self.transaction_type.capitalize()} of {self.amount:.2f} on {self.wallet.user.username}'s wallet"  # noqa
 
 
+class CommissionEvent(TimeBasedModel):
+    """
+    A paid order of a referred user, appended when the order is paid and
+    turned into the referrer's commission by the next commission run.
+    Each order is recorded at most once.
+    """
+
+    referral = auto_prefetch.ForeignKey(
+        "refer.Referral",
+        on_delete=models.CASCADE,
+        related_name="commission_events",
+    )
+    order = auto_prefetch.OneToOneField(
+        "ecommerce.CartOrder",
+        on_delete=models.CASCADE,
+        related_name="commission_event",
+    )
+    purchase_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    kind = models.CharField(
+        max_length=20,
+        choices=CommissionKind.choices,
+        blank=True,
+    )
+    commission = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Commission Event"
+        verbose_name_plural = "Commission Events"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="commission_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Commission event for order {self.order_id}"
+
+
 class Notification(TimeBasedModel):
     user = auto_prefetch.ForeignKey(
         "users.User",
@@ -362,19 +503,38 @@ class Notification(TimeBasedModel):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
         ordering = ["-created_at"]
+        indexes = [
+            # The notification feed, paged by keyset.
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="notification_user_recent_idx",
+            ),
+            # Unread counts and the unread list only touch unread rows.
+            models.Index(
+                fields=["user", "-created_at"],
+                condition=models.Q(read=False),
+                name="notification_unread_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.notification_type} - {self.user.username}"
 
     def mark_as_read(self):
         """Marks the notification as read."""
+        # mark_read also fixes the cached unread count; notifications.py
+        # needs Notification itself when it loads.
+        from acctmarket.applications.refer import notifications
+
+        notifications.mark_read(self.user_id, [self.pk])
         self.read = True
-        self.save()
 
     @classmethod
     def get_unread_count(cls, user):
         """Returns the count of unread notifications for a user."""
-        return cls.objects.filter(user=user, read=False).count()
+        from acctmarket.applications.refer import notifications
+
+        return notifications.unread_count(user.pk)
 
 
 class SMSCampaign(TimeBasedModel):
@@ -396,6 +556,11 @@ class SMSCampaign(TimeBasedModel):
         blank=True,
         help_text="Time to send the campaign.",
     )
+    total_recipients = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "SMS Campaign"
@@ -410,10 +575,9 @@ class SMSCampaign(TimeBasedModel):
         Retrieves all customers who have opted in for SMS notifications
         and have valid phone numbers.
         """
-        return Customer.objects.filter(
-            sms_opt_in=True,
-            user__phone_no__isnull=False,
-        ).exclude(user__phone_no__exact="")
+        return Customer.objects.filter(sms_opt_in=True).exclude(
+            user__phone_e164="",
+        )
 
     def get_opted_in_customers_count(self):
         """
@@ -421,60 +585,80 @@ class SMSCampaign(TimeBasedModel):
         """
         return self.get_opted_in_customers().count()
 
+    @property
+    def progress(self):
+        """Share of the recipients already handled, from 0 to 100."""
+        if not self.total_recipients:
+            return 0
+        done = self.sent_count + self.failed_count
+        return round(done * 100 / self.total_recipients)
+
     def send_to_users(self):
         """
-        Sends the SMS campaign to all opted-in customers.
-        Updates the campaign's status and sent_at timestamp.
+        Starts sending the campaign to all opted-in customers in the
+        background. Returns False if the campaign is not a draft.
         """
+        # sms.py builds deliveries from SMSCampaign, defined above.
+        from acctmarket.applications.refer import sms
+
         if self.status != SMSCampaignStatusChoices.DRAFT:
             logger.warning(
                 f"Campaign '{self.name}' cannot be sent as it is not in 'draft' status.",  # noqa
             )
             return False
-
-        # Fetch all opted-in customers
-        opted_in_customers = self.get_opted_in_customers()
-        if not opted_in_customers.exists():
-            logger.warning(
-                f"No opted-in customers found for campaign '{self.name}'.",
-            )
-            self.status = SMSCampaignStatusChoices.NO_RECIPIENTS
-            self.save()
-            return False
-
-        # Initialize SMS service
-        sms_service = TwilloSMSService()
-
-        # Send SMS to each customer and collect results
-        results = []
-        for customer in opted_in_customers:
-            # Get the formatted phone number from the User instance
-            phone_no = customer.user.formatted_phone_number
-            if phone_no:
-                result = sms_service.send_sms(phone_no, self.message)
-                results.append(result)
-                if result:
-                    logger.info(f"SMS sent to {phone_no}: {result}")
-            else:
-                logger.warning(
-                    f"Invalid phone number for user {customer.user.email}",
-                )
-
-        # Update the campaign's status and sent_at timestamp
-        if results:
-            self.status = SMSCampaignStatusChoices.SENT
-            self.save()
-            logger.info(
-                f"Campaign '{self.name}' successfully sent to {len(results)} recipients.",  # noqa
-            )
-            return True
-        logger.error(f"Campaign '{self.name}' failed to send any messages.")
-        self.status = SMSCampaignStatusChoices.FAILED
-        self.save()
-        return False
+        sms.queue_campaign(self)
+        return True
 
     def is_sent(self):
         """
         Checks if the campaign is marked as sent.
         """
         return self.status == SMSCampaignStatusChoices.SENT
+
+
+class SMSDelivery(TimeBasedModel):
+    """
+    One recipient of an SMS campaign and the outcome of sending to them.
+    Rows are created when the campaign starts and sent in chunks.
+    """
+
+    campaign = auto_prefetch.ForeignKey(
+        "refer.SMSCampaign",
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+    )
+    user = auto_prefetch.ForeignKey(
+        "users.User",
+        on_delete=models.CASCADE,
+        related_name="sms_deliveries",
+    )
+    phone_no = models.CharField(max_length=20, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=SMSDeliveryStatusChoices.choices,
+        default=SMSDeliveryStatusChoices.PENDING,
+    )
+    provider_sid = models.CharField(max_length=64, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta(TimeBasedModel.Meta):
+        verbose_name = "SMS Delivery"
+        verbose_name_plural = "SMS Deliveries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["campaign", "user"],
+                name="smsdelivery_unique_recipient",
+            ),
+        ]
+        indexes = [
+            # Chunks and the progress sweep pick deliveries by status.
+            models.Index(
+                fields=["campaign", "status"],
+                name="smsdelivery_status_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign} to {self.phone_no} ({self.status})"
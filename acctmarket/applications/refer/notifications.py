@@ -0,0 +1,124 @@
+import logging
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from acctmarket.applications.refer.models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def _unread_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def unread_count(user_id):
+    """
+    The user's unread notification count, counted once and then kept in
+    the cache by every write made through this module.
+    """
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(
+            user_id=user_id, read=False,
+        ).count()
+        cache.add(key, count, settings.NOTIFICATION_UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def _add_unread(counts):
+    """Adds ``{user_id: n}`` to the cached counts once committed."""
+
+    def add():
+        for user_id, count in counts.items():
+            try:
+                cache.incr(_unread_key(user_id), count)
+            except ValueError:
+                # Not cached: the next read counts from the database.
+                pass
+
+    transaction.on_commit(add)
+
+
+def _forget_unread(user_ids):
+    """Drops cached counts once committed, so they are counted again."""
+    keys = [_unread_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def notify(user_id, message, notification_type):
+    """Creates one notification for the user."""
+    return notify_many([(user_id, message, notification_type)])[0]
+
+
+def notify_many(notifications):
+    """
+    Creates ``(user_id, message, notification_type)`` notifications with
+    one insert and bumps each recipient's unread count.
+    """
+    created = Notification.objects.bulk_create(
+        [
+            Notification(
+                user_id=user_id,
+                message=message,
+                notification_type=notification_type,
+            )
+            for user_id, message, notification_type in notifications
+        ],
+    )
+    _add_unread(Counter(notification.user_id for notification in created))
+    return created
+
+
+def broadcast(user_ids, message, notification_type, batch_size=None):
+    """
+    Sends the same notification to every user in ``user_ids``, inserted
+    ``NOTIFICATION_BROADCAST_BATCH_SIZE`` at a time, and returns how many
+    were created. Cached counts of the recipients are dropped per batch
+    instead of being bumped one by one.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_BROADCAST_BATCH_SIZE
+    iterator = iter(user_ids)
+    sent = 0
+    while batch := list(islice(iterator, batch_size)):
+        with transaction.atomic():
+            Notification.objects.bulk_create(
+                [
+                    Notification(
+                        user_id=user_id,
+                        message=message,
+                        notification_type=notification_type,
+                    )
+                    for user_id in batch
+                ],
+            )
+            _forget_unread(batch)
+        sent += len(batch)
+    logger.info(f"Broadcast {notification_type} notification to {sent} users.")
+    return sent
+
+
+def mark_read(user_id, notification_ids=None):
+    """
+    Marks the user's unread notifications, or only ``notification_ids``
+    among them, as read with a single ``UPDATE``. Returns how many
+    changed.
+    """
+    unread = Notification.objects.filter(user_id=user_id, read=False)
+    if notification_ids is not None:
+        unread = unread.filter(pk__in=notification_ids)
+    updated = unread.update(read=True)
+    if notification_ids is None:
+        transaction.on_commit(
+            lambda: cache.set(
+                _unread_key(user_id), 0,
+                settings.NOTIFICATION_UNREAD_CACHE_TIMEOUT,
+            ),
+        )
+    elif updated:
+        _add_unread({user_id: -updated})
+    return updated
@@ -0,0 +1,279 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from acctmarket.applications.refer.models import SMSCampaign, SMSDelivery
+from acctmarket.applications.refer.tasks import (dispatch_sms_campaign,
+                                                 send_sms_chunk)
+from acctmarket.applications.users.services import TwilloSMSService
+from acctmarket.utils.choices import (SMSCampaignStatusChoices,
+                                      SMSDeliveryStatusChoices)
+from acctmarket.utils.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Deliveries whose outcome is still unknown.
+OPEN_STATUSES = (
+    SMSDeliveryStatusChoices.PENDING,
+    SMSDeliveryStatusChoices.SENDING,
+)
+
+# Outcomes are written back after this many sends, so a worker lost
+# mid-chunk leaves at most this many messages to be sent again.
+FLUSH_EVERY = 50
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def queue_campaign(campaign):
+    """Queues ``campaign`` to start at its scheduled time, or now."""
+    transaction.on_commit(
+        lambda: dispatch_sms_campaign.apply_async(
+            (campaign.pk,), eta=campaign.scheduled_at,
+        ),
+    )
+
+
+def _queue_chunks(campaign_id, queryset):
+    """Queues one send task per chunk of the deliveries in ``queryset``."""
+    delivery_ids = (
+        queryset.order_by("pk").values_list("pk", flat=True).iterator()
+    )
+    chunks = 0
+    for chunk in _batches(delivery_ids, settings.SMS_CHUNK_SIZE):
+        send_sms_chunk.delay(campaign_id, chunk)
+        chunks += 1
+    return chunks
+
+
+def start(campaign_id):
+    """
+    Creates a delivery for every opted-in recipient of a draft campaign
+    and queues their chunks. Returns the number of recipients.
+
+    Recipients are read with their stored E.164 number in one query, so
+    nothing is parsed while sending.
+    """
+    with transaction.atomic():
+        campaign = (
+            SMSCampaign.objects.select_for_update()
+            .filter(pk=campaign_id, status=SMSCampaignStatusChoices.DRAFT)
+            .first()
+        )
+        if campaign is None:
+            return 0
+        if campaign.scheduled_at and campaign.scheduled_at > timezone.now():
+            logger.info(f"Campaign '{campaign.name}' is not due yet.")
+            return 0
+
+        recipients = campaign.get_opted_in_customers().values_list(
+            "user_id", "user__phone_e164",
+        )
+        total = 0
+        for batch in _batches(recipients.iterator(), settings.SMS_CHUNK_SIZE):
+            SMSDelivery.objects.bulk_create(
+                [
+                    SMSDelivery(
+                        campaign=campaign,
+                        user_id=user_id,
+                        phone_no=phone_e164,
+                    )
+                    for user_id, phone_e164 in batch
+                ],
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+
+        now = timezone.now()
+        campaign.total_recipients = total
+        campaign.started_at = now
+        if not total:
+            logger.warning(
+                f"No opted-in customers with a valid number found for "
+                f"campaign '{campaign.name}'.",
+            )
+            campaign.status = SMSCampaignStatusChoices.NO_RECIPIENTS
+            campaign.completed_at = now
+        else:
+            campaign.status = SMSCampaignStatusChoices.SENDING
+        campaign.save(
+            update_fields=[
+                "total_recipients",
+                "started_at",
+                "completed_at",
+                "status",
+                "updated_at",
+            ],
+        )
+
+    if campaign.status == SMSCampaignStatusChoices.SENDING:
+        chunks = _queue_chunks(
+            campaign.pk,
+            campaign.deliveries.filter(
+                status=SMSDeliveryStatusChoices.PENDING,
+            ),
+        )
+        logger.info(
+            f"Campaign '{campaign.name}' queued to {total} recipients in "
+            f"{chunks} chunks.",
+        )
+    return total
+
+
+def _record(campaign_id, results):
+    """Writes back the outcome of sent deliveries and counts them."""
+    now = timezone.now()
+    sent = 0
+    for delivery, result in results:
+        if result:
+            delivery.status = SMSDeliveryStatusChoices.SENT
+            delivery.provider_sid = result.get("sid") or ""
+            delivery.sent_at = now
+            sent += 1
+        else:
+            delivery.status = SMSDeliveryStatusChoices.FAILED
+    with transaction.atomic():
+        SMSDelivery.objects.bulk_update(
+            [delivery for delivery, _ in results],
+            ["status", "provider_sid", "sent_at"],
+        )
+        SMSCampaign.objects.filter(pk=campaign_id).update(
+            sent_count=F("sent_count") + sent,
+            failed_count=F("failed_count") + len(results) - sent,
+            updated_at=now,
+        )
+
+
+def send_chunk(campaign_id, delivery_ids):
+    """
+    Sends the campaign message to the pending deliveries among
+    ``delivery_ids`` and returns how many were attempted.
+
+    Deliveries are claimed first, so duplicate or retried chunks skip
+    those another worker already took. Up to ``SMS_SEND_CONCURRENCY``
+    sends are in flight at once, and all workers together stay under
+    ``SMS_RATE_LIMIT`` messages a second.
+    """
+    campaign = (
+        SMSCampaign.objects.filter(
+            pk=campaign_id, status=SMSCampaignStatusChoices.SENDING,
+        )
+        .only("message")
+        .first()
+    )
+    if campaign is None:
+        return 0
+
+    with transaction.atomic():
+        deliveries = list(
+            SMSDelivery.objects.select_for_update(skip_locked=True)
+            .filter(
+                pk__in=delivery_ids,
+                campaign_id=campaign_id,
+                status=SMSDeliveryStatusChoices.PENDING,
+            )
+            .order_by("pk")
+        )
+        now = timezone.now()
+        for delivery in deliveries:
+            delivery.status = SMSDeliveryStatusChoices.SENDING
+            delivery.claimed_at = now
+            delivery.attempts += 1
+        SMSDelivery.objects.bulk_update(
+            deliveries, ["status", "claimed_at", "attempts"],
+        )
+
+    if deliveries:
+        service = TwilloSMSService()
+        limiter = RateLimiter("sms", settings.SMS_RATE_LIMIT)
+
+        def send(delivery):
+            limiter.acquire()
+            return delivery, service.send_sms(
+                delivery.phone_no, campaign.message,
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=settings.SMS_SEND_CONCURRENCY,
+        ) as pool:
+            for results in _batches(pool.map(send, deliveries), FLUSH_EVERY):
+                _record(campaign_id, results)
+
+    finish(campaign_id)
+    return len(deliveries)
+
+
+def finish(campaign_id):
+    """
+    Marks a sending campaign SENT, or FAILED if nothing got through, once
+    no delivery is open. Returns whether the campaign is done.
+    """
+    if SMSDelivery.objects.filter(
+        campaign_id=campaign_id, status__in=OPEN_STATUSES,
+    ).exists():
+        return False
+    finished = SMSCampaign.objects.filter(
+        pk=campaign_id, status=SMSCampaignStatusChoices.SENDING,
+    ).update(
+        status=Case(
+            When(sent_count__gt=0, then=Value(SMSCampaignStatusChoices.SENT)),
+            default=Value(SMSCampaignStatusChoices.FAILED),
+        ),
+        completed_at=timezone.now(),
+    )
+    if finished:
+        logger.info(f"SMS campaign {campaign_id} finished.")
+    return True
+
+
+def resume():
+    """
+    Picks sending campaigns back up after lost workers.
+
+    Deliveries claimed longer than ``SMS_DELIVERY_LEASE`` ago are released
+    and queued again, as are all pending deliveries of a campaign that
+    made no progress for as long. Returns the number of chunks queued.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.SMS_DELIVERY_LEASE)
+    chunks = 0
+    campaigns = SMSCampaign.objects.filter(
+        status=SMSCampaignStatusChoices.SENDING,
+    ).values_list("pk", "updated_at")
+    for campaign_id, updated_at in campaigns:
+        deliveries = SMSDelivery.objects.filter(campaign_id=campaign_id)
+        released = list(
+            deliveries.filter(
+                status=SMSDeliveryStatusChoices.SENDING,
+                claimed_at__lt=stale,
+            ).values_list("pk", flat=True)
+        )
+        if released:
+            deliveries.filter(
+                pk__in=released,
+                status=SMSDeliveryStatusChoices.SENDING,
+            ).update(status=SMSDeliveryStatusChoices.PENDING)
+        if finish(campaign_id):
+            continue
+        if updated_at < stale:
+            pending = deliveries.filter(
+                status=SMSDeliveryStatusChoices.PENDING,
+            )
+            SMSCampaign.objects.filter(pk=campaign_id).update(
+                updated_at=timezone.now(),
+            )
+        else:
+            pending = deliveries.filter(pk__in=released)
+        chunks += _queue_chunks(campaign_id, pending)
+    if chunks:
+        logger.info(f"Requeued {chunks} stalled SMS chunks.")
+    return chunks
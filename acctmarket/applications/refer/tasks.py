@@ -0,0 +1,98 @@
+import logging
+
+from celery import shared_task
+
+from acctmarket.applications.refer import notifications
+from acctmarket.applications.users.models import User
+from acctmarket.utils.choices import (NOTIFICATION_TYPES_Choice,
+                                      WalletTransactionTypeChoice)
+
+logger = logging.getLogger(__name__)
+
+WALLET_MESSAGES = {
+    WalletTransactionTypeChoice.CREDIT: (
+        "Your wallet has been credited with {amount}.",
+        NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
+    ),
+    WalletTransactionTypeChoice.DEBIT: (
+        "Your wallet has been debited by {amount}.",
+        NOTIFICATION_TYPES_Choice.WALLET_DEBIT,
+    ),
+}
+
+
+@shared_task
+def send_wallet_notifications(postings):
+    """
+    Creates the wallet notifications of committed ledger postings, given
+    as ``[user_id, amount, transaction_type]`` lists, in one insert.
+    """
+    created = []
+    for user_id, amount, transaction_type in postings:
+        message, notification_type = WALLET_MESSAGES[transaction_type]
+        created.append(
+            (user_id, message.format(amount=amount), notification_type),
+        )
+    return len(notifications.notify_many(created))
+
+
+@shared_task
+def broadcast_notification(message, notification_type, user_ids=None):
+    """
+    Notifies ``user_ids``, or every active user, of the same message.
+    """
+    if user_ids is None:
+        user_ids = (
+            User.objects.filter(is_active=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+            .iterator()
+        )
+    return notifications.broadcast(user_ids, message, notification_type)
+
+
+@shared_task
+def process_commission_events():
+    """
+    Turns pending commission events into referrer commissions. Queued
+    when a paid order is recorded and run by beat as a safety net.
+    """
+    # commissions.py needs process_commission_events to exist first.
+    from acctmarket.applications.refer import commissions
+
+    processed = commissions.run()
+    if processed:
+        logger.info(f"Processed {processed} commission events.")
+    return processed
+
+
+@shared_task
+def dispatch_sms_campaign(campaign_id):
+    """Creates a campaign's deliveries and queues their chunks."""
+    # Deferred until the worker runs it; sms.py imports the chunk tasks.
+    from acctmarket.applications.refer import sms
+
+    return sms.start(campaign_id)
+
+
+# A chunk is acknowledged only once it ran, so chunks of a lost worker are
+# delivered again; their claimed deliveries are released by the sweep.
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    soft_time_limit=10 * 60,
+    time_limit=11 * 60,
+)
+def send_sms_chunk(campaign_id, delivery_ids):
+    """Sends one chunk of a campaign's deliveries."""
+    from acctmarket.applications.refer import sms
+
+    return sms.send_chunk(campaign_id, delivery_ids)
+
+
+@shared_task
+def resume_sms_campaigns():
+    """Requeues the deliveries of sending campaigns that stalled."""
+    from acctmarket.applications.refer import sms
+
+    return sms.resume()
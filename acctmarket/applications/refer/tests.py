@@ -1 +1,603 @@
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from acctmarket.applications.ecommerce.models import CartOrder
+from acctmarket.applications.refer import (commissions, ledger, notifications,
+                                           sms, tasks)
+from acctmarket.applications.refer.models import (CommissionEvent,
+                                                  Notification, Referral,
+                                                  ReferrerStats, SMSCampaign,
+                                                  Wallet, WalletTransaction)
+from acctmarket.applications.users.models import Account, Customer
+from acctmarket.applications.users.tests.factories import UserFactory
+from acctmarket.utils import ratelimit
+from acctmarket.utils.choices import (TIER_CHOICE_TYPE, CommissionKind,
+                                      NOTIFICATION_TYPES_Choice,
+                                      SMSCampaignStatusChoices,
+                                      SMSDeliveryStatusChoices,
+                                      WalletTransactionTypeChoice)
+
+pytestmark = pytest.mark.django_db
+
+
+class TestNotificationPagination:
+    def test_pages_are_walked_by_cursor(self, client, user):
+        Notification.objects.bulk_create(
+            Notification(
+                user=user,
+                message=f"Message {i}",
+                notification_type=NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
+            )
+            for i in range(25)
+        )
+        client.force_login(user)
+        url = reverse("refer:notifications")
+        # Only the first page view counts the unread badge.
+        notifications.unread_count(user.pk)
+
+        messages, query_counts = [], []
+        params = {}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params)
+            query_counts.append(len(queries))
+            messages.extend(
+                notification.message
+                for notification in response.context["notifications"]
+            )
+            page = response.context["page_obj"]
+            if not page.has_next():
+                break
+            params = {"cursor": page.next_cursor}
+
+        assert len(messages) == len(set(messages)) == 25
+        assert len(set(query_counts)) == 1
+        assert not any(
+            "OFFSET" in query["sql"] for query in queries.captured_queries
+        )
+
+
+class TestNotificationService:
+    CREDIT = NOTIFICATION_TYPES_Choice.WALLET_CREDIT
+
+    def test_unread_count_is_cached(self, user, django_assert_num_queries):
+        notifications.notify(user.pk, "Hello", self.CREDIT)
+
+        with django_assert_num_queries(1):
+            assert notifications.unread_count(user.pk) == 1
+            assert notifications.unread_count(user.pk) == 1
+
+    def test_new_notifications_bump_the_count_after_commit(
+        self, user, django_capture_on_commit_callbacks,
+        django_assert_num_queries,
+    ):
+        assert notifications.unread_count(user.pk) == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with django_assert_num_queries(1):
+                notifications.notify_many(
+                    [(user.pk, f"Message {i}", self.CREDIT) for i in range(3)],
+                )
+            assert notifications.unread_count(user.pk) == 0
+
+        with django_assert_num_queries(0):
+            assert notifications.unread_count(user.pk) == 3
+
+    def test_mark_read_is_one_update(
+        self, user, django_capture_on_commit_callbacks,
+        django_assert_num_queries,
+    ):
+        first, second, _ = notifications.notify_many(
+            [(user.pk, f"Message {i}", self.CREDIT) for i in range(3)],
+        )
+        assert notifications.unread_count(user.pk) == 3
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with django_assert_num_queries(1):
+                assert notifications.mark_read(
+                    user.pk, [first.pk, second.pk],
+                ) == 2
+        assert notifications.unread_count(user.pk) == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with django_assert_num_queries(1):
+                assert notifications.mark_read(user.pk) == 1
+        with django_assert_num_queries(0):
+            assert notifications.unread_count(user.pk) == 0
+        assert not Notification.objects.filter(read=False).exists()
+
+    def test_broadcast_inserts_in_batches(
+        self, user, django_capture_on_commit_callbacks,
+        django_assert_max_num_queries,
+    ):
+        others = [
+            UserFactory(phone_no=phone_no)
+            for phone_no in ("+447911123456", "+2348031234567")
+        ]
+        notifications.notify(user.pk, "Hello", self.CREDIT)
+        assert notifications.unread_count(user.pk) == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with django_assert_max_num_queries(2 * 3):
+                sent = notifications.broadcast(
+                    [user.pk, *(other.pk for other in others)],
+                    "Maintenance tonight", self.CREDIT, batch_size=2,
+                )
+
+        assert sent == 3
+        assert Notification.objects.filter(
+            message="Maintenance tonight",
+        ).count() == 3
+        assert notifications.unread_count(user.pk) == 2
+
+    def test_broadcast_task_reaches_active_users(self, user):
+        UserFactory(phone_no="+447911123456", is_active=False)
+
+        assert tasks.broadcast_notification("Hi", self.CREDIT) == 1
+        assert Notification.objects.get().user == user
+
+    def test_mark_all_read_view(
+        self, client, user, django_capture_on_commit_callbacks,
+    ):
+        notifications.notify(user.pk, "Hello", self.CREDIT)
+        client.force_login(user)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                reverse("refer:mark_all_notifications_read"),
+            )
+
+        assert response.json()["status"] == "success"
+        assert notifications.unread_count(user.pk) == 0
+        assert not Notification.objects.filter(read=False).exists()
+
+
+@pytest.fixture
+def wallet(user):
+    return Wallet.objects.get(user=user)
+
+
+@pytest.fixture
+def notify_now(monkeypatch):
+    monkeypatch.setattr(
+        tasks.send_wallet_notifications, "delay",
+        tasks.send_wallet_notifications,
+    )
+
+
+class TestWalletLedger:
+    def test_credits_from_stale_instances_are_not_lost(self, wallet):
+        first = Wallet.objects.get(pk=wallet.pk)
+        second = Wallet.objects.get(pk=wallet.pk)
+
+        first.credit_wallet(Decimal("10.00"))
+        second.credit_wallet(Decimal("5.00"))
+
+        assert second.balance == Decimal("15.00")
+        wallet.refresh_from_db()
+        assert wallet.balance == Decimal("15.00")
+        assert sorted(
+            wallet.transactions.values_list("amount", flat=True),
+        ) == [Decimal("5.00"), Decimal("10.00")]
+
+    def test_overdraft_changes_nothing(self, wallet):
+        ledger.credit(wallet.pk, Decimal("3.00"))
+
+        with pytest.raises(ledger.InsufficientFunds):
+            wallet.debit_wallet(Decimal("5.00"))
+
+        wallet.refresh_from_db()
+        assert wallet.balance == Decimal("3.00")
+        assert wallet.transactions.count() == 1
+
+    def test_notifications_are_sent_after_commit(
+        self, wallet, notify_now, django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            ledger.credit(wallet.pk, Decimal("8.00"))
+            assert not Notification.objects.exists()
+            ledger.debit(wallet.pk, Decimal("2.50"))
+
+        # Two notification tasks, each bumping the unread count in turn,
+        # and the owner's dashboard summary dropped after each posting.
+        assert len(callbacks) == 6
+        assert sorted(
+            Notification.objects.values_list("notification_type", flat=True),
+        ) == [
+            NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
+            NOTIFICATION_TYPES_Choice.WALLET_DEBIT,
+        ]
+
+    def test_batch_postings_net_per_wallet(self, wallet):
+        other = Wallet.objects.get(
+            user=UserFactory(phone_no="+15550000001"),
+        )
+        credit = WalletTransactionTypeChoice.CREDIT
+
+        balances = ledger.post_many([
+            (wallet.pk, Decimal("1.00"), credit),
+            (other.pk, Decimal("2.00"), credit),
+            (wallet.pk, Decimal("4.00"), credit),
+        ])
+
+        assert balances == {
+            wallet.pk: Decimal("5.00"),
+            other.pk: Decimal("2.00"),
+        }
+        assert WalletTransaction.objects.count() == 3
+
+    def test_batch_postings_are_all_or_nothing(self, wallet):
+        other = Wallet.objects.get(
+            user=UserFactory(phone_no="+15550000001"),
+        )
+
+        with pytest.raises(ledger.InsufficientFunds):
+            ledger.post_many([
+                (wallet.pk, Decimal("1.00"), WalletTransactionTypeChoice.CREDIT),  # noqa
+                (other.pk, Decimal("1.00"), WalletTransactionTypeChoice.DEBIT),  # noqa
+            ])
+
+        wallet.refresh_from_db()
+        assert wallet.balance == 0
+        assert not WalletTransaction.objects.exists()
+
+    def test_funding_completes_the_referral(self, user, wallet):
+        referrer = UserFactory(phone_no="+15550000001")
+        referral = Referral.objects.create(
+            referrer=referrer, referred_user=user,
+        )
+
+        ledger.credit(wallet.pk, Decimal("5.00"))
+
+        referral.refresh_from_db()
+        assert referral.wallet_funded
+
+
+class TestCommissionEngine:
+    @pytest.fixture
+    def referred(self, user):
+        referred = UserFactory(phone_no="+15550000001")
+        Referral.objects.create(referrer=user, referred_user=referred)
+        return referred
+
+    @pytest.fixture
+    def customer(self, user):
+        return Customer.objects.create(
+            user=user,
+            account=Account.objects.create(owner=user),
+            tier=TIER_CHOICE_TYPE.STARTER,
+        )
+
+    def pay(self, buyer, amount):
+        return CartOrder.objects.create(
+            user=buyer, price=Decimal(amount), paid_status=True,
+        )
+
+    def test_paid_orders_are_recorded_once(self, referred):
+        order = CartOrder.objects.create(user=referred, price=Decimal("20"))
+        assert not CommissionEvent.objects.exists()
+
+        order.paid_status = True
+        order.save()
+        order.save()
+
+        event = CommissionEvent.objects.get()
+        assert event.order == order
+        assert event.processed_at is None
+
+    def test_run_pays_first_purchase_then_ongoing(
+        self, referred, customer, wallet,
+    ):
+        self.pay(referred, "100.00")
+        self.pay(referred, "100.00")
+
+        assert commissions.run() == 2
+
+        assert sorted(
+            CommissionEvent.objects.values_list("kind", "commission"),
+        ) == [
+            (CommissionKind.FIRST_PURCHASE, Decimal("10.00")),
+            (CommissionKind.ONGOING, Decimal("1.00")),
+        ]
+        wallet.refresh_from_db()
+        assert wallet.balance == Decimal("11.00")
+        customer.refresh_from_db()
+        assert customer.commission_balance == Decimal("11.00")
+        stats = ReferrerStats.objects.get(user=customer.user)
+        assert stats.total_spend == Decimal("200.00")
+        assert stats.completed_count == 1
+        referral = Referral.objects.get()
+        assert referral.first_purchase_done
+        assert referral.total_referred_spend == Decimal("200.00")
+        assert commissions.run() == 0
+
+    def test_tier_follows_running_spend(self, referred, customer):
+        self.pay(referred, "450.00")
+        commissions.run()
+        self.pay(referred, "100.00")
+        commissions.run()
+
+        customer.refresh_from_db()
+        assert customer.tier == TIER_CHOICE_TYPE.POWER_REFERRER
+        assert ReferrerStats.for_user(
+            customer.user,
+        ).tier == TIER_CHOICE_TYPE.POWER_REFERRER
+        # The second order was paid at the starter rate.
+        assert CommissionEvent.objects.get(
+            kind=CommissionKind.ONGOING,
+        ).commission == Decimal("1.00")
+
+    def test_small_first_purchase_earns_nothing(
+        self, referred, customer, wallet,
+    ):
+        self.pay(referred, "4.00")
+
+        commissions.run()
+
+        event = CommissionEvent.objects.get()
+        assert event.kind == CommissionKind.NONE
+        assert event.commission == 0
+        wallet.refresh_from_db()
+        assert wallet.balance == 0
+        assert not Referral.objects.get().first_purchase_done
+
+
+class TestReferrerStats:
+    def test_new_referrals_are_counted(self, user):
+        for index in range(2):
+            Referral.objects.create(
+                referrer=user,
+                referred_user=UserFactory(phone_no=f"+1555000000{index}"),
+            )
+        Referral.objects.create(referrer=user)
+
+        stats = ReferrerStats.objects.get(user=user)
+        assert stats.referral_count == 2
+        assert stats.completed_count == 0
+        assert stats.tier == TIER_CHOICE_TYPE.STARTER
+
+    def test_record_moves_tier_with_spend(self, user):
+        ReferrerStats.record(user.pk, spend=Decimal("499.99"))
+        assert ReferrerStats.for_user(user).tier == TIER_CHOICE_TYPE.STARTER
+
+        ReferrerStats.record(user.pk, spend=Decimal("0.01"))
+        assert ReferrerStats.for_user(
+            user,
+        ).tier == TIER_CHOICE_TYPE.POWER_REFERRER
+
+        ReferrerStats.record(user.pk, spend=Decimal("500.00"))
+        stats = ReferrerStats.for_user(user)
+        assert stats.tier == TIER_CHOICE_TYPE.ELITE_REFERRER
+        assert stats.total_spend == Decimal("1000.00")
+
+    def test_referral_stats_read_one_row(
+        self, user, django_assert_num_queries,
+    ):
+        Referral.objects.create(
+            referrer=user,
+            referred_user=UserFactory(phone_no="+15550000001"),
+        )
+        ReferrerStats.record(user.pk, completed=1, spend=Decimal("30.00"))
+
+        with django_assert_num_queries(1):
+            stats = Referral.objects.referral_stats(user)
+
+        assert stats == {
+            "total_spend": Decimal("30.00"),
+            "average_spend": Decimal("30.00"),
+            "referral_count": 1,
+            "completed_count": 1,
+            "tier": TIER_CHOICE_TYPE.STARTER,
+        }
+
+    def test_referral_stats_without_referrals(self, user):
+        stats = Referral.objects.referral_stats(user)
+
+        assert stats["total_spend"] == 0
+        assert stats["average_spend"] == 0
+        assert not ReferrerStats.objects.exists()
+
+    def test_deleting_a_referral_recounts_the_referrer(self, user):
+        referral = Referral.objects.create(
+            referrer=user,
+            referred_user=UserFactory(phone_no="+15550000001"),
+            total_referred_spend=Decimal("0.00"),
+        )
+        ReferrerStats.record(user.pk, completed=1, spend=Decimal("600.00"))
+
+        referral.delete()
+
+        stats = ReferrerStats.objects.get(user=user)
+        assert (stats.referral_count, stats.completed_count) == (0, 0)
+        assert stats.total_spend == Decimal("0.00")
+        assert stats.tier == TIER_CHOICE_TYPE.STARTER
+
+    def test_rebuild_command_fixes_admin_edits(self, user):
+        referral = Referral.objects.create(
+            referrer=user,
+            referred_user=UserFactory(phone_no="+15550000001"),
+        )
+        referral.is_completed = True
+        referral.total_referred_spend = Decimal("750.00")
+        referral.save()
+        untouched = UserFactory(phone_no="+15550000002")
+        Referral.objects.create(referrer=untouched)
+
+        out = StringIO()
+        call_command("rebuild_referrer_stats", stdout=out)
+
+        stats = ReferrerStats.objects.get(user=user)
+        assert stats.completed_count == 1
+        assert stats.total_spend == Decimal("750.00")
+        assert stats.tier == TIER_CHOICE_TYPE.POWER_REFERRER
+        assert "Checked 2 referrers, fixed 1." in out.getvalue()
+
+
+class FakeSMSService:
+    sent = []
+    failing = set()
+
+    def send_sms(self, to, message):
+        if to in self.failing:
+            return None
+        self.sent.append((to, message))
+        return {"sid": f"SM{len(self.sent)}", "status": "queued"}
+
+
+class TestSMSDispatcher:
+    @pytest.fixture
+    def provider(self, monkeypatch):
+        monkeypatch.setattr(FakeSMSService, "sent", [])
+        monkeypatch.setattr(FakeSMSService, "failing", set())
+        monkeypatch.setattr(sms, "TwilloSMSService", FakeSMSService)
+        return FakeSMSService
+
+    @pytest.fixture
+    def chunks(self, monkeypatch, settings):
+        settings.SMS_CHUNK_SIZE = 1
+        queued = []
+        monkeypatch.setattr(
+            tasks.send_sms_chunk, "delay",
+            lambda *args: queued.append(args),
+        )
+        return queued
+
+    @pytest.fixture
+    def campaign(self):
+        for phone_no, opted_in in [
+            ("+14155552671", True),
+            ("+447911123456", True),
+            ("12345", True),
+            ("+2348031234567", False),
+        ]:
+            user = UserFactory(phone_no=phone_no)
+            Customer.objects.create(
+                user=user,
+                account=Account.objects.create(owner=user),
+                sms_opt_in=opted_in,
+            )
+        return SMSCampaign.objects.create(name="Promo", message="Hi!")
+
+    def test_saving_a_draft_queues_dispatch(
+        self, monkeypatch, django_capture_on_commit_callbacks,
+    ):
+        queued = []
+        monkeypatch.setattr(
+            tasks.dispatch_sms_campaign, "apply_async",
+            lambda args, **kwargs: queued.append(args),
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            campaign = SMSCampaign.objects.create(name="Promo", message="Hi!")
+
+        assert queued == [(campaign.pk,)]
+
+    def test_start_records_deliveries_and_queues_chunks(
+        self, campaign, chunks,
+    ):
+        assert sms.start(campaign.pk) == 2
+        assert sms.start(campaign.pk) == 0
+
+        campaign.refresh_from_db()
+        assert campaign.status == SMSCampaignStatusChoices.SENDING
+        assert campaign.total_recipients == 2
+        # The invalid number is never selected.
+        assert sorted(
+            campaign.deliveries.values_list("phone_no", "status"),
+        ) == [
+            ("+14155552671", SMSDeliveryStatusChoices.PENDING),
+            ("+447911123456", SMSDeliveryStatusChoices.PENDING),
+        ]
+        assert len(chunks) == 2
+
+    def test_chunks_send_once_and_finish_the_campaign(
+        self, campaign, chunks, provider,
+    ):
+        provider.failing = {"+447911123456"}
+        sms.start(campaign.pk)
+
+        for args in chunks:
+            sms.send_chunk(*args)
+        # A redelivered chunk finds its deliveries already handled.
+        assert sms.send_chunk(*chunks[0]) == 0
+
+        assert provider.sent == [("+14155552671", "Hi!")]
+        campaign.refresh_from_db()
+        assert campaign.status == SMSCampaignStatusChoices.SENT
+        assert (campaign.sent_count, campaign.failed_count) == (1, 1)
+        assert campaign.progress == 100
+        assert campaign.completed_at is not None
+        sent = campaign.deliveries.get(phone_no="+14155552671")
+        assert sent.status == SMSDeliveryStatusChoices.SENT
+        assert sent.provider_sid == "SM1"
+        assert sent.attempts == 1
+
+    def test_resume_resends_stale_claims(self, campaign, chunks, settings):
+        sms.start(campaign.pk)
+        chunks.clear()
+        delivery = campaign.deliveries.get(phone_no="+14155552671")
+        delivery.status = SMSDeliveryStatusChoices.SENDING
+        delivery.claimed_at = timezone.now() - timedelta(
+            seconds=settings.SMS_DELIVERY_LEASE + 1,
+        )
+        delivery.save()
+
+        assert sms.resume() == 1
+
+        assert chunks == [(campaign.pk, [delivery.pk])]
+        delivery.refresh_from_db()
+        assert delivery.status == SMSDeliveryStatusChoices.PENDING
+
+    def test_rate_limiter_waits_for_the_next_window(self, monkeypatch):
+        clock = [1000.5]
+        monkeypatch.setattr(ratelimit.time, "time", lambda: clock[0])
+        monkeypatch.setattr(
+            ratelimit.time, "sleep",
+            lambda seconds: clock.__setitem__(0, clock[0] + seconds),
+        )
+        limiter = ratelimit.RateLimiter("test", rate=2)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        assert clock == [1001.0]
+
+
+@pytest.mark.usefixtures("seqscan_disabled")
+class TestQueryPatternIndexes:
+    def test_notification_feed_uses_recent_index(self, user):
+        plan = (
+            Notification.objects.filter(user=user)
+            .order_by("-created_at", "-id")[:20]
+            .explain()
+        )
+        assert "notification_user_recent_idx" in plan
+
+    def test_unread_count_uses_partial_index(self, user):
+        plan = Notification.objects.filter(user=user, read=False).explain()
+        assert "notification_unread_idx" in plan
+
+    def test_wallet_history_uses_recent_index(self, user):
+        plan = (
+            WalletTransaction.objects.filter(wallet_id="wallet")
+            .order_by("-created_at", "-id")[:20]
+            .explain()
+        )
+        assert "wallettx_wallet_recent_idx" in plan
+
+    def test_successful_referrals_use_partial_index(self, user):
+        plan = Referral.get_successful_referrals(user).explain()
+        assert "referral_successful_idx" in plan
+
+    def test_sms_recipients_use_partial_index(self):
+        plan = SMSCampaign().get_opted_in_customers().order_by().explain()
+        assert "customer_sms_opt_in_idx" in plan
+        assert "Seq Scan" not in plan
@@ -5,7 +5,6 @@ import logging
 
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
@@ -16,12 +15,15 @@ from django.views.generic import (CreateView, DetailView, ListView,
                                   TemplateView, UpdateView, View)
 from django.views.generic.edit import FormMixin
 
+from acctmarket.applications.ecommerce import webhooks
 from acctmarket.applications.ecommerce.models import Payment
+from acctmarket.applications.refer import notifications
 from acctmarket.applications.refer.forms import WalletFundingForm
 from acctmarket.applications.refer.models import (Notification, Referral,
-                                                  SMSCampaign, Wallet,
-                                                  WalletTransaction)
-from acctmarket.utils.choices import SMSCampaignStatusChoices
+                                                  ReferrerStats, SMSCampaign,
+                                                  Wallet, WalletTransaction)
+from acctmarket.utils.choices import SMSCampaignStatusChoices, WebhookProvider
+from acctmarket.utils.mixins import CursorPaginationMixin
 from acctmarket.utils.payments import (Flutterwave, NowPayment,
                                        convert_to_naira, get_exchange_rate)
 
@@ -52,6 +54,11 @@ class ReferralListView(LoginRequiredMixin, ListView):
             referred_user__isnull=False  # Ensure there's a referred user
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["referral_stats"] = ReferrerStats.for_user(self.request.user)
+        return context
+
 
 class WalletDetailView(LoginRequiredMixin, TemplateView):
     """
@@ -77,17 +84,18 @@ class WalletDetailView(LoginRequiredMixin, TemplateView):
         return context
 
 
-class WalletTrasactionListViews(LoginRequiredMixin, ListView):
+class WalletTrasactionListViews(
+    LoginRequiredMixin, CursorPaginationMixin, ListView,
+):
     model = WalletTransaction
     template_name = "pages/refer/wallet_transaction_list.html"
     context_object_name = "transaction_lists"
+    paginate_by = 20
 
     def get_queryset(self):
         # Get the user's wallet
         user_wallet = self.request.user.wallet
-        return WalletTransaction.objects.filter(
-            wallet=user_wallet
-        ).order_by("-created_at")
+        return WalletTransaction.objects.filter(wallet=user_wallet)
 
 
 class NowPaymentWalletFundView(LoginRequiredMixin, View):
@@ -145,41 +153,27 @@ class NowPaymentWalletFundView(LoginRequiredMixin, View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class NowPaymentCallbackView(LoginRequiredMixin, View):
+class NowPaymentCallbackView(View):
     def post(self, request, *args, **kwargs):
+        """
+        Receives NOWPayments wallet funding callbacks into the webhook
+        inbox. The inbox worker verifies the payment with NOWPayments and
+        credits the wallet once, however often the callback is delivered.
+        """
         logger.info("Received callback POST request.")
 
-        # Step 1: Log the raw request body
         try:
-            raw_body = request.body
-            logger.debug(f"Raw request body (bytes): {raw_body}")
-
-            # Decode it if it's in UTF-8, log it in case decoding fails
-            decoded_body = raw_body.decode('utf-8')
-            logger.debug(f"Decoded request body (string): {decoded_body}")
-        except Exception as e:
-            logger.error(f"Failed to decode request body: {str(e)}")
-            return JsonResponse(
-                {
-                    "status": "error",
-                    "message": "Unable to process request body"
-                },
-                status=400
-            )
-
-        # Step 2: Parse JSON and log the parsed data
-        try:
-            data = json.loads(decoded_body)
+            data = json.loads(request.body.decode("utf-8"))
             logger.debug(f"Parsed callback data: {data}")
-        except json.JSONDecodeError as e:
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
             logger.error(f"Invalid JSON data in callback: {e}")
             return JsonResponse(
                 {"status": "error", "message": "Invalid JSON format"},
                 status=400
             )
 
-        # Step 3: Check for `payment_id` in data and log if missing
-        payment_id = data.get("payment_id")
+        # Check for `payment_id` in data and log if missing
+        payment_id = data.get("payment_id") if isinstance(data, dict) else None  # noqa
         if not payment_id:
             logger.error("No payment_id provided in callback data.")
             return JsonResponse(
@@ -187,41 +181,13 @@ class NowPaymentCallbackView(LoginRequiredMixin, View):
                 status=400
             )
 
-        logger.info(f"Processing callback for payment ID: {payment_id}")
-
-        # Retrieve the Payment instance
-        payment = get_object_or_404(Payment, payment_id=payment_id)
-
-        # Verify the payment status with NOWPayments
-        nowpayment = NowPayment()
-        status, response = nowpayment.verify_payment(payment_id)
-
-        if status and response.get("payment_status") == "finished":
-            try:
-                with transaction.atomic():
-                    # Update payment status and timestamp
-                    payment.status = "completed"
-                    payment.completed_at = timezone.now()
-                    payment.save(update_fields=["status", "completed_at"])
-
-                    # Credit the user's wallet
-                    wallet = payment.wallet
-                    wallet.credit_wallet(payment.amount)
-
-                    # Log success
-                    logger.info(
-                        f"Payment ID {payment_id} verified and wallet credited with {payment.amount} for user {payment.user.username}."  # noqa
-                    )
-                    return JsonResponse({"status": "success", "message": "Wallet credited successfully"}, status=200)  # noqa
-
-            except Exception as e:
-                # Handle and log any errors during transaction processing
-                logger.error(f"Error during transaction processing for payment ID {payment_id}: {str(e)}")  # noqa
-                return JsonResponse({"status": "error", "message": "Transaction processing error"}, status=500)  # noqa
-        else:
-            # Handle invalid or incomplete payments
-            logger.warning(f"Payment ID {payment_id} verification failed or incomplete.")  # noqa
-            return JsonResponse({"status": "error", "message": "Invalid or incomplete payment status"}, status=400)  # noqa
+        logger.info(f"Queueing callback for payment ID: {payment_id}")
+        webhooks.ingest(
+            WebhookProvider.NOWPAYMENTS_WALLET,
+            f"{payment_id}:{data.get('payment_status')}",
+            data,
+        )
+        return JsonResponse({"status": "received"}, status=200)
 
 
 # class FlutterWalletFundView(View):
@@ -352,25 +318,35 @@ class FlutterwaveCallbackView(LoginRequiredMixin, View):
                 "Payment was not successful or transaction ID missing."
             )
 
-        # Verify payment with Flutterwave
-        flutterwave = Flutterwave()
-        verification_result = flutterwave.verify_payment(transaction_id)
-
-        if verification_result["status"] == "success":
-            # amount = verification_result["amount"]
-
-            # Extract the original amount (USD) from the tx_ref
-            original_amount = request.session.get("original_amount")
-            if not original_amount:
-                logger.error("Original amount not found in session.")
-                return HttpResponseBadRequest("Invalid session state.")
-            user_wallet = get_object_or_404(Wallet, user=request.user)
-            user_wallet.credit_wallet(original_amount)
-            logger.info(f"Wallet credited with {original_amount} for user {request.user.id}.")  # noqa
+        original_amount = request.session.get("original_amount")
+        if not original_amount:
+            logger.error("Original amount not found in session.")
+            return HttpResponseBadRequest("Invalid session state.")
+
+        # One payment per Flutterwave transaction, so a reloaded callback
+        # or a late re-verification never credits the wallet twice.
+        user_wallet = get_object_or_404(Wallet, user=request.user)
+        payment, _created = Payment.objects.get_or_create(
+            reference=f"flutterwave_{transaction_id}",
+            defaults={
+                "user": request.user,
+                "order": None,
+                "wallet": user_wallet,
+                "amount": original_amount,
+            },
+        )
+        if payment.verify_flutterwave_funding(transaction_id):
+            logger.info(f"Wallet credited with {payment.amount} for user {request.user.id}.")  # noqa
             return redirect("referals:funding_success")
+        if payment.status == "processing":
+            return render(
+                request,
+                "pages/payment_pending.html",
+                {"continue_url": reverse("referals:walet_detail")},
+            )
 
-        logger.error(f"Flutterwave callback verification failed for transaction {transaction_id}: {verification_result['message']}")  # noqa
-        return JsonResponse({"error": verification_result["message"]}, status=400)  # noqa
+        logger.error(f"Flutterwave callback verification failed for transaction {transaction_id}.")  # noqa
+        return JsonResponse({"error": "Payment verification failed."}, status=400)  # noqa
 
 
 class WalletFundingSuccessView(LoginRequiredMixin, View):
@@ -388,16 +364,16 @@ class WalletFundingCancelView(LoginRequiredMixin, View):
         return render(request, "pages/refer/funding_cancel.html")
 
 
-class NotificationListView(LoginRequiredMixin, ListView):
+class NotificationListView(
+    LoginRequiredMixin, CursorPaginationMixin, ListView,
+):
     model = Notification
     template_name = "pages/refer/notification_list.html"
     context_object_name = "notifications"
     paginate_by = 10  # Number of notifications per page
 
     def get_queryset(self):
-        return Notification.objects.filter(
-            user=self.request.user
-        ).order_by("-created_at")
+        return Notification.objects.filter(user=self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -411,11 +387,7 @@ class MarkAllNotificationsReadView(LoginRequiredMixin, View):
     """Handles AJAX request to mark all notifications as read."""
 
     def post(self, request, *args, **kwargs):
-        unread_notifications = Notification.objects.filter(
-            user=request.user, read=False
-        )
-        for notification in unread_notifications:
-            notification.mark_as_read()  # Use model method
+        notifications.mark_read(request.user.pk)
         return JsonResponse({
             "status": "success",
             "message": "All notifications marked as read."
@@ -0,0 +1,115 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from acctmarket.applications.ecommerce.models import CartOrderItems
+from acctmarket.applications.refer import notifications
+from acctmarket.applications.refer.models import ReferrerStats, Wallet
+from acctmarket.applications.users.models import Customer, User
+from acctmarket.utils.choices import TIER_CHOICE_TYPE
+
+logger = logging.getLogger(__name__)
+
+ZERO = Value(Decimal("0.00"))
+
+# Part of every summary key; raise it when _build adds, drops or renames
+# a figure, since the dashboard view and its JSON endpoint read the
+# cached dict by name.
+DASHBOARD_SUMMARY_VERSION = 1
+
+
+def _summary_key(user_id):
+    return f"dashboard:v{DASHBOARD_SUMMARY_VERSION}:summary:{user_id}"
+
+
+def _scalar(queryset, field):
+    return Subquery(queryset.values(field)[:1])
+
+
+def _build(user_id):
+    """
+    Reads every dashboard figure of the user with one query: the wallet,
+    customer profile and referrer stats rows are one-row subqueries and
+    the purchased items are counted in another.
+    """
+    customer = Customer.objects.filter(user=OuterRef("pk")).order_by(
+        "created_at",
+    )
+    stats = ReferrerStats.objects.filter(user=OuterRef("pk"))
+    purchased = (
+        CartOrderItems.objects.filter(
+            order__user=OuterRef("pk"), order__paid_status=True,
+        )
+        .order_by()
+        .values("order__user")
+        .annotate(count=Count("pk"))
+    )
+    row = (
+        User.objects.filter(pk=user_id)
+        .annotate(
+            wallet_balance=Coalesce(
+                _scalar(Wallet.objects.filter(user=OuterRef("pk")), "balance"),
+                ZERO,
+            ),
+            referral_code=_scalar(customer, "referral_code"),
+            tier=_scalar(customer, "tier"),
+            referral_count=Coalesce(_scalar(stats, "referral_count"), 0),
+            completed_count=Coalesce(_scalar(stats, "completed_count"), 0),
+            total_spend=Coalesce(_scalar(stats, "total_spend"), ZERO),
+            referral_tier=Coalesce(
+                _scalar(stats, "tier"), Value(TIER_CHOICE_TYPE.STARTER),
+            ),
+            purchased_product_count=Coalesce(_scalar(purchased, "count"), 0),
+        )
+        .values(
+            "wallet_balance",
+            "referral_code",
+            "tier",
+            "referral_count",
+            "completed_count",
+            "total_spend",
+            "referral_tier",
+            "purchased_product_count",
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    row["referral_link"] = Customer(
+        referral_code=row["referral_code"],
+    ).get_referral_link
+    return row
+
+
+def get_summary(user_id):
+    """
+    Returns the user's dashboard figures from the cache, building and
+    storing them when they are missing. The unread notification count has
+    its own cache and is added on every read.
+    """
+    key = _summary_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build(user_id)
+        if summary is None:
+            return None
+        cache.set(key, summary, settings.DASHBOARD_CACHE_TIMEOUT)
+    return {
+        **summary,
+        "notification_unread_count": notifications.unread_count(user_id),
+    }
+
+
+def invalidate(*user_ids):
+    """
+    Drops the cached summaries of the given users once the current
+    transaction commits, so the next read rebuilds them.
+    """
+    keys = [_summary_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.10 on 2026-10-18 01:32
+
+import phonenumbers
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def to_e164(phone_no, phone_region):
+    # A copy of User.to_e164 as it stood when this migration was written.
+    if not phone_no:
+        return ""
+    try:
+        parsed_number = phonenumbers.parse(phone_no, phone_region)
+    except phonenumbers.NumberParseException:
+        return ""
+    if not phonenumbers.is_valid_number(parsed_number):
+        return ""
+    return phonenumbers.format_number(
+        parsed_number, phonenumbers.PhoneNumberFormat.E164,
+    )
+
+
+def backfill_phone_e164(apps, schema_editor):
+    User = apps.get_model("users", "User")
+
+    users = User.objects.order_by("pk").only(
+        "pk", "phone_no", "phone_region",
+    )
+    batch = []
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        user.phone_e164 = to_e164(user.phone_no, user.phone_region)
+        if user.phone_e164:
+            batch.append(user)
+        if len(batch) == BATCH_SIZE:
+            User.objects.bulk_update(batch, ["phone_e164"])
+            batch = []
+    User.objects.bulk_update(batch, ["phone_e164"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_alter_user_phone_no'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_e164',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('sms_opt_in', True)), fields=['user'], name='customer_sms_opt_in_idx'),
+        ),
+        migrations.RunPython(
+            backfill_phone_e164, migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('phone_e164', ''), _negated=True), fields=['phone_e164'], name='user_phone_e164_idx'),
+        ),
+    ]
@@ -24,6 +24,12 @@ from .managers import UserManager
 
 logger = logging.getLogger(__name__)
 
+# Referred spend needed for each tier above Starter, highest first.
+REFERRAL_TIER_THRESHOLDS = (
+    (Decimal("1000.00"), TIER_CHOICE_TYPE.ELITE_REFERRER),
+    (Decimal("500.00"), TIER_CHOICE_TYPE.POWER_REFERRER),
+)
+
 
 class User(UIDTimeBasedModel, AbstractUser):
     """
@@ -39,6 +45,13 @@ class User(UIDTimeBasedModel, AbstractUser):
     email: str = EmailField(_("email address"), unique=True)
     username = None  # type: ignore[assignment]
     phone_no: str = CharField(_("Phone number"), unique=True)
+    # phone_no normalised to E.164 on save; blank when it is not valid.
+    phone_e164 = models.CharField(
+        max_length=20,
+        blank=True,
+        default="",
+        editable=False,
+    )
     phone_region = models.CharField(
         max_length=2,
         choices=get_region_choices(),
@@ -57,6 +70,17 @@ class User(UIDTimeBasedModel, AbstractUser):
 
     objects = UserManager()
 
+    class Meta(UIDTimeBasedModel.Meta):
+        indexes = [
+            # Users with a valid number, for bulk messaging and lookups
+            # by number.
+            models.Index(
+                fields=["phone_e164"],
+                condition=~models.Q(phone_e164=""),
+                name="user_phone_e164_idx",
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         """
         Validate phone number uniqueness
@@ -66,6 +90,12 @@ class User(UIDTimeBasedModel, AbstractUser):
             raise ValidationError(
                 f"The phone number {self.phone_no} is already in use."  # noqa
             )
+        self.phone_e164 = self.to_e164(self.phone_no, self.phone_region) or ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and not {
+            "phone_no", "phone_region",
+        }.isdisjoint(update_fields):
+            kwargs["update_fields"] = {*update_fields, "phone_e164"}
         super().save(*args, **kwargs)
 
     def is_phone_no_unique(self):
@@ -108,13 +138,18 @@ class User(UIDTimeBasedModel, AbstractUser):
         Returns:
             str: Phone number in E.164 format if valid, otherwise None.
         """
+        return self.phone_e164 or None
+
+    @staticmethod
+    def to_e164(phone_no, phone_region=None):
+        """
+        ``phone_no`` in E.164 format, read in ``phone_region`` if it has no
+        country code, or None if invalid.
+        """
+        if not phone_no:
+            return None
         try:
-            # Use self.phone_region to provide context
-            # if the country code is missing
-            parsed_number = phonenumbers.parse(
-                self.phone_no,
-                self.phone_region,
-            )
+            parsed_number = phonenumbers.parse(phone_no, phone_region)
             # Check if the number is valid
             if phonenumbers.is_valid_number(parsed_number):
                 # Return in E.164 format
@@ -131,15 +166,10 @@ class User(UIDTimeBasedModel, AbstractUser):
         """
         Return the user's role based on their associated profile.
         """
-        if self.is_superuser:
-            return "admin"
-        if CustomerSupportRepresentative.objects.filter(user=self).exists():
-            return "customer_support"
-        if ContentManager.objects.filter(user=self).exists():
-            return "content_manager"
-        if Customer.objects.filter(user=self).exists():
-            return "customer"
-        return "unknown"
+        # roles.py imports the profile models defined below.
+        from acctmarket.applications.users import roles
+
+        return roles.primary_role(self)
 
     def generate_otp(self):
         """
@@ -263,6 +293,15 @@ class Customer(BaseProfile):
         null=True,
     )
 
+    class Meta(BaseProfile.Meta):
+        indexes = [
+            models.Index(
+                fields=["user"],
+                condition=models.Q(sms_opt_in=True),
+                name="customer_sms_opt_in_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.user.name
 
@@ -301,21 +340,24 @@ class Customer(BaseProfile):
         )
         return f"Use this link to join and enjoy exclusive benefits!: {referral_link} "  # noqa
 
+    @staticmethod
+    def tier_for_spend(total_spent):
+        """The referral tier earned by ``total_spent`` of referred spend."""
+        for threshold, tier in REFERRAL_TIER_THRESHOLDS:
+            if total_spent >= threshold:
+                return tier
+        return TIER_CHOICE_TYPE.STARTER
+
     def update_tier(self):
         """
         Updates the customer's referral tier
         based on referred users' spending.
+
+        Reads the referrer's materialised stats instead of re-aggregating
+        their referrals.
         """
         total_spent = self.get_total_spent_by_referrals()
-        if total_spent == Decimal("0.00"):
-            # Optional: Log or notify if no spend has occurred yet.
-            self.tier = TIER_CHOICE_TYPE.STARTER
-        elif total_spent >= 1000:
-            self.tier = TIER_CHOICE_TYPE.ELITE_REFERRER
-        elif total_spent >= 500:
-            self.tier = TIER_CHOICE_TYPE.POWER_REFERRER
-        else:
-            self.tier = TIER_CHOICE_TYPE.STARTER
+        self.tier = self.tier_for_spend(total_spent)
 
         # Log the tier update for debugging purposes
         logger.info(
@@ -326,9 +368,9 @@ class Customer(BaseProfile):
 
     def get_total_spent_by_referrals(self):
         """
-        Calculates the total amount spent by referred users.
+        Returns the total amount spent by referred users.
         """
-        from acctmarket.applications.refer.models import Referral
+        from acctmarket.applications.refer.models import ReferrerStats
 
         # Ensure that the user exists (edge case handling)
         if not self.user:
@@ -337,19 +379,7 @@ class Customer(BaseProfile):
             )  # noqa
             return Decimal("0.00")
 
-        # Fetch the total spend of referred users by
-        # summing 'total_referred_spend'
-        total_spent = Referral.objects.filter(referrer=self.user).aggregate(
-            total_spent=models.Sum("total_referred_spend"),
-        )["total_spent"] or Decimal("0.00")
-
-        # Enhanced logging for better insight
-        if total_spent == Decimal("0.00"):
-            logger.info(
-                f"No spend recorded for referrals of user {self.user.username}."  # noqa
-            )  # noqa
-
-        return total_spent
+        return ReferrerStats.for_user(self.user).total_spend
 
     def update_referrer_commission(self, purchase_amount):
         """
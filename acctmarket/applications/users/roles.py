@@ -0,0 +1,86 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Value
+
+from acctmarket.applications.users.models import (
+    Administrator, ContentManager, Customer, CustomerSupportRepresentative)
+
+logger = logging.getLogger(__name__)
+
+ADMIN = "admin"
+ADMINISTRATOR = "administrator"
+CUSTOMER_SUPPORT = "customer_support"
+CONTENT_MANAGER = "content_manager"
+CUSTOMER = "customer"
+UNKNOWN = "unknown"
+
+# The profile a user needs for each role.
+ROLE_PROFILES = {
+    ADMINISTRATOR: Administrator,
+    CUSTOMER_SUPPORT: CustomerSupportRepresentative,
+    CONTENT_MANAGER: ContentManager,
+    CUSTOMER: Customer,
+}
+
+# The roles ``User.role`` picks from, first match wins.
+PRIMARY_ROLES = (CUSTOMER_SUPPORT, CONTENT_MANAGER, CUSTOMER)
+
+# Part of every roles key; raise it when a role is renamed or
+# ROLE_PROFILES maps it to another profile, as the cached sets store
+# the role names themselves.
+ROLES_VERSION = 1
+
+
+def _roles_key(user_id):
+    return f"roles:v{ROLES_VERSION}:{user_id}"
+
+
+def _load(user_id):
+    """Resolves the user's profile roles with one ``UNION`` query."""
+    queries = [
+        model.objects.filter(user_id=user_id)
+        .order_by()
+        .annotate(role=Value(role, output_field=CharField()))
+        .values_list("role", flat=True)
+        for role, model in ROLE_PROFILES.items()
+    ]
+    return frozenset(queries[0].union(*queries[1:]))
+
+
+def get_roles(user):
+    """
+    Returns the profile roles of ``user`` from the cache, resolving and
+    storing them when they are missing. Anonymous users have none.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = _roles_key(user.pk)
+    roles = cache.get(key)
+    if roles is None:
+        roles = _load(user.pk)
+        cache.set(key, roles, settings.ROLE_CACHE_TIMEOUT)
+    return roles
+
+
+def has_role(user, role):
+    return role in get_roles(user)
+
+
+def primary_role(user):
+    """The role ``User.role`` reports: superusers first, then profiles."""
+    if user.is_superuser:
+        return ADMIN
+    roles = get_roles(user)
+    return next((role for role in PRIMARY_ROLES if role in roles), UNKNOWN)
+
+
+def invalidate(user_id):
+    """
+    Drops the cached roles of the user once the current transaction
+    commits, so the next check resolves them from committed profiles.
+    """
+    key = _roles_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,61 @@
+import logging
+
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from acctmarket.applications.ecommerce.models import CartOrder
+from acctmarket.applications.refer import ledger
+from acctmarket.applications.refer.models import (ReferrerStats, Wallet,
+                                                  referrer_stats_changed)
+from acctmarket.applications.users import dashboard, roles
+from acctmarket.applications.users.models import (
+    Administrator, ContentManager, Customer, CustomerSupportRepresentative)
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=ReferrerStats)
+@receiver(post_delete, sender=ReferrerStats)
+@receiver(post_save, sender=CartOrder)
+@receiver(post_delete, sender=CartOrder)
+def invalidate_dashboard_summary(sender, instance, **kwargs):
+    """Drops the summary of the user whose dashboard figures changed."""
+    dashboard.invalidate(instance.user_id)
+
+
+@receiver(ledger.wallet_balance_changed)
+def invalidate_dashboard_balance(sender, user_id, **kwargs):
+    dashboard.invalidate(user_id)
+
+
+@receiver(referrer_stats_changed)
+def invalidate_dashboard_referrals(sender, user_ids, **kwargs):
+    dashboard.invalidate(*user_ids)
+
+
+@receiver(post_save, sender=Administrator)
+@receiver(post_delete, sender=Administrator)
+@receiver(post_save, sender=CustomerSupportRepresentative)
+@receiver(post_delete, sender=CustomerSupportRepresentative)
+@receiver(post_save, sender=ContentManager)
+@receiver(post_delete, sender=ContentManager)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_roles(sender, instance, created=True, **kwargs):
+    """
+    Drops the cached roles of the user whose profile was created or
+    deleted; ``post_delete`` sends no ``created``.
+    """
+    if created:
+        roles.invalidate(instance.user_id)
+
+
+@receiver(user_logged_in)
+def resolve_roles_on_login(sender, request, user, **kwargs):
+    """Resolves the roles once at login, so later requests only read them."""
+    roles.get_roles(user)
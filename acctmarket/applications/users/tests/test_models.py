@@ -1,5 +1,70 @@
-from acctmarket.applications.users.models import User
+import pytest
+
+from acctmarket.applications.users import roles
+from acctmarket.applications.users.models import (Account, ContentManager,
+                                                  Customer, User)
+from acctmarket.applications.users.tests.factories import UserFactory
 
 
 def test_user_get_absolute_url(user: User):
     assert user.get_absolute_url() == f"/users/{user.pk}/"
+
+
+@pytest.mark.django_db
+class TestPhoneE164:
+    def test_save_normalises_the_number(self):
+        user = UserFactory(phone_no="0803 123 4567", phone_region="NG")
+
+        assert user.phone_e164 == "+2348031234567"
+        assert user.formatted_phone_number == "+2348031234567"
+
+    def test_invalid_numbers_are_blank(self):
+        user = UserFactory(phone_no="12345")
+
+        assert user.phone_e164 == ""
+        assert user.formatted_phone_number is None
+
+    def test_partial_saves_keep_it_in_step(self):
+        user = UserFactory(phone_no="12345")
+        user.phone_no = "+447911123456"
+        user.save(update_fields=["phone_no"])
+
+        user.refresh_from_db()
+        assert user.phone_e164 == "+447911123456"
+
+
+@pytest.mark.django_db
+class TestRoles:
+    def test_roles_are_resolved_once(
+        self, user: User, django_assert_num_queries,
+    ):
+        account = Account.objects.create(owner=user)
+        ContentManager.objects.create(user=user, account=account)
+        Customer.objects.create(user=user, account=account)
+
+        with django_assert_num_queries(1):
+            assert roles.get_roles(user) == {
+                roles.CONTENT_MANAGER, roles.CUSTOMER,
+            }
+            assert user.role == roles.CONTENT_MANAGER
+            assert not roles.has_role(user, roles.ADMINISTRATOR)
+
+    def test_profile_changes_drop_cached_roles(
+        self, user: User, django_capture_on_commit_callbacks,
+    ):
+        assert user.role == roles.UNKNOWN
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer = Customer.objects.create(
+                user=user, account=Account.objects.create(owner=user),
+            )
+        assert user.role == roles.CUSTOMER
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer.delete()
+        assert user.role == roles.UNKNOWN
+
+    def test_superusers_are_admins(self, user: User):
+        user.is_superuser = True
+
+        assert user.role == roles.ADMIN
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from http import HTTPStatus
 
 import pytest
@@ -11,12 +12,16 @@ from django.test import RequestFactory
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from acctmarket.applications.refer import ledger, notifications, tasks
+from acctmarket.applications.refer.models import Referral
+from acctmarket.applications.users import dashboard
 from acctmarket.applications.users.forms import UserAdminChangeForm
-from acctmarket.applications.users.models import User
+from acctmarket.applications.users.models import Account, Customer, User
 from acctmarket.applications.users.tests.factories import UserFactory
 from acctmarket.applications.users.views import (UserRedirectView,
                                                  UserUpdateView,
                                                  user_detail_view)
+from acctmarket.utils.choices import NOTIFICATION_TYPES_Choice
 
 pytestmark = pytest.mark.django_db
 
@@ -98,3 +103,86 @@ class TestUserDetailView:
         assert isinstance(response, HttpResponseRedirect)
         assert response.status_code == HTTPStatus.FOUND
         assert response.url == f"{login_url}?next=/fake-url/"
+
+
+class TestCustomerDashboardView:
+    def refer(self, user, count):
+        start = Referral.objects.count()
+        for i in range(start, start + count):
+            referred = UserFactory(phone_no=f"+1555{i:07d}")
+            Referral.objects.create(referrer=user, referred_user=referred)
+            notifications.notify(
+                user.pk,
+                f"{referred.email} joined",
+                NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
+            )
+
+    def test_queries_do_not_grow_with_activity(
+        self, client, query_budget, user: User,
+        django_capture_on_commit_callbacks,
+    ):
+        Customer.objects.create(
+            user=user, account=Account.objects.create(owner=user),
+        )
+        client.force_login(user)
+        url = reverse("users:customer_dashboard")
+        # The first view counts the unread badge, later ones read it.
+        client.get(url)
+        with django_capture_on_commit_callbacks(execute=True):
+            self.refer(user, 1)
+        small = query_budget(url, 5)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.refer(user, 10)
+        large = query_budget(url, 5)
+
+        assert large.queries == small.queries
+
+    def test_summary_is_one_cached_query(
+        self, user: User, django_assert_num_queries,
+    ):
+        customer = Customer.objects.create(
+            user=user, account=Account.objects.create(owner=user),
+        )
+        notifications.unread_count(user.pk)
+
+        with django_assert_num_queries(1):
+            summary = dashboard.get_summary(user.pk)
+        with django_assert_num_queries(0):
+            assert dashboard.get_summary(user.pk) == summary
+
+        assert summary["referral_code"] == customer.referral_code
+        assert summary["referral_link"] == customer.get_referral_link
+        assert summary["wallet_balance"] == 0
+        assert summary["referral_count"] == 0
+        assert summary["purchased_product_count"] == 0
+
+    def test_summary_follows_wallet_and_referrals(
+        self, user: User, django_capture_on_commit_callbacks, monkeypatch,
+    ):
+        monkeypatch.setattr(
+            tasks.send_wallet_notifications, "delay", lambda *args: None,
+        )
+        dashboard.get_summary(user.pk)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            ledger.credit(user.wallet.pk, Decimal("12.50"))
+            Referral.objects.create(
+                referrer=user,
+                referred_user=UserFactory(phone_no="+447911123456"),
+            )
+
+        summary = dashboard.get_summary(user.pk)
+        assert summary["wallet_balance"] == Decimal("12.50")
+        assert summary["referral_count"] == 1
+
+    def test_summary_endpoint(self, client, user: User):
+        notifications.notify(
+            user.pk, "Hello", NOTIFICATION_TYPES_Choice.WALLET_CREDIT,
+        )
+        client.force_login(user)
+
+        response = client.get(reverse("users:customer_dashboard_summary"))
+
+        assert response.json()["notification_unread_count"] == 1
+        assert response.json()["wallet_balance"] == "0.00"
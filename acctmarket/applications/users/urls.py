@@ -5,6 +5,7 @@ from acctmarket.applications.users.views import (accountant_account,
                                                  content_manager_account,
                                                  content_manager_dashboard,
                                                  customer_dashboard,
+                                                 customer_dashboard_summary,
                                                  customer_support_reps,
                                                  customers_account,
                                                  dashboard_view, resend_otp,
@@ -44,6 +45,11 @@ urlpatterns = [
         view=customer_dashboard,
         name="customer_dashboard"
     ),
+    path(
+        "dashboard/customer/summary",
+        view=customer_dashboard_summary,
+        name="customer_dashboard_summary"
+    ),
     path(
         "dashboard/content-manager",
         view=content_manager_dashboard,
@@ -7,7 +7,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import ValidationError
 from django.db import DatabaseError, IntegrityError, transaction
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.translation import gettext_lazy as _
@@ -16,9 +16,9 @@ from django.views.generic import (DetailView, FormView, RedirectView,
 from django.views.generic.edit import CreateView
 
 from acctmarket.applications.blog.models import Post
-from acctmarket.applications.ecommerce.models import (CartOrder,
-                                                      CartOrderItems, Product)
-from acctmarket.applications.refer.models import Notification, Referral, Wallet
+from acctmarket.applications.ecommerce.models import CartOrder, Product
+from acctmarket.applications.refer.models import Notification, Referral
+from acctmarket.applications.users import dashboard, roles
 from acctmarket.applications.users.forms import (CustomSignupForm,
                                                  CustomUserCreationForm,
                                                  OTPVerificationForm)
@@ -100,47 +100,20 @@ class CustomerDashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
 
         user = self.request.user
-        get_successful_referrals = Referral.get_successful_referrals(user)
-        notifications: Notification = Notification.objects.all()
-        # Wallet Information
-        try:
-            wallet = Wallet.objects.get(user=user)
-        except Wallet.DoesNotExist:
-            wallet = None
-
-        # Referral Information
-        customer, created = Customer.objects.get_or_create(user=user)
-        # referral, created = Referral.objects.get_or_create(referrer=user)
-        referred_user_count = get_successful_referrals.filter(
-            referred_user__isnull=False  # Ensure there's a referred user
-        ).count
-        successful_referrals = get_successful_referrals
-
-        purchased_product_count = CartOrderItems.objects.filter(
-            order__user=user,
-            order__paid_status=True,
-        ).select_related("product", "order").count()
-
-        notifications = notifications.filter(
-            user=user, read=False
-        )[:5]
-        notification_unread_count = Notification.get_unread_count(
-            user
-        )
-        get_customer = Customer.objects.get(
-            user=self.request.user
-        )
+        summary = dashboard.get_summary(user.pk)
+        # The cached count spares the query when nothing is unread.
+        if summary["notification_unread_count"]:
+            notifications = Notification.objects.filter(
+                user=user, read=False
+            )[:5]
+        else:
+            notifications = Notification.objects.none()
 
-        # Add wallet and referral data to the context
-        context["wallet_balance"] = wallet.balance if wallet else 0
-        context["referral_code"] = customer.referral_code
-        context["referral_link"] = customer.get_referral_link
-        context["successful_referrals"] = successful_referrals
-        context["referred_user_count"] = referred_user_count
-        context["purchased_product_count"] = purchased_product_count
+        context.update(summary)
+        context["referred_user_count"] = summary["referral_count"]
         context["notifications"] = notifications
-        context["notification_unread_count"] = notification_unread_count
-        context["get_customer"] = get_customer
+        # dashboardbase.html shows the tier as ``get_customer.tier``.
+        context["get_customer"] = summary
 
         return context
 
@@ -148,6 +121,16 @@ class CustomerDashboardView(LoginRequiredMixin, TemplateView):
 customer_dashboard = CustomerDashboardView.as_view()
 
 
+class CustomerDashboardSummaryView(LoginRequiredMixin, View):
+    """Returns the dashboard figures as JSON for the async widgets."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(dashboard.get_summary(request.user.pk))
+
+
+customer_dashboard_summary = CustomerDashboardSummaryView.as_view()
+
+
 class ContentManagerDashboard(LoginRequiredMixin, TemplateView):
     template_name = "pages/dashboard/content_manager.html"
 
@@ -592,7 +575,7 @@ class CustomLoginView(LoginView):
         user = form.user
 
         # Check if the user has a Customer profile and `phone_verified`
-        is_customer = Customer.objects.filter(user=user).exists()
+        is_customer = roles.has_role(user, roles.CUSTOMER)
         if is_customer:
             print(f"User {user} is a customer.")  # Debug statement
             if not user.phone_verified:
@@ -2,6 +2,7 @@ import pytest
 
 from acctmarket.applications.users.models import User
 from acctmarket.applications.users.tests.factories import UserFactory
+from acctmarket.utils.metrics import request_metrics_recorded
 
 
 @pytest.fixture(autouse=True)
@@ -12,3 +13,54 @@ def _media_storage(settings, tmpdir) -> None:
 @pytest.fixture
 def user(db) -> User:
     return UserFactory()
+
+
+@pytest.fixture
+def seqscan_disabled(db) -> None:
+    """
+    Makes the planner avoid sequential scans and explicit sorts for the
+    rest of the test, so EXPLAIN shows which index a query would use on a
+    large table whatever the statistics of the nearly empty test tables.
+    """
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_sort = off")
+
+
+@pytest.fixture
+def request_metrics():
+    """
+    Collects the ``RequestMetrics`` of every request the test client makes,
+    so tests can hold views to a query budget.
+    """
+    recorded = []
+
+    def record(sender, metrics, **kwargs):
+        recorded.append(metrics)
+
+    request_metrics_recorded.connect(record)
+    yield recorded
+    request_metrics_recorded.disconnect(record)
+
+
+@pytest.fixture
+def query_budget(client, request_metrics):
+    """
+    ``query_budget(url, budget)`` GETs ``url`` with the test client and
+    fails if the view ran more than ``budget`` SQL queries. Returns the
+    request's metrics.
+    """
+
+    def check(url, budget, **params):
+        response = client.get(url, params)
+        assert response.status_code == 200
+        metrics = request_metrics[-1]
+        assert metrics.queries <= budget, (
+            f"{url} ran {metrics.queries} queries, over its budget of "
+            f"{budget}."
+        )
+        return metrics
+
+    return check
@@ -86,12 +86,20 @@ $(document).ready(function () {
 // -------------------------------------- Filter Products
 /**
  * Handles filtering of products based on selected criteria (e.g., price, attributes).
+ * The endpoint returns one page of products at a time together with the
+ * sidebar facet counts, so further pages are appended with "Load more".
  */
 $(document).ready(function () {
-    $(".filter-checkbox, #price-filter-btn").on("click", function () {
-        console.log("Checkbox or button clicked");
+    let filter_object = {};
+    let next_page = 1;
 
-        let filter_object = {};
+    function escapeHtml(value) {
+        return $("<div>").text(value).html();
+    }
+
+    // Collects the active sidebar filters into filter_object
+    function readFilters() {
+        filter_object = {};
 
         let min_price = $("#max_price").attr("min");
         let max_price = $("#max_price").val();
@@ -105,24 +113,74 @@ $(document).ready(function () {
                 document.querySelectorAll(`input[data-filter="${filter_key}"]:checked`)
             ).map(element => element.value);
         });
+    }
 
-        console.log("Filter object is", filter_object);
+    // Re-renders the category and price counts, keeping checked categories
+    function renderFacets(facets) {
+        let selected = filter_object["category[]"] || [];
+
+        let categories = facets.categories.map(category => `
+            <li>
+              <label>
+                <input type="checkbox" class="filter-checkbox" data-filter="category[]"
+                       value="${category.id}" ${selected.includes(String(category.id)) ? "checked" : ""} />
+                ${escapeHtml(category.title)} (${category.count})
+              </label>
+            </li>`).join("");
+
+        let price_buckets = facets.price_buckets.map(bucket => `
+            <li>
+              $${bucket.min}${bucket.max ? ` - $${bucket.max}` : "+"} (${bucket.count})
+            </li>`).join("");
+
+        $("#product-facets").html(`
+            <div class="section-title mt-40"><h3>Categories</h3></div>
+            <ul class="facet-categories">${categories}</ul>
+            <div class="section-title mt-40"><h3>Prices</h3></div>
+            <ul class="facet-prices">${price_buckets}</ul>`);
+    }
+
+    // Shows the "Load more" button below the products while pages remain
+    function toggleLoadMore(has_next) {
+        let button = $("#load-more-products");
+        if (!button.length) {
+            button = $('<button type="button" id="load-more-products">Load more</button>');
+            $("#filtered-product").after(button);
+        }
+        button.toggle(has_next);
+    }
 
+    function loadProducts(append) {
         $.ajax({
             url: "/filter-product",
-            data: filter_object,
+            data: {...filter_object, page: next_page},
+            traditional: true, // Send "category[]" once per value
             dataType: "json",
-            beforeSend: function () {
-                console.log("Before send");
-            },
             success: function (response) {
-                console.log("Success");
-                $("#filtered-product").html(response.data);
+                if (append) {
+                    $("#filtered-product").append(response.data);
+                } else {
+                    $("#filtered-product").html(response.data);
+                }
+                renderFacets(response.facets);
+                next_page = response.page + 1;
+                toggleLoadMore(response.has_next);
             },
             error: function (xhr, status, error) {
                 console.log("Error:", error);
             }
         });
+    }
+
+    // Delegated, so the checkboxes rendered from the facets also filter
+    $(document).on("click", ".filter-checkbox, #price-filter-btn", function () {
+        readFilters();
+        next_page = 1;
+        loadProducts(false);
+    });
+
+    $(document).on("click", "#load-more-products", function () {
+        loadProducts(true);
     });
 
     // Validate price input when it loses focus
@@ -0,0 +1,25 @@
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_generation(key):
+    """
+    Returns the generation stored under ``key``, starting at 1. Cache keys
+    that embed it are all retired at once by ``bump_generation``.
+    """
+    return cache.get_or_set(key, 1, None)
+
+
+def bump_generation(key):
+    """
+    Moves ``key`` to a new generation once the current transaction
+    commits, so entries written under the old one are never read again.
+    """
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Nothing cached yet, the next read starts a generation.
+            pass
+
+    transaction.on_commit(bump)
@@ -59,6 +59,39 @@ class SMSCampaignStatusChoices(TextChoices):
     FAILED = ("Failed", "Failed")
     SCHEDULED = ("Scheduled", "Scheduled")
     NO_RECIPIENTS = ("No recipient", "No recipient")
+    SENDING = ("Sending", "Sending")
+
+
+class SMSDeliveryStatusChoices(TextChoices):
+    PENDING = ("PENDING", "PENDING")
+    SENDING = ("SENDING", "SENDING")
+    SENT = ("SENT", "SENT")
+    FAILED = ("FAILED", "FAILED")
+
+
+class FulfilmentNotificationKind(TextChoices):
+    PRODUCT_ACCESS = ("PRODUCT_ACCESS", "PRODUCT_ACCESS")
+    INSUFFICIENT_KEYS = ("INSUFFICIENT_KEYS", "INSUFFICIENT_KEYS")
+
+
+class WebhookProvider(TextChoices):
+    FLUTTERWAVE = ("FLUTTERWAVE", "FLUTTERWAVE")
+    NOWPAYMENTS = ("NOWPAYMENTS", "NOWPAYMENTS")
+    NOWPAYMENTS_WALLET = ("NOWPAYMENTS_WALLET", "NOWPAYMENTS_WALLET")
+
+
+class WebhookEventStatus(TextChoices):
+    PENDING = ("PENDING", "PENDING")
+    PROCESSED = ("PROCESSED", "PROCESSED")
+    FAILED = ("FAILED", "FAILED")
+
+
+class CommissionKind(TextChoices):
+    FIRST_PURCHASE = ("FIRST_PURCHASE", "FIRST_PURCHASE")
+    ONGOING = ("ONGOING", "ONGOING")
+    # Spend that earns nothing: a first purchase under the minimum, or a
+    # referrer without a customer profile or wallet.
+    NONE = ("NONE", "NONE")
 
 
 def get_region_choices():
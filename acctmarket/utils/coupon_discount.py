@@ -1,14 +1,110 @@
+import hashlib
 import logging
-from decimal import Decimal
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.shortcuts import get_object_or_404
+from django.db.models import F
+from django.utils import timezone
 
 from acctmarket.applications.ecommerce.models import Product
+from acctmarket.utils.cache import bump_generation, get_generation
 from acctmarket.utils.choices import COUPON_CHOICE
 
 logger = logging.getLogger(__name__)
 
+DISCOUNT_GENERATION_KEY = "coupon_discount:generation"
+CENT = Decimal("0.01")
+
+
+class CouponIndex:
+    """
+    In-memory index of the coupons that are live on a given day.
+
+    Loading the index costs a fixed number of queries (the coupons and the
+    rows of their product/category relations); resolving the best discount
+    for any number of products afterwards needs no further queries.
+    """
+
+    def __init__(self, coupons, products_by_coupon, categories_by_coupon):
+        self.coupons = coupons
+        self.products_by_coupon = products_by_coupon
+        self.categories_by_coupon = categories_by_coupon
+
+    @classmethod
+    def load(cls, today=None):
+        """Build the index from the coupons valid on ``today``."""
+        from acctmarket.applications.ecommerce.models import Coupon
+
+        today = today or timezone.now().date()
+        coupons = list(
+            Coupon.objects.filter(
+                valid_from__lte=today,
+                valid_to__gte=today,
+                times_used__lt=F("usage_limit"),
+            )
+        )
+        coupon_ids = [coupon.id for coupon in coupons]
+
+        products_by_coupon = {coupon_id: set() for coupon_id in coupon_ids}
+        categories_by_coupon = {coupon_id: set() for coupon_id in coupon_ids}
+        if coupon_ids:
+            product_rows = Coupon.applicable_products.through.objects.filter(
+                coupon_id__in=coupon_ids,
+            ).values_list("coupon_id", "product_id")
+            for coupon_id, product_id in product_rows:
+                products_by_coupon[coupon_id].add(product_id)
+
+            category_rows = Coupon.applicable_categories.through.objects.filter(  # noqa
+                coupon_id__in=coupon_ids,
+            ).values_list("coupon_id", "category_id")
+            for coupon_id, category_id in category_rows:
+                categories_by_coupon[coupon_id].add(category_id)
+
+        return cls(coupons, products_by_coupon, categories_by_coupon)
+
+    def coupons_for(self, product):
+        """Return the indexed coupons that apply to ``product``."""
+        return [
+            coupon for coupon in self.coupons
+            if coupon.universal
+            or product.id in self.products_by_coupon[coupon.id]
+            or product.category_id in self.categories_by_coupon[coupon.id]
+        ]
+
+    @staticmethod
+    def discount_amount(coupon, price):
+        """Return the amount ``coupon`` takes off a product at ``price``."""
+        if coupon.discount_type == COUPON_CHOICE.PERCENTAGE:
+            return (coupon.discount_value / 100) * price
+        return min(coupon.discount_value, price)
+
+    def best_discount(self, product):
+        """
+        Return the discount info of the coupon that takes the most off
+        ``product``, or None when no coupon applies.
+        """
+        coupons = self.coupons_for(product)
+        if not coupons:
+            return None
+
+        best_coupon = max(
+            coupons,
+            key=lambda coupon: self.discount_amount(coupon, product.price),
+        )
+        return {
+            "code": best_coupon.code,
+            "discount_value": self.discount_amount(best_coupon, product.price),
+            "discount_type": best_coupon.get_discount_type_display(),
+        }
+
+    def annotate(self, products):
+        """Set ``discount_info`` on every product and return the products."""
+        for product in products:
+            product.discount_info = self.best_discount(product)
+        return products
+
 
 def validate_coupon(coupon_code, cart_data):
     """Validate the coupon code and calculate the discount."""
@@ -24,11 +120,122 @@ def validate_coupon(coupon_code, cart_data):
         return None, "Coupon does not exist."
 
 
-def calculate_discount(coupon, cart_data):
+def _coupon_targets(coupon):
+    """Return the product and category id sets a coupon applies to."""
+    product_ids = set(
+        coupon.applicable_products.values_list("id", flat=True)
+    )
+    category_ids = set(
+        coupon.applicable_categories.values_list("id", flat=True)
+    )
+    return product_ids, category_ids
+
+
+def _cart_lines(cart_data):
+    """Return ``(product_id, line_total)`` pairs for the cart items."""
+    return [
+        (str(product_id), Decimal(item["price"]) * int(item["quantity"]))
+        for product_id, item in cart_data.items()
+    ]
+
+
+def _cents(amount, rounding=ROUND_HALF_UP):
+    return amount.quantize(CENT, rounding=rounding)
+
+
+def _compute_breakdown(coupon, lines):
+    if coupon.universal:
+        applicable = lines
+    else:
+        product_ids, category_ids = _coupon_targets(coupon)
+        categories = dict(
+            Product.objects.filter(
+                pk__in=[product_id for product_id, _ in lines],
+            ).values_list("id", "category_id")
+        )
+        applicable = [
+            (product_id, line_total)
+            for product_id, line_total in lines
+            if product_id in product_ids
+            or categories.get(product_id) in category_ids
+        ]
+
+    if coupon.discount_type == COUPON_CHOICE.PERCENTAGE:
+        rate = coupon.discount_value / 100
+        breakdown = {
+            product_id: _cents(line_total * rate)
+            for product_id, line_total in applicable
+        }
+    elif coupon.universal:
+        # A flat universal coupon takes its value off the whole cart; it is
+        # spread over the lines by value, the last line taking the cents
+        # left over by rounding down.
+        breakdown = {}
+        cart_value = sum((total for _, total in applicable), Decimal("0"))
+        remaining = coupon.discount_value
+        for index, (product_id, line_total) in enumerate(applicable):
+            if index == len(applicable) - 1 or not cart_value:
+                share = remaining
+            else:
+                share = _cents(
+                    coupon.discount_value * line_total / cart_value,
+                    ROUND_DOWN,
+                )
+            breakdown[product_id] = share
+            remaining -= share
+    else:
+        breakdown = {
+            product_id: min(coupon.discount_value, line_total)
+            for product_id, line_total in applicable
+        }
+
+    return {
+        "total": sum(breakdown.values(), Decimal("0.00")),
+        "lines": breakdown,
+    }
+
+
+def _breakdown_key(coupon, lines):
+    generation = get_generation(DISCOUNT_GENERATION_KEY)
+    payload = "|".join(
+        f"{product_id}:{total}" for product_id, total in sorted(lines)
+    )
+    digest = hashlib.sha1(payload.encode()).hexdigest()  # noqa: S324
+    return f"coupon_discount:v{generation}:{coupon.pk}:{digest}"
+
+
+def discount_breakdown(coupon, cart_data):
+    """
+    Work out what ``coupon`` takes off each line of ``cart_data``.
+
+    The coupon's applicable product and category ids are loaded once and
+    every line is evaluated in a single pass, so the query count does not
+    grow with the cart. Results are cached per coupon and priced cart.
+
+    Args:
+        coupon (Coupon): The coupon being applied.
+        cart_data (dict): Cart items with product details.
+
+    Returns:
+        dict: ``total`` (Decimal) and ``lines``, the discount per product
+        id of every line the coupon applies to, rounded to cents.
     """
-    Calculate the discount based on the coupon's applicability.
+    lines = _cart_lines(cart_data)
+    key = _breakdown_key(coupon, lines)
+    breakdown = cache.get(key)
+    if breakdown is None:
+        breakdown = _compute_breakdown(coupon, lines)
+        cache.set(key, breakdown, settings.COUPON_DISCOUNT_CACHE_TIMEOUT)
+    logger.info(
+        f"Coupon {coupon.code} takes {breakdown['total']} off "
+        f"{len(breakdown['lines'])} of {len(lines)} cart lines."
+    )
+    return breakdown
+
 
-    Logs detailed information for debugging purposes.
+def calculate_discount(coupon, cart_data):
+    """
+    Calculate the total discount of ``coupon`` on ``cart_data``.
 
     Args:
         coupon (Coupon): The coupon being applied.
@@ -37,66 +244,12 @@ def calculate_discount(coupon, cart_data):
     Returns:
         Decimal: Total discount amount.
     """
-    total_discount = Decimal("0.00")
-    logger.info(f"Starting discount calculation for coupon: {coupon.code}")  # noqa
+    return discount_breakdown(coupon, cart_data)["total"]
 
-    try:
-        # Universal coupon: apply to all cart items
-        if coupon.universal:
-            logger.info("Coupon is universal, applying to all items.")
-            total_cart_value = sum(
-                Decimal(item["price"])
-                * int(
-                    item["quantity"],
-                )
-                for item in cart_data.values()
-            )
-            logger.info(f"Total cart value: {total_cart_value}")
 
-            if coupon.discount_type == COUPON_CHOICE.PERCENTAGE:
-                total_discount = total_cart_value * (coupon.discount_value / 100)  # noqa
-                logger.info(f"Percentage discount applied: {coupon.discount_value}%")  # noqa
-            else:
-                total_discount = coupon.discount_value
-                logger.info(f"Flat discount applied: {coupon.discount_value}")  # noqa
-
-        # Specific product/category coupon
-        else:
-            logger.info("Coupon is product/category specific.")
-            for product_id, item in cart_data.items():
-                try:
-                    product = get_object_or_404(Product, id=product_id)
-                    item_total = Decimal(item["price"]) * int(item["quantity"])
-                    logger.info(f"Processing product {product_id}: Total={item_total}")  # noqa
-
-                    if (
-                        coupon.applicable_products.filter(
-                            id=product.id,
-                        ).exists()
-                        or coupon.applicable_categories.filter(
-                            id=product.category.id,
-                        ).exists()
-                    ):
-                        logger.info(f"Coupon applicable to product {product_id}.")  # noqa
-                        if coupon.discount_type == COUPON_CHOICE.PERCENTAGE:
-                            discount = item_total * (coupon.discount_value / 100)  # noqa
-                            logger.info(
-                                f"Percentage discount for product {product_id}: {discount}"  # noqa
-                            )
-                        else:
-                            discount = min(coupon.discount_value, item_total)
-                            logger.info(
-                                f"Flat discount for product {product_id}: {discount}"  # noqa
-                            )
-                        total_discount += discount
-                    else:
-                        logger.info(f"Coupon not applicable to product {product_id}.")  # noqa
-                except Exception as e:
-                    logger.error(f"Error processing product {product_id}: {e}")
-                    continue
-
-    except Exception as e:
-        logger.error(f"Error during discount calculation: {e}")
-
-    logger.info(f"Total discount calculated: {total_discount}")
-    return total_discount
+def invalidate_discounts():
+    """
+    Retires every cached discount breakdown once the current transaction
+    commits.
+    """
+    bump_generation(DISCOUNT_GENERATION_KEY)
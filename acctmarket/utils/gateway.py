@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.dispatch import Signal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Sent after every gateway call with ``provider``, ``method``, ``url``,
+# ``status_code`` (None when no response arrived) and ``elapsed`` seconds,
+# so latency can be fed to whatever metrics backend is deployed.
+gateway_call_finished = Signal()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after ``failure_threshold`` consecutive
+    failures, then lets a single trial call through once ``reset_timeout``
+    seconds have passed. State is kept per worker process.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: the next result decides whether to close.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GatewayClient:
+    """
+    HTTP client for one payment or rates provider.
+
+    Every provider keeps its own pooled ``requests.Session`` and circuit
+    breaker, every call gets connect/read timeouts, and failed connections
+    are retried at the transport level only (never by sleeping in the
+    request thread).
+    """
+
+    def __init__(self, provider, base_url=""):
+        self.provider = provider
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.PAYMENT_GATEWAY_POOL_SIZE,
+            pool_maxsize=settings.PAYMENT_GATEWAY_POOL_SIZE,
+            # Only connection setup is retried: it is safe for every method
+            # and costs at most the connect timeout.
+            max_retries=Retry(
+                total=None, connect=2, read=0, status=0, redirect=False,
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.breaker = CircuitBreaker(
+            settings.PAYMENT_GATEWAY_FAILURE_THRESHOLD,
+            settings.PAYMENT_GATEWAY_RESET_TIMEOUT,
+        )
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request through the provider's session. ``url`` may be
+        relative to the client's ``base_url``. Raises ``CircuitOpenError``
+        while the provider is considered down.
+        """
+        if not url.startswith(("http://", "https://")):
+            url = f"{self.base_url}{url}"
+        if not self.breaker.allow_request():
+            logger.warning(f"Circuit open for {self.provider}: {url}")
+            raise CircuitOpenError(f"{self.provider} is unavailable.")
+
+        kwargs.setdefault(
+            "timeout",
+            (
+                settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT,
+                settings.PAYMENT_GATEWAY_READ_TIMEOUT,
+            ),
+        )
+        status_code = None
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status_code = response.status_code
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"{self.provider} {method} {url} -> {status_code} "
+                f"in {elapsed * 1000:.0f}ms"
+            )
+            gateway_call_finished.send(
+                sender=self.__class__,
+                provider=self.provider,
+                method=method,
+                url=url,
+                status_code=status_code,
+                elapsed=elapsed,
+            )
+
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
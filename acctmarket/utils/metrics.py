@@ -0,0 +1,174 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends import locmem
+from django.db import connections
+from django.dispatch import Signal
+from django.template.backends import django as django_backend
+from django_redis import cache as redis_cache
+
+logger = logging.getLogger(__name__)
+
+# Sent after every request with ``request``, ``response`` and the request's
+# ``metrics``, so they can be fed to whatever metrics backend is deployed.
+request_metrics_recorded = Signal()
+
+_current = ContextVar("request_metrics", default=None)
+
+_MISSING = object()
+
+
+class RequestMetrics:
+    """What serving one request cost: SQL, cache lookups and templates."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self._template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def as_fields(self):
+        """Times are in milliseconds."""
+        return {
+            "queries": self.queries,
+            "sql_ms": round(self.sql_time * 1000, 2),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "template_ms": round(self.template_time * 1000, 2),
+            "total_ms": round(self.total_time * 1000, 2),
+        }
+
+    def server_timing(self):
+        """The metrics as a ``Server-Timing`` header value."""
+        fields = self.as_fields()
+        return ", ".join([
+            f'sql;dur={fields["sql_ms"]};desc="{self.queries} queries"',
+            f"tpl;dur={fields['template_ms']}",
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',  # noqa
+            f"total;dur={fields['total_ms']}",
+        ])
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the SQL count and time, cache hits and misses and template
+    render time of every request.
+
+    The numbers are sent with ``request_metrics_recorded``, returned as
+    ``Server-Timing`` and ``X-Query-Count`` headers when
+    ``REQUEST_METRICS_HEADERS`` is on, and logged for a
+    ``REQUEST_METRICS_SAMPLE_RATE`` share of requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query),
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.total_time = time.perf_counter() - start
+            _current.reset(token)
+
+        if settings.REQUEST_METRICS_HEADERS:
+            response["Server-Timing"] = metrics.server_timing()
+            response["X-Query-Count"] = str(metrics.queries)
+        if random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:  # noqa
+            fields = metrics.as_fields()
+            logger.info(
+                f"{request.method} {request.path} {response.status_code} "
+                f"{fields['queries']} queries in {fields['sql_ms']}ms, "
+                f"templates {fields['template_ms']}ms, "
+                f"total {fields['total_ms']}ms",
+                extra={"path": request.path, **fields},
+            )
+        request_metrics_recorded.send(
+            sender=self.__class__,
+            request=request,
+            response=response,
+            metrics=metrics,
+        )
+        return response
+
+
+class TimedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Templates rendered from inside another one (form widgets) are
+        # already part of the outer render time.
+        metrics._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing renders for request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _record_cache_reads(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class CacheMetricsMixin:
+    """Counts the hits and misses of cache reads made during a request."""
+
+    def get(self, key, default=None, version=None, **kwargs):
+        value = super().get(key, _MISSING, version=version, **kwargs)
+        if value is _MISSING:
+            _record_cache_reads(0, 1)
+            return default
+        _record_cache_reads(1, 0)
+        return value
+
+
+class LocMemCache(CacheMetricsMixin, locmem.LocMemCache):
+    # get_many() is built on get(), which already counts each key.
+    pass
+
+
+class RedisCache(CacheMetricsMixin, redis_cache.RedisCache):
+    def get_many(self, keys, version=None, **kwargs):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, **kwargs)
+        _record_cache_reads(len(values), len(keys) - len(values))
+        return values
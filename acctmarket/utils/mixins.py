@@ -1,23 +1,87 @@
 import logging
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import send_mail
-from django.db import transaction
 from django.http import HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect
 # from django.template.loader import render_to_string   # noqa
 from django.urls import reverse
+from django.utils import timezone
 from django.views.generic import TemplateView
 
-from acctmarket.applications.ecommerce.models import (CartOrder, Payment,
-                                                      ProductKey)
-from acctmarket.applications.users.models import (
-    ContentManager, CustomerSupportRepresentative)
+from acctmarket.applications.ecommerce.models import CartOrder, Payment
+from acctmarket.applications.ecommerce.services import fulfil_order
+from acctmarket.applications.users import roles
+from acctmarket.utils.coupon_discount import CouponIndex
+from acctmarket.utils.pagination import (DEFAULT_ORDERING, estimate_count,
+                                         keyset_page)
 from acctmarket.utils.payments import convert_to_naira, get_exchange_rate
 
 
+class DiscountedPageMixin:
+    """
+    A ListView mixin that attaches ``discount_info`` to the products on the
+    current page only, once the queryset has been paginated.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(  # noqa
+            queryset, page_size,
+        )
+        page.object_list = CouponIndex.load().annotate(list(object_list))
+        return paginator, page, page.object_list, is_paginated
+
+
+class CursorPaginationMixin:
+    """
+    A ListView mixin that pages by keyset on ``cursor_ordering`` (newest
+    first by default) instead of by page number.
+
+    The page is chosen by the opaque ``?cursor=`` token, so deep pages
+    cost the same as the first and no ``COUNT(*)`` is run. Set
+    ``approximate_count`` to expose the planner's row estimate as
+    ``page_obj.approximate_count``. Templates link to the neighbouring
+    pages with ``next_page_query`` and ``previous_page_query``.
+    """
+
+    cursor_ordering = DEFAULT_ORDERING
+    cursor_query_param = "cursor"
+    approximate_count = False
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_page(
+            queryset,
+            cursor=self.request.GET.get(self.cursor_query_param),
+            size=page_size,
+            ordering=self.get_cursor_ordering(),
+        )
+        if self.approximate_count:
+            page.approximate_count = estimate_count(queryset)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def _page_query(self, cursor):
+        params = self.request.GET.copy()
+        params[self.cursor_query_param] = cursor
+        return params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get("page_obj")
+        if page is not None:
+            if page.has_next():
+                context["next_page_query"] = self._page_query(
+                    page.next_cursor,
+                )
+            if page.has_previous():
+                context["previous_page_query"] = self._page_query(
+                    page.previous_cursor,
+                )
+        return context
+
+
 class ContentManagerRequiredMixin(LoginRequiredMixin):
     """
     A mixin that only allows access to content managers and superusers.
@@ -42,7 +106,7 @@ class ContentManagerRequiredMixin(LoginRequiredMixin):
         """
         Checks if the user is a content manager.
         """
-        return ContentManager.objects.filter(user=user).exists()
+        return roles.has_role(user, roles.CONTENT_MANAGER)
 
 
 class CustomerSupportRepresentativemixin(LoginRequiredMixin):
@@ -66,7 +130,7 @@ class CustomerSupportRepresentativemixin(LoginRequiredMixin):
         """
         Checks if the user is a customer support representative.
         """
-        return CustomerSupportRepresentative.objects.filter(user=user).exists()
+        return roles.has_role(user, roles.CUSTOMER_SUPPORT)
 
 
 class PaymentVerificationMixin:
@@ -78,193 +142,37 @@ class PaymentVerificationMixin:
 
     def assign_keys_and_notify(self, request, payment):
         """
-        Assigns product keys to the order, sends email notifications,
+        Assigns product keys to the order, queues the email notifications,
         and handles any errors.
         """
         try:
-            with transaction.atomic():
-                # Assign unique keys to the order
-                self.assign_unique_keys_to_order(payment.order.id)
-
-                # Send email notification to the user
-                self.send_product_access_email(request, payment)
-
-                # Notify the site admin about the purchase
-                self.notify_site_owner(request, payment)
+            # Keys are allocated once per order even if the provider's
+            # webhook reports the same payment; the user is emailed once
+            # the keys are committed and the admin hears about it in the
+            # next digest.
+            fulfil_order(
+                payment.order,
+                request.build_absolute_uri(
+                    reverse("ecommerce:purchased_products"),
+                ),
+            )
 
-                # Notify the user of successful verification
-                messages.success(
-                    request,
-                    "Payment verification successful. Check your email for product access.",  # noqa
-                )
-                return redirect("ecommerce:payment_complete")
+            # Notify the user of successful verification
+            messages.success(
+                request,
+                "Payment verification successful. Check your email for product access.",  # noqa
+            )
+            return redirect("ecommerce:payment_complete")
         except Exception as e:
-            logging.exception()
-            f"Error during key assignment and notification: {e}"
+            logging.exception(
+                f"Error during key assignment and notification: {e}",
+            )
             messages.error(
                 request,
                 f"Payment verified, but there was an issue: {e}",
             )
             return redirect("ecommerce:payment_failed")
 
-    def assign_unique_keys_to_order(self, order_id):
-        """
-        Assigns unique product keys to each item
-        in the order and updates stock.
-        """
-        order = get_object_or_404(CartOrder, id=order_id)
-
-        for order_item in order.order_items.all():
-            product = order_item.product
-            quantity = order_item.quantity
-
-            # Get available unused keys for the product
-            available_keys = ProductKey.objects.select_for_update().filter(
-                product=product,
-                is_used=False,
-            )[:quantity]
-
-            if len(available_keys) < quantity:
-                # Handle insufficient keys
-                self.handle_insufficient_keys(order_item, available_keys)
-                continue
-
-            # Assign keys and update stock
-            self._assign_keys_and_update_stock(
-                order_item,
-                available_keys,
-                quantity,
-            )
-
-    def _assign_keys_and_update_stock(
-        self,
-        order_item,
-        available_keys,
-        quantity,
-    ):
-        """
-        Assigns keys to the order item and
-        updates the product's stock and visibility.
-        """
-        keys_and_passwords = []
-        for i in range(quantity):
-            product_key = available_keys[i]
-            product_key.is_used = True
-            product_key.save()
-            keys_and_passwords.append(
-                {
-                    "key": product_key.key,
-                    "password": product_key.password,
-                }
-            )
-
-        # Save the assigned keys to the order item
-        order_item.keys_and_passwords = keys_and_passwords
-        order_item.save()
-
-        # Update product stock and visibility
-        product = order_item.product
-        product.quantity_in_stock = max(
-            0,
-            product.quantity_in_stock - quantity,
-        )
-        product.visible = product.quantity_in_stock > 0
-        product.save()
-
-        logging.info(
-            f"Stock updated for product '{product.title}': "
-            f"{product.quantity_in_stock} items remaining.",
-        )
-
-    def send_product_access_email(self, request, payment):
-        """
-        Sends an email to the user with a link to access purchased products.
-        """
-        purchased_product_url = request.build_absolute_uri(
-            reverse("ecommerce:purchased_products"),
-        )
-        user_email = payment.order.user.email
-
-        send_mail(
-            "Your Purchase is Complete",
-            f"Thank you for your purchase. You can access your products here: {purchased_product_url}",  # noqa
-            settings.DEFAULT_FROM_EMAIL,
-            [user_email],
-            fail_silently=False,
-        )
-
-    def handle_insufficient_keys(self, order_item, available_keys):
-        """
-        Handles cases where there are not enough product keys available.
-        """
-        keys_and_passwords = []
-        for key in available_keys:
-            key.is_used = True
-            key.save()
-            keys_and_passwords.append(
-                {
-                    "key": key.key,
-                    "password": key.password,
-                }
-            )
-
-        order_item.keys_and_passwords = keys_and_passwords
-        order_item.save()
-
-        product = order_item.product
-        user = order_item.order.user
-        self.notify_user_insufficient_keys(user, product)
-
-    def notify_user_insufficient_keys(self, user, product):
-        """
-        Notifies the user and site admin about insufficient keys for a product.
-        """
-        message = (
-            f"We're sorry, but we do not have enough keys for the product '{product.title}'. "  # noqa
-            f"We will contact you shortly."
-        )
-        send_mail(
-            "Insufficient Product Keys",
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
-
-        admin_message = (
-            f"A new purchase was made by {user.username} (User ID: {user.id}, Email: {user.email}) "  # noqa
-            f"for the product '{product.title}', but there were insufficient keys to fulfill the order. "  # noqa
-            f"Please add more keys to this product and update the user's order accordingly."  # noqa
-        )
-        send_mail(
-            "Action Required: Insufficient Product Keys for New Purchase",
-            admin_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [settings.EMAIL_HOST_USER],
-            fail_silently=False,
-        )
-
-    def notify_site_owner(self, request, payment):
-        """
-        Notifies the site owner about a new order.
-        """
-        site_owner_email = settings.EMAIL_HOST_USER
-        order = payment.order
-        user = request.user
-
-        subject = f"New Purchase by {user.username} - Order #{order.id}"
-        message = (
-            f"User {user.username} has made a new purchase. Order details are attached."  # noqa
-        )
-
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [site_owner_email],
-            fail_silently=False,
-        )
-
 
 class InitiatePaymentBaseView(LoginRequiredMixin, TemplateView):
     payment_method = None  # To be defined in the child classes
@@ -320,6 +228,12 @@ class InitiatePaymentBaseView(LoginRequiredMixin, TemplateView):
             messages.error(request, f"Error fetching exchange rate: {e!s}")
             return redirect("ecommerce:checkout")
 
+        # The gateway now knows this reference, so the draft order must
+        # not be reused for another checkout.
+        Payment.objects.filter(pk=payment.pk).update(
+            initiated_at=timezone.now(),
+        )
+
         # Call the method that handles the payment gateway specifics
         return self.initiate_payment(request, payment, amount_in_naira)
 
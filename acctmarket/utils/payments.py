@@ -4,11 +4,28 @@ from decimal import Decimal
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
 # from django.contrib import messages
 from django.urls import reverse
 
+from acctmarket.utils.gateway import GatewayClient
+
 logger = logging.getLogger(__name__)
 
+# One pooled client per provider, shared by every request in the process.
+paystack_client = GatewayClient("paystack", "https://api.paystack.co")
+nowpayments_client = GatewayClient("nowpayments")
+flutterwave_client = GatewayClient(
+    "flutterwave", "https://api.flutterwave.com/v3/",
+)
+exchange_rate_client = GatewayClient("exchange_rate")
+
+EXCHANGE_RATES_CACHE_KEY = "exchange_rates:v1"
+EXCHANGE_RATES_REFRESH_LOCK = "exchange_rates:refreshing"
+# Long enough for a queued refresh to run, short enough to retry soon
+# after a failed one.
+EXCHANGE_RATES_REFRESH_LOCK_TIMEOUT = 60
+
 
 class PayStack:
     PAYSTACK_SECRET_KEY = settings.PAYSTACK_SECRET_KEY
@@ -22,7 +39,7 @@ class PayStack:
             "Content-Type": "application/json",
         }
         url = self.base_url + path
-        response = requests.get(url, headers=headers)
+        response = paystack_client.get(url, headers=headers)
 
         if response.status_code == 200:
             response_data = response.json()
@@ -80,7 +97,7 @@ class NowPayment:
                 reverse(self.cancel_url_name),
             ),
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = nowpayments_client.post(url, headers=headers, json=data)
         result = response.json()
 
         if response.status_code == 200 and "id" in result:
@@ -108,7 +125,7 @@ class NowPayment:
             "x-api-key": self.api_key,
         }
         url = f"{self.api_url}/payment/{payment_id}"
-        response = requests.get(url, headers=headers)
+        response = nowpayments_client.get(url, headers=headers)
 
         if response.status_code == 200:
             return True, response.json()
@@ -222,10 +239,61 @@ class NowPayment:
 #             }
 
 
+def fetch_exchange_rates():
+    """
+    Fetches the full ``conversion_rates`` table from the exchange rate API.
+
+    Raises:
+        Exception: If the API does not return a conversion table.
+    """
+    url = f"{settings.EXCHANGE_RATE_API_URL}"
+    headers = {
+        "apikey": settings.EXCHANGE_RATE_API_KEY,
+    }
+    response = exchange_rate_client.get(url, headers=headers)
+    data = response.json()
+
+    if response.status_code == 200 and "conversion_rates" in data:
+        return data["conversion_rates"]
+    logger.error(f"Error fetching exchange rate: {data}")
+    raise Exception("Error fetching exchange rate")
+
+
+def refresh_exchange_rates():
+    """Fetches the conversion table and stores it in the cache."""
+    entry = {
+        "rates": fetch_exchange_rates(),
+        "fetched_at": time.time(),
+    }
+    cache.set(
+        EXCHANGE_RATES_CACHE_KEY, entry, settings.EXCHANGE_RATE_CACHE_TIMEOUT,
+    )
+    return entry
+
+
+def _get_exchange_rates():
+    """
+    Returns the cached conversion table, serving a stale table while a
+    background refresh is queued. Only a cold cache waits on the API.
+    """
+    entry = cache.get(EXCHANGE_RATES_CACHE_KEY)
+    if entry is None:
+        return refresh_exchange_rates()["rates"]
+
+    age = time.time() - entry["fetched_at"]
+    if age > settings.EXCHANGE_RATE_FRESH_FOR and cache.add(
+        EXCHANGE_RATES_REFRESH_LOCK, True, EXCHANGE_RATES_REFRESH_LOCK_TIMEOUT,
+    ):
+        from acctmarket.applications.ecommerce import tasks
+
+        tasks.refresh_exchange_rates.delay()
+    return entry["rates"]
+
+
 def get_exchange_rate(target_currency="NGN"):
     """
     Retrieves the exchange rate for a given target
-    currency from an external API.
+    currency from the cached conversion table.
 
     Args:
         target_currency (str, optional):
@@ -240,25 +308,15 @@ def get_exchange_rate(target_currency="NGN"):
         or the target currency is not found in the response data.
 
     """
-    url = f"{settings.EXCHANGE_RATE_API_URL}"
-    headers = {
-        "apikey": settings.EXCHANGE_RATE_API_KEY,
-    }
-    response = requests.get(url, headers=headers)
-    data = response.json()
-
-    if response.status_code == 200 and "conversion_rates" in data:
-        rate = data["conversion_rates"].get(target_currency)
-        if rate:
-            return Decimal(rate)
-        logger.error(
-            f"Target currency {target_currency} not found in response data"  # noqa
-        )
-        raise Exception(
-            f"Target currency {target_currency} not found in response data"  # noqa
-        )
-    logger.error(f"Error fetching exchange rate: {data}")
-    raise Exception("Error fetching exchange rate")
+    rate = _get_exchange_rates().get(target_currency)
+    if rate:
+        return Decimal(str(rate))
+    logger.error(
+        f"Target currency {target_currency} not found in response data"  # noqa
+    )
+    raise Exception(
+        f"Target currency {target_currency} not found in response data"  # noqa
+    )
 
 
 def convert_to_naira(amount, exchange_rate):
@@ -319,8 +377,8 @@ class Flutterwave:
         }
 
         try:
-            response = requests.post(
-                f"{self.base_url}payments",
+            response = flutterwave_client.post(
+                "payments",
                 headers=self.headers,
                 json=data,
             )
@@ -353,55 +411,59 @@ class Flutterwave:
                 "message": "Network error or invalid response from Flutterwave.",  # noqa
             }
 
-    def verify_payment(self, transaction_id, max_retries=3):
-        """Verifies a payment status by transaction ID, with retry logic."""
-        verify_url = f"{self.base_url}transactions/{transaction_id}/verify"
-
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(
-                    verify_url,
-                    headers=self.headers,
-                )
-                response_data = response.json()
-                logger.info(
-                    f"Verification attempt {attempt + 1} for transaction {transaction_id}: {response_data}"  # noqa
-                )
-
-                if (
-                    response.status_code == 200
-                    and response_data["status"] == "success"
-                    and response_data["data"]["status"] == "successful"
-                ):  # noqa
-                    return {
-                        "status": "success",
-                        "amount": response_data["data"]["amount"],
-                    }
-
-                if (
-                    response_data.get("message")
-                    == "No transaction was found for this id"
-                ):  # noqa
-                    logger.warning(
-                        "Transaction not found on Flutterwave - retrying."
-                    )
-                    time.sleep(2)  # Wait before retrying
-                    continue  # Retry if transaction not found
+    def verify_payment(self, transaction_id, *args, **kwargs):
+        """
+        Verifies a payment status by transaction ID.
 
-                return {
-                    "status": "error",
-                    "message": "Payment verification failed.",
-                }
+        Flutterwave can take a moment to list a fresh transaction. Rather
+        than sleeping in the web worker, a not-yet-listed transaction is
+        reported as ``pending`` with a ``retry_after`` hint in seconds.
+        """
+        verify_url = f"transactions/{transaction_id}/verify"
 
-            except requests.exceptions.RequestException as e:
-                logger.error(
-                    f"Network error during verification for transaction {transaction_id}: {e}"  # noqa
-                )  # noqa
+        try:
+            response = flutterwave_client.get(
+                verify_url,
+                headers=self.headers,
+            )
+            response_data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(
+                f"Network error during verification for transaction {transaction_id}: {e}"  # noqa
+            )
+            return {
+                "status": "error",
+                "message": "Network error or invalid response from Flutterwave.",  # noqa
+            }
+
+        logger.info(
+            f"Verification for transaction {transaction_id}: {response_data}"  # noqa
+        )
+
+        if (
+            response.status_code == 200
+            and response_data["status"] == "success"
+            and response_data["data"]["status"] == "successful"
+        ):  # noqa
+            return {
+                "status": "success",
+                "amount": response_data["data"]["amount"],
+            }
+
+        if (
+            response_data.get("message")
+            == "No transaction was found for this id"
+        ):  # noqa
+            logger.warning(
+                f"Transaction {transaction_id} not found on Flutterwave yet."
+            )
+            return {
+                "status": "pending",
+                "message": "Payment is still being processed. Please try again shortly.",  # noqa
+                "retry_after": settings.FLUTTERWAVE_VERIFY_RETRY_AFTER,
+            }
 
-        logger.error(
-            f"Verification failed after {max_retries} attempts for transaction {transaction_id}"  # noqa
-        )  # noqa
         return {
             "status": "error",
-            "message": "Verification failed after retries.",
+            "message": "Payment verification failed.",
         }
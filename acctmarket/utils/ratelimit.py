@@ -0,0 +1,33 @@
+import time
+
+from django.core.cache import caches
+
+
+class RateLimiter:
+    """
+    Lets at most ``rate`` calls a second through ``acquire()`` across every
+    process sharing the cache, e.g. all workers calling one provider.
+
+    Calls are counted in one-second windows kept in the cache; a caller
+    finding the current window full sleeps until the next one.
+    """
+
+    def __init__(self, key, rate, cache_alias="default"):
+        self.key = key
+        self.rate = rate
+        self.cache = caches[cache_alias]
+
+    def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f"ratelimit:{self.key}:{window}"
+            self.cache.add(key, 0, timeout=5)
+            try:
+                count = self.cache.incr(key)
+            except ValueError:
+                # The window expired between add() and incr().
+                continue
+            if count <= self.rate:
+                return
+            time.sleep(window + 1 - now)
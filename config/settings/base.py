@@ -74,6 +74,7 @@ DJANGO_APPS = [
     "django.contrib.staticfiles",
     # "django.contrib.humanize", # Handy template tags
     "django.contrib.admin",
+    "django.contrib.postgres",
     "django.forms",
 ]
 THIRD_PARTY_APPS = [
@@ -151,6 +152,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "acctmarket.utils.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -190,7 +192,7 @@ MEDIA_URL = "/media/"
 TEMPLATES = [
     {
         # https://docs.djangoproject.com/en/dev/ref/settings/#std:setting-TEMPLATES-BACKEND
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "acctmarket.utils.metrics.TimedDjangoTemplates",
         # https://docs.djangoproject.com/en/dev/ref/settings/#dirs
         "DIRS": [str(APPS_DIR / "templates")],
         # https://docs.djangoproject.com/en/dev/ref/settings/#app-dirs
@@ -200,6 +202,7 @@ TEMPLATES = [
             "context_processors": [
                 "acctmarket.applications.ecommerce.context_processors.product_list",                     # noqa
                 "acctmarket.applications.ecommerce.context_processors.products_by_category",                   # noqa
+                "acctmarket.applications.ecommerce.context_processors.cart",
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -226,6 +229,13 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 # https://docs.djangoproject.com/en/dev/ref/settings/#fixture-dirs
 FIXTURE_DIRS = (str(APPS_DIR / "fixtures"),)
 
+# SESSIONS
+# ------------------------------------------------------------------------------
+# https://docs.djangoproject.com/en/dev/ref/settings/#session-engine
+# Sessions are read from the cache (Redis in production) and only fall
+# back to the database on a cache miss.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
 # SECURITY
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#session-cookie-httponly
@@ -323,6 +333,29 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
 CELERY_TASK_SEND_SENT_EVENT = True
+# Periodic tasks; the DatabaseScheduler syncs these into django-celery-beat.
+CELERY_BEAT_SCHEDULE = {
+    "fulfilment-admin-digest": {
+        "task": "acctmarket.applications.ecommerce.tasks.send_admin_fulfilment_digest",  # noqa
+        "schedule": env.int("FULFILMENT_DIGEST_INTERVAL", default=60 * 15),
+    },
+    "refresh-exchange-rates": {
+        "task": "acctmarket.applications.ecommerce.tasks.refresh_exchange_rates",  # noqa
+        "schedule": env.int("EXCHANGE_RATE_REFRESH_INTERVAL", default=60 * 30),
+    },
+    "drain-webhook-inbox": {
+        "task": "acctmarket.applications.ecommerce.tasks.process_webhook_events",  # noqa
+        "schedule": 60,
+    },
+    "process-commission-events": {
+        "task": "acctmarket.applications.refer.tasks.process_commission_events",  # noqa
+        "schedule": env.int("COMMISSION_RUN_INTERVAL", default=60 * 5),
+    },
+    "resume-sms-campaigns": {
+        "task": "acctmarket.applications.refer.tasks.resume_sms_campaigns",  # noqa
+        "schedule": 60,
+    },
+}
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool(
@@ -392,6 +425,13 @@ PAYSTACK_PUBLIC_KEY = env("PAYSTACK_PUBLIC_KEY")
 # https://www.exchangerate-api.com/
 EXCHANGE_RATE_API_KEY = env("EXCHANGE_RATE_API_KEY")
 EXCHANGE_RATE_API_URL = env("EXCHANGE_RATE_API_URL")
+# The rate table is cached: after EXCHANGE_RATE_FRESH_FOR seconds it is
+# still served while a refresh is queued, and it is dropped entirely after
+# EXCHANGE_RATE_CACHE_TIMEOUT.
+EXCHANGE_RATE_FRESH_FOR = env.int("EXCHANGE_RATE_FRESH_FOR", default=60 * 60)
+EXCHANGE_RATE_CACHE_TIMEOUT = env.int(
+    "EXCHANGE_RATE_CACHE_TIMEOUT", default=60 * 60 * 24,
+)
 
 # Nowpayment integration
 # https://documenter.getpostman.com/view/7907941/2s93JusNJt
@@ -416,6 +456,31 @@ FLUTTERWAVE_PRIVATE_KEY = env("FLUTTERWAVE_PRIVATE_KEY")
 # real payment
 FLUTTERWAVE_PUBLIC_KEY = env("FLUTTERWAVE_PUBLIC_KEY")
 FLUTTERWAVE_SECRET_KEY = env("FLUTTERWAVE_SECRET_KEY")
+# A transaction Flutterwave has not listed yet is verified again by a
+# Celery task this many seconds later, at most this many times in all.
+FLUTTERWAVE_VERIFY_RETRY_AFTER = env.int(
+    "FLUTTERWAVE_VERIFY_RETRY_AFTER", default=5,
+)
+FLUTTERWAVE_VERIFY_MAX_ATTEMPTS = env.int(
+    "FLUTTERWAVE_VERIFY_MAX_ATTEMPTS", default=12,
+)
+
+# Payment gateway HTTP clients (acctmarket/utils/gateway.py)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = env.float(
+    "PAYMENT_GATEWAY_CONNECT_TIMEOUT", default=3.05,
+)
+PAYMENT_GATEWAY_READ_TIMEOUT = env.float(
+    "PAYMENT_GATEWAY_READ_TIMEOUT", default=10,
+)
+PAYMENT_GATEWAY_POOL_SIZE = env.int("PAYMENT_GATEWAY_POOL_SIZE", default=10)
+# Consecutive failures that open a provider's circuit, and the seconds
+# to wait before a trial call is let through again.
+PAYMENT_GATEWAY_FAILURE_THRESHOLD = env.int(
+    "PAYMENT_GATEWAY_FAILURE_THRESHOLD", default=5,
+)
+PAYMENT_GATEWAY_RESET_TIMEOUT = env.int(
+    "PAYMENT_GATEWAY_RESET_TIMEOUT", default=30,
+)
 
 # Twilor integrations
 TWILIO_ACCOUNT_SID = env("TWILIO_ACCOUNT_SID")
@@ -425,6 +490,83 @@ TWILIO_PHONE_NUMBER = env("TWILIO_PHONE_NUMBER")
 # SITE_URL = "http://127.0.0.1:8000"
 
 
+# Storefront snapshot
+# How long (in seconds) a cached storefront section may be served before
+# it is rebuilt even if no model signal invalidated it.
+STOREFRONT_CACHE_TIMEOUT = env.int("STOREFRONT_CACHE_TIMEOUT", default=60 * 15)
+# Cached shop sidebar facet counts; product and category changes retire
+# them early.
+FACET_CACHE_TIMEOUT = env.int("FACET_CACHE_TIMEOUT", default=60 * 15)
+
+# Shopping cart
+# Idle carts expire after this many seconds; every change restarts it.
+CART_TIMEOUT = env.int("CART_TIMEOUT", default=60 * 60 * 24 * 14)
+# Cached product titles, prices and images shown in the cart.
+CART_PRODUCT_CACHE_TIMEOUT = env.int(
+    "CART_PRODUCT_CACHE_TIMEOUT", default=60 * 15,
+)
+
+# Cached coupon discount breakdowns per coupon and priced cart; coupon
+# and product changes retire them early.
+COUPON_DISCOUNT_CACHE_TIMEOUT = env.int(
+    "COUPON_DISCOUNT_CACHE_TIMEOUT", default=60 * 15,
+)
+
+# Reviews shown per page on the product detail page.
+REVIEWS_PAGE_SIZE = env.int("REVIEWS_PAGE_SIZE", default=10)
+
+# Fulfilment emails
+# Upper bound on the purchases summarised in one admin digest email.
+FULFILMENT_DIGEST_BATCH_SIZE = env.int(
+    "FULFILMENT_DIGEST_BATCH_SIZE", default=200,
+)
+
+# Webhook inbox
+# Events still failing after this many drains are parked as FAILED.
+WEBHOOK_MAX_ATTEMPTS = env.int("WEBHOOK_MAX_ATTEMPTS", default=5)
+WEBHOOK_BATCH_SIZE = env.int("WEBHOOK_BATCH_SIZE", default=100)
+
+# Request metrics
+# Return each request's SQL, cache and template figures as response
+# headers, and log them for this share (0 to 1) of requests.
+REQUEST_METRICS_HEADERS = env.bool("REQUEST_METRICS_HEADERS", default=False)
+REQUEST_METRICS_SAMPLE_RATE = env.float(
+    "REQUEST_METRICS_SAMPLE_RATE", default=0.01,
+)
+
+# Referral commissions
+# Upper bound on the commission events applied in one transaction.
+COMMISSION_BATCH_SIZE = env.int("COMMISSION_BATCH_SIZE", default=500)
+
+# SMS campaigns
+# Recipients per send task, sends in flight per task, and the messages
+# per second the provider accepts from all workers together.
+SMS_CHUNK_SIZE = env.int("SMS_CHUNK_SIZE", default=500)
+SMS_SEND_CONCURRENCY = env.int("SMS_SEND_CONCURRENCY", default=8)
+SMS_RATE_LIMIT = env.int("SMS_RATE_LIMIT", default=100)
+# Deliveries claimed longer ago than this are assumed lost and resent.
+SMS_DELIVERY_LEASE = env.int("SMS_DELIVERY_LEASE", default=60 * 15)
+
+# Notifications
+# Cached unread notification counts, adjusted in place by every write.
+NOTIFICATION_UNREAD_CACHE_TIMEOUT = env.int(
+    "NOTIFICATION_UNREAD_CACHE_TIMEOUT", default=60 * 60,
+)
+# Notifications inserted per statement when broadcasting.
+NOTIFICATION_BROADCAST_BATCH_SIZE = env.int(
+    "NOTIFICATION_BROADCAST_BATCH_SIZE", default=1000,
+)
+
+# Customer dashboard
+# Cached dashboard figures; wallet, order and referral signals drop them
+# early.
+DASHBOARD_CACHE_TIMEOUT = env.int("DASHBOARD_CACHE_TIMEOUT", default=60 * 5)
+
+# Roles
+# Cached profile roles per user; creating or deleting a profile drops
+# them early.
+ROLE_CACHE_TIMEOUT = env.int("ROLE_CACHE_TIMEOUT", default=60 * 60 * 24)
+
 # Referral reward settings
 REFERRAL_REWARD_FOR_REFERRER = 500.00
 REFERRAL_REWARD_FOR_REFERRED = 200.00
@@ -19,7 +19,7 @@ ALLOWED_HOSTS = ["localhost", "0.0.0.0", "127.0.0.1"]  # noqa: S104
 # https://docs.djangoproject.com/en/dev/ref/settings/#caches
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "acctmarket.utils.metrics.LocMemCache",
         "LOCATION": "",
     },
 }
@@ -79,3 +79,6 @@ INSTALLED_APPS += ["django_extensions"]
 CELERY_TASK_EAGER_PROPAGATES = True
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Request metrics: headers and a log line on every request.
+REQUEST_METRICS_HEADERS = True
+REQUEST_METRICS_SAMPLE_RATE = 1.0